@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+"""
+Microbenchmarks for the feature flag hot path.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_flag_checks --output before.json
+    # ...make your changes...
+    python -m benchmarks.bench_flag_checks --output after.json --compare before.json
+
+Every benchmark reports the best time per call over several repeats, in seconds. Use --filter to run
+only the benchmarks whose names contain a given string.
+"""
+from __future__ import print_function, with_statement
+
+import atexit
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import timeit
+
+import flask
+from flask import Flask
+from werkzeug.exceptions import NotFound
+
+import flask_featureflags as feature_flags
+
+FEATURE = u'benchmark_feature'
+
+BENCHMARKS = []
+
+
+def benchmark(name, number=10000):
+  """ Register a benchmark. The function sets things up and returns (context manager, callable to time). """
+  def register(func):
+    BENCHMARKS.append((name, number, func))
+    return func
+  return register
+
+
+def make_app(request_cache=False, flags=None, frozen=False, static=None):
+  app = Flask(__name__)
+  app.config[feature_flags.FEATURE_FLAGS_CONFIG] = flags if flags is not None else {FEATURE: True}
+  app.config[feature_flags.CACHE_FEATURES_PER_REQUEST] = request_cache
+  app.config[feature_flags.FREEZE_FEATURE_FLAGS] = frozen
+  app.config[feature_flags.STATIC_FEATURE_FLAGS] = static
+  feature_flagger = feature_flags.FeatureFlag(app)
+  return app, feature_flagger
+
+
+def raising_handler(feature):
+  raise feature_flags.NoFeatureFlagFound()
+
+
+def sentinel_handler(feature):
+  return feature_flags.FEATURE_NOT_FOUND
+
+
+@benchmark('is_active')
+def bench_is_active():
+  app, _ = make_app()
+  return app.test_request_context('/'), lambda: feature_flags.is_active(FEATURE)
+
+
+@benchmark('is_active.request_cache')
+def bench_is_active_cached():
+  app, _ = make_app(request_cache=True)
+  return app.test_request_context('/'), lambda: feature_flags.is_active(FEATURE)
+
+
+@benchmark('is_active.frozen_config')
+def bench_is_active_frozen():
+  app, _ = make_app(frozen=True)
+  return app.test_request_context('/'), lambda: feature_flags.is_active(FEATURE)
+
+
+@benchmark('is_active.instrumented')
+def bench_is_active_instrumented():
+  app, feature_flagger = make_app()
+  feature_flagger.enable_instrumentation()
+  return app.test_request_context('/'), lambda: feature_flags.is_active(FEATURE)
+
+
+@benchmark('is_active.usage_tracking')
+def bench_is_active_usage_tracking():
+  app, feature_flagger = make_app()
+  feature_flagger.enable_usage_tracking()
+  return app.test_request_context('/'), lambda: feature_flags.is_active(FEATURE)
+
+
+@benchmark('is_active.missing')
+def bench_is_active_missing():
+  app, _ = make_app(flags={})
+  return app.test_request_context('/'), lambda: feature_flags.is_active(FEATURE)
+
+
+def _bench_chain(length, extra_handler):
+  app, feature_flagger = make_app()
+  # The feature lives in the last handler, so every handler in front of it has to say "not found"
+  feature_flagger.handlers = [extra_handler] * (length - 1) + [feature_flags.AppConfigFlagHandler]
+  return app.test_request_context('/'), lambda: feature_flagger.check(FEATURE)
+
+
+for _length in (1, 5, 20):
+  benchmark('check.handlers_%d.raising' % _length)(lambda length=_length: _bench_chain(length, raising_handler))
+  benchmark('check.handlers_%d.sentinel' % _length)(lambda length=_length: _bench_chain(length, sentinel_handler))
+
+
+@benchmark('check_many.20_features', number=2000)
+def bench_check_many():
+  features = [u'%s_%d' % (FEATURE, i) for i in range(20)]
+  app, feature_flagger = make_app(flags=dict((feature, True) for feature in features))
+  return app.test_request_context('/'), lambda: feature_flagger.check_many(features)
+
+
+@benchmark('jinja.active_feature_loop_100.frozen_config', number=500)
+def bench_jinja_loop_frozen():
+  app, _ = make_app(frozen=True)
+  template = app.jinja_env.from_string(u"{% for i in range(100) %}{% if name is active_feature %}x{% endif %}{% endfor %}")
+  return app.test_request_context('/'), lambda: template.render(name=FEATURE)
+
+
+def _bench_decorator(flag_value, redirect=None, bound=False):
+  app, feature_flagger = make_app(flags={FEATURE: flag_value})
+
+  @app.route('/target')
+  def target():
+    return u'target'
+
+  decorator = feature_flagger.is_active_feature if bound else feature_flags.is_active_feature
+
+  @decorator(FEATURE, redirect=redirect)
+  def view():
+    return u'OK'
+
+  def call():
+    try:
+      return view()
+    except NotFound:
+      pass
+
+  return app.test_request_context('/'), call
+
+
+@benchmark('is_active_feature.on')
+def bench_decorator_on():
+  return _bench_decorator(True)
+
+
+@benchmark('is_active_feature.off_404')
+def bench_decorator_404():
+  return _bench_decorator(False)
+
+
+@benchmark('is_active_feature.off_redirect')
+def bench_decorator_redirect():
+  return _bench_decorator(False, redirect='target')
+
+
+@benchmark('is_active_feature.off_404.bound')
+def bench_bound_decorator_404():
+  return _bench_decorator(False, bound=True)
+
+
+@benchmark('is_active_feature.off_redirect.bound')
+def bench_bound_decorator_redirect():
+  return _bench_decorator(False, redirect='target', bound=True)
+
+
+@benchmark('view.undecorated')
+def bench_undecorated_view():
+  app, _ = make_app()
+
+  def view():
+    return u'OK'
+
+  return app.test_request_context('/'), view
+
+
+@benchmark('request.gated_off_404', number=1000)
+def bench_full_request_404():
+  app, _ = make_app(flags={FEATURE: False})
+
+  @app.route('/gated')
+  @feature_flags.is_active_feature(FEATURE)
+  def gated():
+    return u'OK'
+
+  client = app.test_client()
+  return app.app_context(), lambda: client.get('/gated')
+
+
+def _bench_slow_view(cache=None):
+  app, _ = make_app()
+
+  @app.route('/slow')
+  @feature_flags.is_active_feature(FEATURE, cache=cache)
+  def slow():
+    return flask.render_template_string(LITERAL_LOOP_100)
+
+  client = app.test_client()
+  return app.app_context(), lambda: client.get('/slow')
+
+
+@benchmark('request.slow_view', number=200)
+def bench_slow_view():
+  return _bench_slow_view()
+
+
+@benchmark('request.slow_view.response_cache', number=200)
+def bench_slow_view_cached():
+  from flask_featureflags.cache import FeatureFlagCache
+  return _bench_slow_view(cache=FeatureFlagCache(ttl=3600))
+
+
+@benchmark('jinja.active_feature_loop_100', number=500)
+def bench_jinja_loop():
+  app, _ = make_app()
+  template = app.jinja_env.from_string(u"{% for i in range(100) %}{% if name is active_feature %}x{% endif %}{% endfor %}")
+  return app.test_request_context('/'), lambda: template.render(name=FEATURE)
+
+
+@benchmark('jinja.active_feature_loop_100.request_cache', number=500)
+def bench_jinja_loop_cached():
+  app, _ = make_app(request_cache=True)
+  template = app.jinja_env.from_string(u"{% for i in range(100) %}{% if name is active_feature %}x{% endif %}{% endfor %}")
+  return app.test_request_context('/'), lambda: template.render(name=FEATURE)
+
+
+# The same loop, with the feature name written into the template, as static flag folding needs
+LITERAL_LOOP_100 = u"{% for i in range(100) %}{% if '" + FEATURE + u"' is active_feature %}x{% endif %}{% endfor %}"
+
+
+@benchmark('jinja.literal_loop_100', number=500)
+def bench_jinja_literal_loop():
+  app, _ = make_app()
+  template = app.jinja_env.from_string(LITERAL_LOOP_100)
+  return app.test_request_context('/'), template.render
+
+
+@benchmark('jinja.literal_loop_100.static', number=500)
+def bench_jinja_literal_loop_static():
+  app, _ = make_app(static=True)
+  template = app.jinja_env.from_string(LITERAL_LOOP_100)
+  return app.test_request_context('/'), template.render
+
+
+@benchmark('jinja.flagcache_loop_100', number=500)
+def bench_jinja_flagcache():
+  app, _ = make_app()
+  template = app.jinja_env.from_string(u"{% flagcache 'loop' using '" + FEATURE + u"' %}" + LITERAL_LOOP_100 + u"{% endflagcache %}")
+  return app.test_request_context('/'), template.render
+
+
+@benchmark('rollout.check')
+def bench_rollout():
+  from flask_featureflags.contrib.rollout import PercentageRolloutFeatureFlag
+
+  app, feature_flagger = make_app(flags={})
+  feature_flagger.handlers = [PercentageRolloutFeatureFlag({FEATURE: 50}, key_func=lambda: 12345)]
+  return app.test_request_context('/'), lambda: feature_flagger.check(FEATURE)
+
+
+@benchmark('rules.check_100k_allowlist')
+def bench_rules():
+  from flask_featureflags.contrib.rules import RulesFeatureFlag
+
+  app, feature_flagger = make_app(flags={})
+  rules = RulesFeatureFlag({FEATURE: [{'groups': ['staff']}, {'user_id': range(100000)}]},
+                           attributes={'user_id': lambda: 99999, 'groups': lambda: ['users']})
+  feature_flagger.handlers = [rules]
+  return app.test_request_context('/'), lambda: feature_flagger.check(FEATURE)
+
+
+@benchmark('shared.check')
+def bench_shared_snapshot():
+  from flask_featureflags.contrib.shared import SharedSnapshotFeatureFlag, SharedSnapshotWriter
+
+  directory = tempfile.mkdtemp()
+  atexit.register(shutil.rmtree, directory, True)
+  path = os.path.join(directory, 'flags')
+  SharedSnapshotWriter(path).write({FEATURE: True})
+
+  app, feature_flagger = make_app(flags={})
+  feature_flagger.handlers = [SharedSnapshotFeatureFlag(path)]
+  return app.test_request_context('/'), lambda: feature_flagger.check(FEATURE)
+
+
+def _bench_sqlalchemy(**handler_kwargs):
+  from flask.ext.sqlalchemy import SQLAlchemy
+  from flask_featureflags.contrib.sqlalchemy import SQLAlchemyFeatureFlags
+
+  app, feature_flagger = make_app(flags={})
+  app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+  app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+  db = SQLAlchemy(app)
+  handler = SQLAlchemyFeatureFlags(db, **handler_kwargs)
+  feature_flagger.handlers = [handler]
+
+  ctx = app.test_request_context('/')
+  with app.app_context():
+    db.create_all()
+    db.session.add(handler.model(feature=FEATURE, is_active=True))
+    db.session.commit()
+
+  return ctx, lambda: feature_flagger.check(FEATURE)
+
+
+@benchmark('sqlalchemy.query', number=1000)
+def bench_sqlalchemy_query():
+  return _bench_sqlalchemy()
+
+
+@benchmark('sqlalchemy.ttl_cache')
+def bench_sqlalchemy_cache():
+  return _bench_sqlalchemy(cache_ttl=60)
+
+
+@benchmark('sqlalchemy.snapshot')
+def bench_sqlalchemy_snapshot():
+  return _bench_sqlalchemy(snapshot=True)
+
+
+def run(names=None, repeat=5, scale=1.0):
+  results = {}
+  for name, number, setup in BENCHMARKS:
+    if names and not any(n in name for n in names):
+      continue
+
+    try:
+      context, func = setup()
+    except ImportError as e:
+      print(u'%-45s skipped (%s)' % (name, e), file=sys.stderr)
+      continue
+
+    number = max(1, int(number * scale))
+    with context:
+      func()  # warm up anything lazy
+      best = min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+    results[name] = {'seconds_per_call': best, 'number': number, 'repeat': repeat}
+    print(u'%-45s %10.3f us' % (name, best * 1e6), file=sys.stderr)
+
+  return {
+    'meta': {
+      'python': platform.python_version(),
+      'implementation': platform.python_implementation(),
+      'flask': getattr(flask, '__version__', None),
+      'flask_featureflags': feature_flags.__version__,
+    },
+    'results': results,
+  }
+
+
+def compare(current, baseline):
+  """ Print how each benchmark moved relative to an earlier run. Positive numbers are slowdowns. """
+  print(u'\n%-45s %12s %12s %9s' % (u'benchmark', u'before (us)', u'after (us)', u'change'))
+  for name, result in sorted(current['results'].items()):
+    before = baseline['results'].get(name)
+    if not before:
+      continue
+    old, new = before['seconds_per_call'], result['seconds_per_call']
+    print(u'%-45s %12.3f %12.3f %+8.1f%%' % (name, old * 1e6, new * 1e6, (new - old) / old * 100))
+
+
+def main(argv=None):
+  # Imported here so the tests can import this module on python 2.6, which doesn't have argparse
+  import argparse
+
+  parser = argparse.ArgumentParser(description=u'Benchmark the feature flag hot path.')
+  parser.add_argument('--output', help=u'write results to this JSON file (default: stdout)')
+  parser.add_argument('--compare', help=u'JSON file from an earlier run to compare against')
+  parser.add_argument('--filter', action='append', help=u'only run benchmarks whose name contains this')
+  parser.add_argument('--repeat', type=int, default=5)
+  parser.add_argument('--scale', type=float, default=1.0, help=u'multiply the number of calls per benchmark')
+  args = parser.parse_args(argv)
+
+  results = run(args.filter, repeat=args.repeat, scale=args.scale)
+
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump(results, f, indent=2, sort_keys=True)
+  else:
+    json.dump(results, sys.stdout, indent=2, sort_keys=True)
+    print()
+
+  if args.compare:
+    with open(args.compare) as f:
+      compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+  main()
@@ -14,22 +14,62 @@ See the License for the specific language governing permissions and
    limitations under the License.
 """
 
+from bisect import bisect_left
 from functools import wraps
+import hashlib
+import inspect
 import logging
+import threading
+import weakref
 
-from flask import abort, current_app, url_for
+from flask import abort, current_app, g, has_request_context, make_response, request, url_for
 from flask import redirect as _redirect
 from flask.signals import Namespace
 
+from flask_featureflags.cache import MISSING, _frozen_dict, _timer
+from flask_featureflags.usage import UsageTracker
+
+try:
+  from flask import _request_ctx_stack
+except ImportError:  # flask 2.3+ keeps its contexts in contextvars instead
+  _request_ctx_stack = None
+  import contextvars
+
+try:
+  from flask import _app_ctx_stack
+except ImportError:  # flask < 0.9 has no app context, flask 2.3+ keeps it in a contextvar
+  _app_ctx_stack = None
+
+try:
+  from concurrent.futures import ThreadPoolExecutor, TimeoutError as _FutureTimeoutError
+except ImportError:  # python 2 needs the "futures" backport for concurrent checks
+  ThreadPoolExecutor = None
+  _FutureTimeoutError = None
+
 __version__ = '0.7-dev'
 
 log = logging.getLogger(u'flask-featureflags')
 
 RAISE_ERROR_ON_MISSING_FEATURES = u'RAISE_ERROR_ON_MISSING_FEATURES'
 FEATURE_FLAGS_CONFIG = u'FEATURE_FLAGS'
+CACHE_FEATURES_PER_REQUEST = u'CACHE_FEATURES_PER_REQUEST'
+FREEZE_FEATURE_FLAGS = u'FREEZE_FEATURE_FLAGS'
+CHECK_FEATURES_CONCURRENTLY = u'CHECK_FEATURES_CONCURRENTLY'
+FEATURE_CHECK_TIMEOUT = u'FEATURE_CHECK_TIMEOUT'
+INSTRUMENT_FEATURE_FLAGS = u'INSTRUMENT_FEATURE_FLAGS'
+TRACK_FEATURE_USAGE = u'TRACK_FEATURE_USAGE'
+MISSING_FEATURE_REPORT_INTERVAL = u'MISSING_FEATURE_REPORT_INTERVAL'
+STATIC_FEATURE_FLAGS = u'STATIC_FEATURE_FLAGS'
+FRAGMENT_CACHE_SIZE = u'FRAGMENT_CACHE_SIZE'
 
 EXTENSION_NAME = "FeatureFlags"
 
+# Where we stash the per-request results of FeatureFlag.check on flask.g
+_REQUEST_CACHE_ATTR = '_feature_flags_cache'
+
+# Size of the thread pool shared by every FeatureFlag that checks independent handlers concurrently
+CONCURRENT_CHECK_THREADS = 16
+
 
 class StopCheckingFeatureFlags(Exception):
   """ Raise this inside of a feature flag handler to immediately return False and stop any further handers from running """
@@ -41,9 +81,55 @@ class NoFeatureFlagFound(Exception):
   pass
 
 
+class _Sentinel(object):
+  """ A named marker value. Sentinels are falsy, so a handler returning one to old code reads as "off". """
+
+  def __init__(self, name):
+    self.name = name
+
+  def __repr__(self):
+    return self.name
+
+  def __bool__(self):
+    return False
+  __nonzero__ = __bool__
+
+
+# Handlers can return these instead of raising the exceptions above, which is a lot cheaper when it happens on every check
+FEATURE_NOT_FOUND = _Sentinel('FEATURE_NOT_FOUND')
+STOP_CHECKING = _Sentinel('STOP_CHECKING')
+
+
+class LookupFlagHandler(object):
+  """ Base class for handlers that answer through a ``lookup(feature)`` method returning FEATURE_NOT_FOUND instead of
+  raising. Calling the handler directly still raises NoFeatureFlagFound, as handlers always have. """
+
+  def __call__(self, feature=None):
+    result = self.lookup(feature)
+    if result is FEATURE_NOT_FOUND:
+      raise NoFeatureFlagFound()
+    return result
+
+
 _ns = Namespace()
 missing_feature = _ns.signal('missing-feature')
 
+# Sent when we hear that a feature changed (feature is None if they all might have), after handler caches are dropped
+flag_changed = _ns.signal('flag-changed')
+
+# Sent after every handler call while instrumentation is on, with handler, feature, outcome and duration (in seconds)
+handler_checked = _ns.signal('handler-checked')
+
+# What a handler can say about a feature, as recorded by the instrumentation
+OUTCOME_TRUE = u'true'
+OUTCOME_FALSE = u'false'
+OUTCOME_NOT_FOUND = u'not_found'
+OUTCOME_STOP = u'stop'
+OUTCOME_ERROR = u'error'
+
+# How many different missing features to count (and rate limit) at most, in case the names come from user input
+_MAX_MISSING_FEATURES = 1000
+
 
 def AppConfigFlagHandler(feature=None):
   """ This is the default handler. It checks for feature flags in the current app's configuration.
@@ -66,14 +152,368 @@ def AppConfigFlagHandler(feature=None):
     }
 
    """
+  result = _app_config_lookup(feature)
+  if result is FEATURE_NOT_FOUND:
+    raise NoFeatureFlagFound()
+  return result
+
+
+def _app_config_lookup(feature):
+  """ AppConfigFlagHandler, but returning FEATURE_NOT_FOUND instead of raising. This is what FeatureFlag.check calls. """
   if not current_app:
-    log.warn(u"Got a request to check for {feature} but we're outside the request context. Returning False".format(feature=feature))
+    log.warning(u"Got a request to check for %s but we're outside the request context. Returning False", feature)
     return False
 
   try:
-    return current_app.config[FEATURE_FLAGS_CONFIG][feature]
+    return current_app.config[FEATURE_FLAGS_CONFIG].get(feature, FEATURE_NOT_FOUND)
   except (AttributeError, KeyError):
-    raise NoFeatureFlagFound()
+    return FEATURE_NOT_FOUND
+
+
+def _app_config_check_many(features):
+  """ Batch version of AppConfigFlagHandler: one pass over the config for all the features. """
+  if not current_app:
+    log.warning(u"Got a request to check for %s but we're outside the request context. Returning False", features)
+    return dict((feature, False) for feature in features)
+
+  try:
+    flags = current_app.config[FEATURE_FLAGS_CONFIG]
+  except (AttributeError, KeyError):
+    return {}
+
+  return dict((feature, flags[feature]) for feature in features if feature in flags)
+
+AppConfigFlagHandler.lookup = _app_config_lookup
+AppConfigFlagHandler.check_many = _app_config_check_many
+AppConfigFlagHandler.blocking = False
+
+
+def _defined_on(cls, name):
+  """ The class in ``cls``'s MRO that defines ``name``, or None. """
+  for klass in getattr(cls, '__mro__', ()):
+    if name in vars(klass):
+      return klass
+  return None
+
+
+def _handler_methods(handler):
+  """ (lookup, check_many) for a handler in the chain.
+
+  ``lookup`` and ``check_many`` are only used if a subclass hasn't overridden ``__call__`` below where they're
+  defined: a subclass of a built-in handler that customises ``__call__`` expects to be called. """
+  lookup = getattr(handler, 'lookup', None)
+  check_many = getattr(handler, 'check_many', None)
+
+  cls = type(handler)
+  call_owner = _defined_on(cls, '__call__')
+  if call_owner is not None:
+    for name in ('lookup', 'check_many'):
+      owner = _defined_on(cls, name)
+      if owner is not None and owner is not call_owner and issubclass(call_owner, owner):
+        # __call__ was overridden more recently than this method, so it wins
+        if name == 'lookup':
+          lookup = None
+        else:
+          check_many = None
+
+  return (lookup if lookup is not None else handler), check_many
+
+
+def _is_coroutine_lookup(lookup):
+  """ True for ``async def`` functions, and objects with an ``async def __call__``. """
+  return _iscoroutinefunction(lookup) or _iscoroutinefunction(getattr(lookup, '__call__', None))
+
+
+def _not_found(feature):
+  """ Stands in for async handlers in synchronous checks. """
+  return FEATURE_NOT_FOUND
+
+
+def _compile_handlers(lookups):
+  """ Turn a chain of handler lookups into a single function that takes a feature and returns (is_active, was_found).
+
+  Lookups may raise the exceptions or return the sentinels, whichever they like. """
+  lookups = tuple(lookups)
+
+  if not lookups:
+    def dispatch(feature):
+      return False, False
+    return dispatch
+
+  def dispatch(feature):
+    found = False
+    for lookup in lookups:
+      try:
+        result = lookup(feature)
+      except NoFeatureFlagFound:
+        continue
+      except StopCheckingFeatureFlags:
+        return False, True
+
+      if result is FEATURE_NOT_FOUND:
+        continue
+      elif result is STOP_CHECKING:
+        return False, True
+      elif result:
+        return True, True
+      found = True
+
+    return False, found
+  return dispatch
+
+
+def _compile_concurrent_handlers(lookups, independent, get_executor, timeout=None):
+  """ Like _compile_handlers, but the lookups flagged in ``independent`` are all started on a thread pool at the
+  start of each check, so slow handlers wait at the same time instead of one after another.
+
+  Answers are still read in chain order, so the first True wins and stopping still stops. A handler that hasn't
+  answered ``timeout`` seconds after the check started is treated as not knowing about the feature. """
+  lookups = tuple(lookups)
+  independent = frozenset(independent)
+
+  def dispatch(feature):
+    executor = get_executor()
+    futures = {}
+    for i in independent:
+      futures[i] = executor.submit(_in_current_context(lookups[i]), feature)
+
+    deadline = _timer() + timeout if timeout is not None else None
+    found = False
+    try:
+      for i, lookup in enumerate(lookups):
+        try:
+          if i in futures:
+            remaining = max(0, deadline - _timer()) if deadline is not None else None
+            try:
+              result = futures[i].result(remaining)
+            except _FutureTimeoutError:
+              log.warning(u"Feature flag handler %r took longer than %ss to check %s, skipping it", lookup, timeout, feature)
+              continue
+          else:
+            result = lookup(feature)
+        except NoFeatureFlagFound:
+          continue
+        except StopCheckingFeatureFlags:
+          return False, True
+
+        if result is FEATURE_NOT_FOUND:
+          continue
+        elif result is STOP_CHECKING:
+          return False, True
+        elif result:
+          return True, True
+        found = True
+
+      return False, found
+    finally:
+      for future in futures.values():
+        future.cancel()
+
+  return dispatch
+
+
+def _outcome(result):
+  if result is FEATURE_NOT_FOUND:
+    return OUTCOME_NOT_FOUND
+  elif result is STOP_CHECKING:
+    return OUTCOME_STOP
+  elif result:
+    return OUTCOME_TRUE
+  return OUTCOME_FALSE
+
+
+class HandlerStats(object):
+  """ How often a handler has been called, how long it took, and what it said. """
+
+  # Upper bounds of the latency histogram buckets, in seconds. Anything slower goes in the last bucket.
+  BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+  def __init__(self, handler):
+    self.handler = handler
+    self._lock = threading.Lock()
+    self.reset()
+
+  @property
+  def name(self):
+    return getattr(self.handler, '__name__', None) or type(self.handler).__name__
+
+  def reset(self):
+    with self._lock:
+      self.calls = 0
+      self.total_seconds = 0.0
+      self.histogram = [0] * (len(self.BUCKETS) + 1)
+      self.outcomes = dict.fromkeys((OUTCOME_TRUE, OUTCOME_FALSE, OUTCOME_NOT_FOUND, OUTCOME_STOP, OUTCOME_ERROR), 0)
+
+  def record(self, duration, outcome):
+    with self._lock:
+      self.calls += 1
+      self.total_seconds += duration
+      self.histogram[bisect_left(self.BUCKETS, duration)] += 1
+      self.outcomes[outcome] += 1
+
+  def record_batch(self, duration, outcomes):
+    """ One call that answered for several features at once. """
+    with self._lock:
+      self.calls += 1
+      self.total_seconds += duration
+      self.histogram[bisect_left(self.BUCKETS, duration)] += 1
+      for outcome in outcomes:
+        self.outcomes[outcome] += 1
+
+  def snapshot(self):
+    with self._lock:
+      return {
+        'handler': self.name,
+        'calls': self.calls,
+        'total_seconds': self.total_seconds,
+        'mean_seconds': self.total_seconds / self.calls if self.calls else None,
+        'histogram': list(zip(self.BUCKETS + (None,), self.histogram)),
+        'outcomes': dict(self.outcomes),
+      }
+
+
+def _instrument_lookup(lookup, stats, sender):
+  """ Wrap a handler's lookup so every call is timed and counted in ``stats``, and announced on handler_checked. """
+  handler = stats.handler
+
+  def timed_lookup(feature):
+    outcome = OUTCOME_ERROR
+    started = _timer()
+    try:
+      result = lookup(feature)
+      outcome = _outcome(result)
+      return result
+    except NoFeatureFlagFound:
+      outcome = OUTCOME_NOT_FOUND
+      raise
+    except StopCheckingFeatureFlags:
+      outcome = OUTCOME_STOP
+      raise
+    finally:
+      duration = _timer() - started
+      stats.record(duration, outcome)
+      if getattr(handler_checked, 'receivers', None):
+        handler_checked.send(sender, handler=handler, feature=feature, outcome=outcome, duration=duration)
+  return timed_lookup
+
+
+def _instrument_check_many(check_many, stats, sender):
+  """ Same as _instrument_lookup, for batch lookups. A batch counts as one call; every answer counts as an outcome, and a
+  batch that raises counts as a stop (or an error) for every feature in it. """
+  handler = stats.handler
+
+  def timed_check_many(features):
+    failure = OUTCOME_ERROR
+    started = _timer()
+    try:
+      answers = check_many(features)
+      failure = None
+      return answers
+    except StopCheckingFeatureFlags:
+      failure = OUTCOME_STOP
+      raise
+    finally:
+      duration = _timer() - started
+      if failure is None:
+        outcomes = [_outcome(answers.get(feature, FEATURE_NOT_FOUND)) for feature in features]
+      else:
+        outcomes = [failure] * len(features)
+      stats.record_batch(duration, outcomes)
+
+      if getattr(handler_checked, 'receivers', None):
+        for feature, outcome in zip(features, outcomes):
+          handler_checked.send(sender, handler=handler, feature=feature, outcome=outcome, duration=duration)
+  return timed_check_many
+
+
+def _in_current_context(func):
+  """ Wrap a function so it sees the current request (or app) context when it's called from another thread.
+
+  The caller's contexts are lent to the worker as they are rather than pushed again: popping a copy would run the
+  app's teardown_request and teardown_appcontext callbacks in the middle of the request. """
+  if _request_ctx_stack is None:
+    context = contextvars.copy_context()
+
+    @wraps(func)
+    def run_in_copied_context(*args, **kwargs):
+      return context.run(func, *args, **kwargs)
+    return run_in_copied_context
+
+  request_ctx = _request_ctx_stack.top
+  app_ctx = _app_ctx_stack.top if _app_ctx_stack is not None else None
+  if request_ctx is None and app_ctx is None:
+    return func
+
+  @wraps(func)
+  def run_in_context(*args, **kwargs):
+    if app_ctx is not None:
+      _app_ctx_stack.push(app_ctx)
+    if request_ctx is not None:
+      _request_ctx_stack.push(request_ctx)
+    try:
+      return func(*args, **kwargs)
+    finally:
+      if request_ctx is not None:
+        _request_ctx_stack.pop()
+      if app_ctx is not None:
+        _app_ctx_stack.pop()
+  return run_in_context
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _shared_executor():
+  """ The thread pool for concurrent checks, started the first time somebody needs it. """
+  global _executor
+  if _executor is None:
+    with _executor_lock:
+      if _executor is None:
+        if ThreadPoolExecutor is None:
+          raise RuntimeError(u"Checking features concurrently needs concurrent.futures. On python 2, pip install futures.")
+        _executor = ThreadPoolExecutor(max_workers=CONCURRENT_CHECK_THREADS)
+  return _executor
+
+
+def _recompiling(name):
+  method = getattr(list, name)
+
+  def mutate(self, *args):
+    result = method(self, *args)
+    self._changed()
+    return result
+  mutate.__name__ = name
+  return mutate
+
+
+class _HandlerList(list):
+  """ FeatureFlag.handlers: a list that recompiles the chain whenever it's changed in place, so code that appends
+  or inserts handlers directly keeps working. """
+
+  def __init__(self, handlers, changed):
+    list.__init__(self, handlers)
+    self._changed = changed
+
+  def __iadd__(self, other):
+    self.extend(other)
+    return self
+
+  append = _recompiling('append')
+  extend = _recompiling('extend')
+  insert = _recompiling('insert')
+  remove = _recompiling('remove')
+  pop = _recompiling('pop')
+  sort = _recompiling('sort')
+  reverse = _recompiling('reverse')
+  __setitem__ = _recompiling('__setitem__')
+  __delitem__ = _recompiling('__delitem__')
+
+  if hasattr(list, 'clear'):  # python 3
+    clear = _recompiling('clear')
+  if hasattr(list, '__setslice__'):  # python 2 slices don't go through __setitem__
+    __setslice__ = _recompiling('__setslice__')
+    __delslice__ = _recompiling('__delslice__')
 
 
 class FeatureFlag(object):
@@ -81,17 +521,73 @@ class FeatureFlag(object):
   JINJA_TEST_NAME = u'active_feature'
 
   def __init__(self, app=None):
-    if app is not None:
-      self.init_app(app)
+    # Bumped whenever we hear that flags changed; see the version property
+    self._version = 0
+    self._version_lock = threading.Lock()
+    # Handlers whose ChangeNotifier we're listening to, by id
+    self._listening = {}
+
+    # Frozen copies of each app's FEATURE_FLAGS, if FREEZE_FEATURE_FLAGS is on
+    self._config_tables = {}
+    self._app_count = 0
+
+    # Set from CHECK_FEATURES_CONCURRENTLY and FEATURE_CHECK_TIMEOUT by init_app
+    self._concurrent = False
+    self._timeout = None
+
+    # The thread pool for concurrent checks. Leave it as None to share one between every FeatureFlag.
+    self.executor = None
+
+    # Per-handler stats, while instrumentation is on
+    self._instrumented = False
+    self._handler_stats = {}
+
+    # A UsageTracker counting checks per feature, if TRACK_FEATURE_USAGE is on
+    self.usage = None
+
+    # How often each missing feature has been checked, and when (and at what count) we last logged and signalled it
+    self._report_interval = None
+    self._missing_lock = threading.Lock()
+    self._missing_counts = {}
+    self._missing_reported = {}
+
+    # An InvalidationBus telling us about changes made by other processes, once connect_bus is called
+    self.bus = None
+
+    # Template fragments rendered by {% flagcache %}, made by init_app
+    self.fragments = None
 
     # The default out-of-the-box handler looks up features in Flask's app config.
     self.handlers = [AppConfigFlagHandler]
 
+    if app is not None:
+      self.init_app(app)
+
+  @property
+  def handlers(self):
+    """ The chain of handlers. You can change it in place, assign a new list, or use add_handler, remove_handler and
+    clear_handlers; the chain is recompiled after each change. """
+    return self._handlers
+
+  @handlers.setter
+  def handlers(self, handlers):
+    self._handlers = _HandlerList(handlers, self._recompile)
+    self._recompile()
+
   def init_app(self, app):
     """ Add ourselves into the app config and setup, and add a jinja function test """
 
     app.config.setdefault(FEATURE_FLAGS_CONFIG, {})
     app.config.setdefault(RAISE_ERROR_ON_MISSING_FEATURES, False)
+    app.config.setdefault(CACHE_FEATURES_PER_REQUEST, True)
+    app.config.setdefault(FREEZE_FEATURE_FLAGS, False)
+    app.config.setdefault(CHECK_FEATURES_CONCURRENTLY, False)
+    app.config.setdefault(FEATURE_CHECK_TIMEOUT, None)
+    app.config.setdefault(INSTRUMENT_FEATURE_FLAGS, False)
+    app.config.setdefault(TRACK_FEATURE_USAGE, False)
+    app.config.setdefault(MISSING_FEATURE_REPORT_INTERVAL, None)
+    app.config.setdefault(STATIC_FEATURE_FLAGS, None)
+    app.config.setdefault(FRAGMENT_CACHE_SIZE, 256)
 
     if hasattr(app, "add_template_test"):
       # flask 0.10 and higher has a proper hook
@@ -99,52 +595,454 @@ class FeatureFlag(object):
     else:
       app.jinja_env.tests[self.JINJA_TEST_NAME] = self.check
 
+    # Keep jinja from running checks while it compiles templates, and fold static flags into constants instead
+    from flask_featureflags.templating import CHECK_FILTER, FeatureFlagsExtension, FragmentCache, FragmentCacheExtension, check_filter
+    app.jinja_env.filters[CHECK_FILTER] = check_filter(self.check)
+    app.jinja_env.add_extension(FeatureFlagsExtension)
+
+    # Cache template fragments on the state of the flags they depend on
+    if self.fragments is None:
+      self.fragments = FragmentCache(maxsize=app.config[FRAGMENT_CACHE_SIZE])
+    app.jinja_env.add_extension(FragmentCacheExtension)
+
+    # g outlives the request on flask 0.10 and up, so drop the cache when the request ends
+    app.teardown_request(self._teardown_request_cache)
+
     if not hasattr(app, 'extensions'):
       app.extensions = {}
     app.extensions[EXTENSION_NAME] = self
 
+    self._app_count += 1
+    self._concurrent = app.config[CHECK_FEATURES_CONCURRENTLY]
+    self._timeout = app.config[FEATURE_CHECK_TIMEOUT]
+    self._instrumented = self._instrumented or app.config[INSTRUMENT_FEATURE_FLAGS]
+    self._report_interval = app.config[MISSING_FEATURE_REPORT_INTERVAL]
+    if app.config[TRACK_FEATURE_USAGE]:
+      self.enable_usage_tracking()
+
+    if app.config[FREEZE_FEATURE_FLAGS]:
+      self.reload_config(app)
+    else:
+      self._recompile()
+
+  def reload_config(self, app=None):
+    """ Take a fresh frozen copy of FEATURE_FLAGS for the given app (or the current one).
+
+    With FREEZE_FEATURE_FLAGS on, the default handler answers from a read-only copy of the config made at init_app
+    time instead of reading app.config on every check. Call this after changing FEATURE_FLAGS to pick up the changes.
+
+    This also drops cached template fragments, and with STATIC_FEATURE_FLAGS on, throws away compiled templates so
+    they're compiled with the new values. """
+    if app is None:
+      app = current_app._get_current_object()
+
+    if app.config.get(FREEZE_FEATURE_FLAGS) or app in self._config_tables:
+      flags = app.config.get(FEATURE_FLAGS_CONFIG) or {}
+      self._config_tables[app] = _frozen_dict(dict((feature, bool(value)) for feature, value in flags.items()))
+
+    if app.config.get(STATIC_FEATURE_FLAGS) and getattr(app.jinja_env, 'cache', None) is not None:
+      app.jinja_env.cache.clear()
+    if self.fragments is not None:
+      self.fragments.invalidate()
+
+    # _recompile bumps the version
+    self._recompile()
+
   def clear_handlers(self):
     """ Clear all handlers. This effectively turns every feature off."""
     self.handlers = []
 
   def add_handler(self, function):
     """ Add a new handler to the end of the chain of handlers. """
-    self.handlers.append(function)
+    self._handlers.append(function)
 
   def remove_handler(self, function):
     """ Remove a handler from the chain of handlers.  """
     try:
-      self.handlers.remove(function)
+      self._handlers.remove(function)
     except ValueError:  # handler wasn't in the list, pretend we don't notice
       pass
 
+  def invalidate(self, feature=None):
+    """ Forget the cached result for a feature for the rest of this request, so the next check runs the handlers again.
+
+    If no feature is given, the whole request cache is dropped. """
+    cache = self._request_cache(create=False)
+    if cache is None:
+      return
+
+    if feature is None:
+      cache.clear()
+    else:
+      cache.pop(feature, None)
+
+  def notify_changed(self, feature=None):
+    """ Call this after changing a flag (or, with no feature, any number of them) in one of the handlers' stores.
+
+    Every handler with an ``invalidate`` method drops what it had cached, here and, if a bus is connected, in every
+    other process listening on it. The result cached for this request is dropped too. """
+    self.invalidate(feature)
+    if self.bus is not None:
+      self.bus.publish(feature)
+    else:
+      self._flag_changed(feature)
+
+  def connect_bus(self, bus):
+    """ Listen for changes on an InvalidationBus, and announce ours on it. See flask_featureflags.bus. """
+    if self.bus is not None:
+      self.bus.unsubscribe(self._flag_changed)
+    self.bus = bus
+    bus.subscribe(self._flag_changed)
+
+  @property
+  def version(self):
+    """ A number that goes up every time the flags might have changed, so you can key caches on it.
+
+    It's bumped when the handler chain changes, when reload_config or notify_changed is called (here, or in
+    another process on the same bus), and when a handler with a ``changes`` ChangeNotifier reports a change.
+    Changes to an unfrozen FEATURE_FLAGS config can't be seen, so they don't bump it. """
+    return self._version
+
+  def _bump_version(self):
+    with self._version_lock:
+      self._version += 1
+
+  def _flag_changed(self, feature):
+    """ We've been told a flag changed: make every handler forget it, then tell everyone else. """
+    for handler in self._handlers:
+      invalidate = getattr(handler, 'invalidate', None)
+      if invalidate is not None:
+        invalidate(feature)
+    self._handler_changed(feature)
+
+  def _handler_changed(self, feature):
+    """ A handler noticed a change by itself, so it already knows. """
+    self._bump_version()
+    if self.fragments is not None:
+      self.fragments.invalidate(feature)
+    flag_changed.send(self, feature=feature)
+
   def check(self, feature):
     """ Loop through all our feature flag checkers and return true if any of them are true.
 
     The order of handlers matters - we will immediately return True if any handler returns true.
 
-    If you want to a handler to return False and stop the chain, raise the StopCheckingFeatureFlags exception."""
-    found = False
-    for handler in self.handlers:
-      try:
-        if handler(feature):
-           return True
-      except StopCheckingFeatureFlags:
-        return False
-      except NoFeatureFlagFound:
-        pass
-      else:
-        found = True
+    If you want to a handler to return False and stop the chain, raise the StopCheckingFeatureFlags exception
+    (or return STOP_CHECKING). If it doesn't know about the feature, raise NoFeatureFlagFound (or return FEATURE_NOT_FOUND).
+
+    Results are remembered for the rest of the request (or app context), unless CACHE_FEATURES_PER_REQUEST is off."""
+    cache = self._request_cache()
+    if cache is not None and feature in cache:
+      result = cache[feature]
+    else:
+      result = self._check_handlers(feature)
+      if cache is not None:
+        cache[feature] = result
+
+    if self.usage is not None:
+      self.usage.record(feature, result)
+    return result
+
+  def _check_handlers(self, feature):
+    """ Run the chain of handlers for a single feature, without looking at the request cache. """
+    result, found = self._dispatch(feature)
 
     if not found:
-      message = u"No feature flag defined for {feature}".format(feature=feature)
-      if current_app.debug and current_app.config.get(RAISE_ERROR_ON_MISSING_FEATURES, False):
-        raise KeyError(message)
+      self._missing_feature(feature)
+
+    return result
+
+  def check_async(self, feature):
+    """ Coroutine version of check(), for async views. Handlers can be coroutines, and regular handlers are run
+    in a thread pool so they don't block the event loop. Needs Python 3.5+. See flask_featureflags.aio. """
+    from flask_featureflags.aio import check_async
+    return check_async(self, feature)
+
+  def enable_usage_tracking(self):
+    """ Start counting checks per feature. Returns the UsageTracker, which is also at ``self.usage``. """
+    if self.usage is None:
+      self.usage = UsageTracker()
+    return self.usage
+
+  def disable_usage_tracking(self):
+    """ Stop counting checks. Returns the old tracker, so you can read its last counts. """
+    usage, self.usage = self.usage, None
+    if usage is not None:
+      usage.stop_flusher()
+    return usage
+
+  def enable_instrumentation(self):
+    """ Start timing and counting every handler call. See handler_stats() and the handler_checked signal. """
+    self._instrumented = True
+    self._recompile()
+
+  def disable_instrumentation(self):
+    """ Stop timing handlers. The stats collected so far are kept. """
+    self._instrumented = False
+    self._recompile()
+
+  def handler_stats(self):
+    """ Stats for each handler in the chain, in chain order: calls, total and mean seconds, a latency histogram
+    as (upper bound in seconds, count) pairs, and counts of each outcome. """
+    return [self._handler_stats[id(handler)].snapshot() for handler in self._handlers if id(handler) in self._handler_stats]
+
+  def reset_handler_stats(self):
+    for stats in self._handler_stats.values():
+      stats.reset()
+
+  def missing_features(self):
+    """ {feature: number of checks} for every feature no handler knew about, whether or not it was reported.
+
+    Only counted with MISSING_FEATURE_REPORT_INTERVAL set, and for at most the first _MAX_MISSING_FEATURES names. """
+    with self._missing_lock:
+      return dict(self._missing_counts)
+
+  def reset_missing_features(self):
+    with self._missing_lock:
+      self._missing_counts.clear()
+      self._missing_reported.clear()
+
+  def _recompile(self):
+    """ The chain changed: rebuild the dispatcher, and forget anything we worked out with the old one. """
+    chain = []
+    for handler in self._handlers:
+      if handler is AppConfigFlagHandler and self._config_tables:
+        lookup, check_many = self._frozen_config_handler()
       else:
-        log.info(message)
-        missing_feature.send(self, feature=feature)
+        lookup, check_many = _handler_methods(handler)
 
-    return False
+      if _is_coroutine_lookup(lookup):
+        # Calling it here would just make a coroutine, which is truthy; only async checks can wait for the answer
+        log.warning(u"Feature flag handler %r is async, so it's skipped by synchronous checks. "
+                    u"Use is_active_async (or async views) to check with it.", handler)
+        lookup, check_many = _not_found, None
+
+      if self._instrumented:
+        # Keep the stats for handlers that are still around, so changing the chain doesn't lose them
+        stats = self._handler_stats.get(id(handler))
+        if stats is None or stats.handler is not handler:
+          stats = self._handler_stats[id(handler)] = HandlerStats(handler)
+        lookup = _instrument_lookup(lookup, stats, self)
+        if check_many is not None:
+          check_many = _instrument_check_many(check_many, stats, self)
+
+      chain.append((lookup, check_many))
+
+    self._chain = chain
+    lookups = [lookup for lookup, check_many in chain]
+    self._listen_to_handlers()
+
+    # Handlers marked as independent don't care what ran before them, so they can all run at once
+    independent = [i for i, handler in enumerate(self._handlers) if getattr(handler, 'independent', False)]
+    if self._concurrent and independent and len(lookups) > 1:
+      self._dispatch = _compile_concurrent_handlers(lookups, independent, self._get_executor, self._timeout)
+    else:
+      self._dispatch = _compile_handlers(lookups)
+
+    self._bump_version()
+    self.invalidate()
+
+  def _listen_to_handlers(self):
+    """ Listen for changes from handlers in the chain that can report them, and stop listening to ones that left. """
+    current = dict((id(handler), handler) for handler in self._handlers if getattr(handler, 'changes', None) is not None)
+
+    for key, handler in list(self._listening.items()):
+      if current.get(key) is not handler:
+        handler.changes.remove_listener(self._handler_changed)
+        del self._listening[key]
+
+    for key, handler in current.items():
+      if key not in self._listening:
+        handler.changes.add_listener(self._handler_changed)
+        self._listening[key] = handler
+
+  def _get_executor(self):
+    return self.executor or _shared_executor()
+
+  def _frozen_config_handler(self):
+    """ Build (lookup, check_many) functions that read the frozen config tables instead of app.config. """
+    tables = self._config_tables
+
+    if self._app_count == 1:
+      # Nearly everyone has just the one app, so we can skip finding out which app is current
+      table = list(tables.values())[0]
+
+      def get_table():
+        return table
+    else:
+      def get_table():
+        return tables.get(current_app._get_current_object())
+
+    def lookup(feature):
+      table = get_table()
+      if table is None:  # this app isn't frozen
+        return _app_config_lookup(feature)
+      return table.get(feature, FEATURE_NOT_FOUND)
+
+    def check_many(features):
+      table = get_table()
+      if table is None:
+        return _app_config_check_many(features)
+      return dict((feature, table[feature]) for feature in features if feature in table)
+
+    return lookup, check_many
+
+  def check_many(self, features):
+    """ Check several features at once, and return a {feature: True/False} dict.
+
+    This gives the same answers as calling check() for each feature, but handlers with a ``check_many``
+    attribute get asked about all the features in one go. A batch handler takes a list of features and
+    returns a dict of the ones it knows about (values may be STOP_CHECKING); it can raise StopCheckingFeatureFlags
+    to turn off every feature it was asked about. Handlers without one are called once per feature. """
+    results = {}
+    pending = []
+
+    cache = self._request_cache()
+    for feature in features:
+      if feature in results:
+        continue
+      if cache is not None and feature in cache:
+        results[feature] = cache[feature]
+      else:
+        results[feature] = False
+        pending.append(feature)
+
+    if pending:
+      checked = self._check_handlers_many(pending)
+      results.update(checked)
+      if cache is not None:
+        cache.update(checked)
+
+    usage = self.usage
+    if usage is not None:
+      for feature, result in results.items():
+        usage.record(feature, result)
+
+    return results
+
+  def is_active_feature(self, feature, redirect_to=None, redirect=None, flags=(), etag=False, vary=(), cache=None):
+    """ The is_active_feature decorator, bound to this FeatureFlag: views it wraps check with it directly, rather
+    than looking up the current app's extension on every request.
+
+      feature_flags = FeatureFlag(app)
+
+      @feature_flags.is_active_feature('new_dashboard', redirect='index')
+      def dashboard():
+        ...
+    """
+    return _feature_decorator(self, feature, redirect_to, redirect, flags, etag, vary, cache)
+
+  def _check_handlers_many(self, features):
+    """ Run the chain of handlers for a list of features, batching where the handlers let us. """
+    results = dict((feature, False) for feature in features)
+    found = set()
+    pending = features
+
+    for lookup, check_many in self._chain:
+      if not pending:
+        break
+
+      remaining = []
+
+      if check_many is not None:
+        try:
+          answers = check_many(pending)
+        except StopCheckingFeatureFlags:
+          return results
+
+        for feature in pending:
+          answer = answers.get(feature, FEATURE_NOT_FOUND)
+          if answer is FEATURE_NOT_FOUND:
+            remaining.append(feature)
+          elif answer is STOP_CHECKING:
+            continue
+          elif answer:
+            results[feature] = True
+          else:
+            found.add(feature)
+            remaining.append(feature)
+
+      else:
+        for feature in pending:
+          try:
+            answer = lookup(feature)
+          except StopCheckingFeatureFlags:
+            continue
+          except NoFeatureFlagFound:
+            remaining.append(feature)
+            continue
+
+          if answer is FEATURE_NOT_FOUND:
+            remaining.append(feature)
+          elif answer is STOP_CHECKING:
+            continue
+          elif answer:
+            results[feature] = True
+          else:
+            found.add(feature)
+            remaining.append(feature)
+
+      pending = remaining
+
+    for feature in pending:
+      if feature not in found:
+        self._missing_feature(feature)
+
+    return results
+
+  def _missing_feature(self, feature):
+    """ Nobody knew about this feature: complain loudly in dev if we're asked to, otherwise log and signal.
+
+    With MISSING_FEATURE_REPORT_INTERVAL set, each feature is only logged and signalled once per that many seconds;
+    the log message says how many checks were skipped in between. Without it every check is reported and nothing is
+    counted, and past _MAX_MISSING_FEATURES different names new ones are reported every time too. """
+    if current_app.debug and current_app.config.get(RAISE_ERROR_ON_MISSING_FEATURES, False):
+      raise KeyError(u"No feature flag defined for {feature}".format(feature=feature))
+
+    interval = self._report_interval
+    skipped = 0
+    if interval:
+      with self._missing_lock:
+        count = self._missing_counts.get(feature)
+        if count is not None or len(self._missing_counts) < _MAX_MISSING_FEATURES:
+          count = (count or 0) + 1
+          self._missing_counts[feature] = count
+          now = _timer()
+          reported = self._missing_reported.get(feature)
+          if reported is not None and now - reported[0] < interval:
+            return
+          self._missing_reported[feature] = (now, count)
+          skipped = count - reported[1] - 1 if reported is not None else 0
+
+    if skipped:
+      log.info(u"No feature flag defined for %s (checked %s more times since the last report)", feature, skipped)
+    else:
+      log.info(u"No feature flag defined for %s", feature)
+
+    # Without blinker (or with nobody connected) there's no point building the call
+    if getattr(missing_feature, 'receivers', None):
+      missing_feature.send(self, feature=feature)
+
+  def _request_cache(self, create=True):
+    """ Return the dict of results cached on flask.g, or None if caching is off or there's no request to cache for.
+
+    Only requests get a cache: an app context can live for as long as a worker script or shell, and it should see flags
+    change in the meantime. """
+    if not has_request_context() or not current_app.config.get(CACHE_FEATURES_PER_REQUEST, True):
+      return None
+
+    cache = getattr(g, _REQUEST_CACHE_ATTR, None)
+    if cache is None and create:
+      cache = {}
+      setattr(g, _REQUEST_CACHE_ATTR, cache)
+    return cache
+
+  def _teardown_request_cache(self, exception=None):
+    """ Drop the request cache when the request ends. """
+    try:
+      delattr(g, _REQUEST_CACHE_ATTR)
+    except (AttributeError, RuntimeError):
+      pass
 
 
 def is_active(feature):
@@ -158,35 +1056,218 @@ def is_active(feature):
       raise AssertionError("Oops. This application doesn't have the Flask-FeatureFlag extention installed.")
 
   else:
-    log.warn(u"Got a request to check for {feature} but we're running outside the request context. Check your setup. Returning False".format(feature=feature))
+    log.warning(u"Got a request to check for %s but we're running outside the request context. Check your setup. Returning False", feature)
     return False
 
 
-def is_active_feature(feature, redirect_to=None, redirect=None):
+def is_active_many(features):
+  """ Check several features at once. Returns a {feature: True/False} dict. """
+
+  if current_app:
+    feature_flagger = current_app.extensions.get(EXTENSION_NAME)
+    if feature_flagger:
+      return feature_flagger.check_many(features)
+    else:
+      raise AssertionError("Oops. This application doesn't have the Flask-FeatureFlag extention installed.")
+
+  else:
+    log.warning(u"Got a request to check for %s but we're running outside the request context. Check your setup. Returning False", features)
+    return dict((feature, False) for feature in features)
+
+
+def is_active_async(feature):
+  """ Check if a feature is active, from async code. Needs Python 3.5+. """
+  from flask_featureflags.aio import is_active_async
+  return is_active_async(feature)
+
+
+def is_active_feature(feature, redirect_to=None, redirect=None, flags=(), etag=False, vary=(), cache=None):
   """
   Decorator for Flask views. If a feature is off, it can either return a 404 or redirect to a URL if you'd rather.
+
+  If the response depends on other flags too, list them in ``flags``. Then, to help caches:
+
+  * ``etag=True`` adds an ETag that changes with the state of the flags (and with the response, if the view doesn't
+    set an ETag itself), and answers conditional requests with 304 Not Modified.
+  * ``vary`` is a list of request headers the flags depend on (such as ``Cookie``), for the Vary header.
+  * ``cache`` is a flask_featureflags.cache.FeatureFlagCache to keep responses in. A GET for the same URL with the
+    flags in the same state (and the same values for the ``vary`` headers) gets the cached response, without
+    running the view. Only use it for views whose output doesn't depend on who's asking: responses are shared
+    between users. Responses that set cookies, are marked private, no-store or no-cache, or vary on a header that
+    isn't in ``vary`` are never stored.
+
+  Works on ``async def`` views too, without blocking the event loop.
+
+  If you only have one FeatureFlag, ``feature_flags.is_active_feature`` (the method) does the same thing without
+  looking it up on every request.
   """
+  return _feature_decorator(None, feature, redirect_to, redirect, flags, etag, vary, cache)
+
+
+def _feature_decorator(feature_flagger, feature, redirect_to, redirect, flags, etag, vary, cache):
+  """ Builds the is_active_feature decorator. Views check with ``feature_flagger``, or with the current app's
+  FeatureFlag if it's None. """
+  depends_on = [feature] + [name for name in flags if name != feature]
+  options = (depends_on, etag, vary, cache) if (flags or etag or vary or cache is not None) else None
+  redirect = _RedirectTarget(redirect, redirect_to) if (redirect or redirect_to) else None
+
+  if feature_flagger is not None:
+    check, check_many = feature_flagger.check, feature_flagger.check_many
+  else:
+    check, check_many = is_active, is_active_many
+
   def _is_active_feature(func):
+    if _iscoroutinefunction(func):
+      from flask_featureflags.aio import wrap_async_view
+      return wrap_async_view(func, feature, redirect, options, feature_flagger)
+
+    if options is not None:
+      @wraps(func)
+      def wrapped_for_caching(*args, **kwargs):
+        states = check_many(depends_on)
+        if not states[feature]:
+          return _feature_off_response(feature, redirect)
+
+        fingerprint = flag_fingerprint(states)
+        key = _response_cache_key(fingerprint, vary) if cache is not None else None
+        response = _cached_response(cache, key)
+        if response is None:
+          response = _store_response(cache, key, make_response(func(*args, **kwargs)), vary)
+        return _tag_response(response, fingerprint, etag, vary)
+      return wrapped_for_caching
+
     @wraps(func)
     def wrapped(*args, **kwargs):
 
-      if not is_active(feature):
-        url = redirect_to
-        if redirect:
-          url = url_for(redirect)
-
-        if url:
-          log.debug(u'Feature {feature} is off, redirecting to {url}'.format(feature=feature, url=url))
-          return _redirect(url, code=302)
-        else:
-          log.debug(u'Feature {feature} is off, aborting request'.format(feature=feature))
-          abort(404)
+      if not check(feature):
+        return _feature_off_response(feature, redirect)
 
       return func(*args, **kwargs)
     return wrapped
   return _is_active_feature
 
 
+def flag_fingerprint(states):
+  """ A short string that's the same for the same {feature: True/False} states, and different for different ones. """
+  summary = u','.join(u'%s=%d' % (feature, bool(active)) for feature, active in sorted(states.items()))
+  return hashlib.sha1(summary.encode('utf-8')).hexdigest()[:16]
+
+
+def _response_cache_key(fingerprint, vary=()):
+  """ Responses are only shared between requests for the same URL, with the same values for the ``vary`` headers. """
+  return (request.endpoint, request.path, request.query_string, fingerprint,
+          tuple(request.headers.get(header) for header in vary))
+
+
+def _cached_response(cache, key):
+  """ A fresh copy of the response cached under ``key``, or None. Only GETs (and HEADs) are answered from the cache. """
+  if key is None or request.method not in ('GET', 'HEAD'):
+    return None
+  stored = cache.get(key)
+  if stored is MISSING:
+    return None
+  body, status, headers = stored
+  return current_app.response_class(body, status=status, headers=headers)
+
+
+def _store_response(cache, key, response, vary=()):
+  """ Cache a copy of a successful GET response. Streamed responses, ones that set cookies, ones the view marked
+  private, no-store or no-cache, and ones whose Vary names a header that isn't in ``vary`` are left alone. """
+  if (key is not None and request.method == 'GET' and response.status_code == 200 and not response.is_streamed and
+      'Set-Cookie' not in response.headers and _shareable(response, vary)):
+    cache.set(key, (response.get_data() if hasattr(response, 'get_data') else response.data,
+                    response.status_code, list(response.headers.items())))
+  return response
+
+
+def _shareable(response, vary):
+  """ Whether the view's own headers allow its response to be given to other people. """
+  cache_control = response.cache_control
+  if cache_control.private or cache_control.no_store or cache_control.no_cache:
+    return False
+  keyed_on = set(header.lower() for header in vary)
+  return all(header != u'*' and header.lower() in keyed_on for header in response.vary)
+
+
+def _tag_response(response, fingerprint, etag, vary):
+  for header in vary:
+    response.vary.add(header)
+
+  if etag:
+    tag, weak = response.get_etag()
+    if tag is None and not response.is_streamed:
+      response.add_etag()
+      tag, weak = response.get_etag()
+    if tag is not None:
+      response.set_etag(u'%s-%s' % (tag, fingerprint), weak)
+      response.make_conditional(request)
+  return response
+
+
+def _url_map_signature(url_map):
+  """ Changes when rules are added to the map. Werkzeug doesn't let you take them away. """
+  return (url_map, len(getattr(url_map, '_rules', ())))
+
+
+class _RedirectTarget(object):
+  """ Where is_active_feature sends people when its feature is off: an endpoint, or failing that a fixed URL.
+
+  The redirect is only built (with url_for, for an endpoint) the first time; after that its body and headers are
+  copied into each response, until rules are added to the app's URL map. They're kept per script root and host,
+  since URLs depend on where the app is mounted. Apps with ``url_defaults`` functions get url_for every time,
+  because those can change the URL from request to request. """
+
+  def __init__(self, endpoint=None, url=None):
+    self.endpoint = endpoint
+    self._fixed = _redirect_parts(url) if url and not endpoint else None
+    # app -> (URL map signature, {(script root, host, blueprint): redirect parts})
+    self._by_app = weakref.WeakKeyDictionary()
+
+  def response(self, feature):
+    app = current_app._get_current_object()
+    url, body, headers = self._fixed or self._parts(app)
+    log.debug(u'Feature %s is off, redirecting to %s', feature, url)
+    return app.response_class(body, status=302, headers=headers)
+
+  def _parts(self, app):
+    if any(app.url_default_functions.values()):
+      return _redirect_parts(url_for(self.endpoint))
+
+    signature = _url_map_signature(app.url_map)
+    cached = self._by_app.get(app)
+    if cached is None or cached[0] != signature:
+      cached = self._by_app[app] = (signature, {})
+    built = cached[1]
+
+    # Endpoints starting with a dot are relative to the current blueprint
+    key = (request.script_root, request.host, request.blueprint if self.endpoint.startswith(u'.') else None)
+    parts = built.get(key)
+    if parts is None:
+      parts = built[key] = _redirect_parts(url_for(self.endpoint))
+    return parts
+
+
+def _redirect_parts(url):
+  """ (url, body, headers) of a 302 to ``url``, to build responses from. """
+  response = _redirect(url, code=302)
+  body = response.get_data() if hasattr(response, 'get_data') else response.data
+  return url, body, list(response.headers.items())
+
+
+def _feature_off_response(feature, redirect=None):
+  """ What is_active_feature does when the feature is off: redirect if we've been told where to, otherwise 404.
+  ``redirect`` is a _RedirectTarget. """
+  if redirect is not None:
+    return redirect.response(feature)
+  else:
+    log.debug(u'Feature %s is off, aborting request', feature)
+    abort(404)
+
+
+# Python < 3.5 doesn't have coroutines, so nothing is one
+_iscoroutinefunction = getattr(inspect, 'iscoroutinefunction', lambda func: False)
+
+
 # Silence that annoying No handlers could be found for logger "flask-featureflags"
 class NullHandler(logging.Handler):
   def emit(self, record):
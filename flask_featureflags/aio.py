@@ -0,0 +1,157 @@
+"""
+Feature flag checks for ``async def`` views. Needs Python 3.5+, so it's kept out of the main module.
+
+Use it through ``is_active_async``, ``FeatureFlag.check_async`` and ``is_active_feature``, which notices async views
+by itself.
+"""
+import asyncio
+from functools import partial, wraps
+import inspect
+
+from flask import current_app, make_response
+
+import flask_featureflags as feature_flags
+from flask_featureflags import FEATURE_NOT_FOUND, STOP_CHECKING, NoFeatureFlagFound, StopCheckingFeatureFlags
+from flask_featureflags import _in_current_context
+
+
+def _async_lookup(handler):
+  """ Return the coroutine function to await for this handler, or None if it's a regular handler. """
+  lookup = getattr(handler, 'lookup_async', None)
+  if lookup is not None:
+    return lookup
+  if inspect.iscoroutinefunction(handler):
+    return handler
+  if inspect.iscoroutinefunction(getattr(handler, '__call__', None)):
+    return handler.__call__
+  return None
+
+
+def _answer(lookup, feature):
+  """ Call a sync lookup, turning the exceptions into sentinels so they don't have to cross threads. """
+  try:
+    return lookup(feature)
+  except NoFeatureFlagFound:
+    return FEATURE_NOT_FOUND
+  except StopCheckingFeatureFlags:
+    return STOP_CHECKING
+
+
+async def _await_answer(task):
+  try:
+    return await task
+  except NoFeatureFlagFound:
+    return FEATURE_NOT_FOUND
+  except StopCheckingFeatureFlags:
+    return STOP_CHECKING
+
+
+async def check_async(feature_flagger, feature):
+  """ Async version of FeatureFlag.check, with the same answers.
+
+  Coroutine handlers (or handlers with a ``lookup_async`` coroutine method) are all started at once, since they're
+  usually waiting on the network. Their answers are still used in chain order, so the first True still wins and
+  STOP_CHECKING still stops the chain; anything still running at that point is cancelled.
+
+  Regular handlers run one at a time, in a thread pool so they don't block the event loop. Handlers that never
+  block can set ``blocking = False`` to be called directly instead; the built-in in-memory handlers do. """
+  cache = feature_flagger._request_cache()
+  if cache is not None and feature in cache:
+    result = cache[feature]
+    if feature_flagger.usage is not None:
+      feature_flagger.usage.record(feature, result)
+    return result
+
+  loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)()
+  handlers = feature_flagger._handlers
+  chain = feature_flagger._chain
+
+  tasks = {}
+  for i, handler in enumerate(handlers):
+    lookup = _async_lookup(handler)
+    if lookup is not None:
+      tasks[i] = asyncio.ensure_future(lookup(feature))
+
+  result, found = False, False
+  try:
+    for i, handler in enumerate(handlers):
+      if i in tasks:
+        answer = await _await_answer(tasks[i])
+      elif getattr(handler, 'blocking', True):
+        answer = await loop.run_in_executor(None, _in_current_context(partial(_answer, chain[i][0], feature)))
+      else:
+        answer = _answer(chain[i][0], feature)
+
+      if answer is FEATURE_NOT_FOUND:
+        continue
+      found = True
+      if answer is STOP_CHECKING:
+        break
+      elif answer:
+        result = True
+        break
+  finally:
+    for task in tasks.values():
+      if not task.done():
+        task.cancel()
+
+  if not found:
+    feature_flagger._missing_feature(feature)
+
+  if cache is not None:
+    cache[feature] = result
+  if feature_flagger.usage is not None:
+    feature_flagger.usage.record(feature, result)
+  return result
+
+
+async def is_active_async(feature):
+  """ Async version of is_active. """
+  if current_app:
+    feature_flagger = current_app.extensions.get(feature_flags.EXTENSION_NAME)
+    if feature_flagger:
+      return await check_async(feature_flagger, feature)
+    else:
+      raise AssertionError("Oops. This application doesn't have the Flask-FeatureFlag extention installed.")
+
+  else:
+    feature_flags.log.warning(u"Got a request to check for %s but we're running outside the request context. Check your setup. Returning False", feature)
+    return False
+
+
+def wrap_async_view(func, feature, redirect=None, options=None, feature_flagger=None):
+  """ is_active_feature for ``async def`` views. ``redirect`` is a _RedirectTarget, and checks go to
+  ``feature_flagger`` if there is one, or the current app's otherwise. """
+  if feature_flagger is not None:
+    check = partial(check_async, feature_flagger)
+  else:
+    check = is_active_async
+
+  if options is not None:
+    return _wrap_async_view_for_caching(func, feature, redirect, options, check)
+
+  @wraps(func)
+  async def wrapped(*args, **kwargs):
+    if not await check(feature):
+      return feature_flags._feature_off_response(feature, redirect)
+    return await func(*args, **kwargs)
+  return wrapped
+
+
+def _wrap_async_view_for_caching(func, feature, redirect, options, check):
+  depends_on, etag, vary, cache = options
+
+  @wraps(func)
+  async def wrapped(*args, **kwargs):
+    active = await asyncio.gather(*[check(name) for name in depends_on])
+    states = dict(zip(depends_on, active))
+    if not states[feature]:
+      return feature_flags._feature_off_response(feature, redirect)
+
+    fingerprint = feature_flags.flag_fingerprint(states)
+    key = feature_flags._response_cache_key(fingerprint, vary) if cache is not None else None
+    response = feature_flags._cached_response(cache, key)
+    if response is None:
+      response = feature_flags._store_response(cache, key, make_response(await func(*args, **kwargs)), vary)
+    return feature_flags._tag_response(response, fingerprint, etag, vary)
+  return wrapped
@@ -0,0 +1,200 @@
+"""
+Telling every process that a feature flag changed, so cached handlers can forget it straight away.
+"""
+from __future__ import with_statement
+
+import errno
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+
+log = logging.getLogger(u'flask-featureflags')
+
+# Invalidation messages are tiny; anything bigger than this isn't one of ours
+MAX_MESSAGE_SIZE = 65536
+
+
+class InvalidationBus(object):
+  """ Carries "this flag changed" messages to every subscriber, in this process and (depending on the transport)
+  in others.
+
+    bus = InvalidationBus(UnixSocketTransport('/run/myapp/flag-bus'))
+    feature_flags.connect_bus(bus)
+
+  Subscribers are called as ``callback(feature)``, where ``feature`` is None if every flag should be forgotten.
+  Subscribers in this process are called before publish() returns; other processes hear about it shortly after. """
+
+  def __init__(self, transport=None):
+    self.transport = transport if transport is not None else LocalTransport()
+    self._subscribers = []
+    self.transport.start(self._receive)
+
+  def subscribe(self, callback):
+    self._subscribers.append(callback)
+
+  def unsubscribe(self, callback):
+    try:
+      self._subscribers.remove(callback)
+    except ValueError:
+      pass
+
+  def publish(self, feature=None):
+    """ Tell everyone that ``feature`` (or every feature, if None) changed. """
+    self._deliver(feature)
+    self.transport.send(json.dumps({u'feature': feature}).encode('utf-8'), self._receive)
+
+  def close(self):
+    self.transport.stop(self._receive)
+
+  def _receive(self, message):
+    try:
+      feature = json.loads(message.decode('utf-8'))[u'feature']
+    except (ValueError, KeyError, TypeError):
+      log.warning(u"Ignoring a feature flag invalidation we couldn't understand: %r", message)
+      return
+    self._deliver(feature)
+
+  def _deliver(self, feature):
+    for callback in list(self._subscribers):
+      try:
+        callback(feature)
+      except Exception:
+        log.exception(u"Feature flag invalidation subscriber %r failed", callback)
+
+
+class ChangeNotifier(object):
+  """ For handlers that notice for themselves when flags change, like one that reloads a file.
+
+  Give the handler a ``changes`` attribute holding one of these, and call ``changes.notify(feature)`` (or
+  ``notify()`` if you can't tell which features changed). FeatureFlag listens to the handlers in its chain, and
+  bumps its version, drops cached fragments and sends flag_changed. """
+
+  def __init__(self):
+    self._listeners = []
+
+  def add_listener(self, callback):
+    self._listeners.append(callback)
+
+  def remove_listener(self, callback):
+    try:
+      self._listeners.remove(callback)
+    except ValueError:
+      pass
+
+  def notify_diff(self, old, new):
+    """ Notify about each feature that's different between two {feature: True/False} dicts. """
+    if not old:
+      # Nothing to compare against, so everything changed
+      if new:
+        self.notify()
+      return
+    for feature in set(old) | set(new):
+      if old.get(feature) != new.get(feature):
+        self.notify(feature)
+
+  def notify(self, feature=None):
+    for callback in list(self._listeners):
+      try:
+        callback(feature)
+      except Exception:
+        log.exception(u"Feature flag change listener %r failed", callback)
+
+
+class LocalTransport(object):
+  """ Carries messages between buses in the same process, e.g. one per app. Give them all the same transport. """
+
+  def __init__(self):
+    self._receivers = []
+
+  def start(self, receive):
+    self._receivers.append(receive)
+
+  def send(self, message, sender):
+    for receive in list(self._receivers):
+      if receive != sender:
+        receive(message)
+
+  def stop(self, receive):
+    try:
+      self._receivers.remove(receive)
+    except ValueError:
+      pass
+
+
+class UnixSocketTransport(object):
+  """ Carries messages between processes on the same host, without a broker.
+
+  Each bus binds a datagram socket in ``directory``, and sending means sending to every other socket in there.
+  Sockets left behind by processes that died are cleaned up the next time someone sends. Make one transport per
+  bus, after any fork (in gunicorn's ``post_fork``, for example), since the socket belongs to the process. """
+
+  def __init__(self, directory):
+    self.directory = directory
+    if not os.path.isdir(directory):
+      try:
+        os.makedirs(directory)
+      except OSError as e:  # someone else made it first
+        if e.errno != errno.EEXIST:
+          raise
+
+    self.path = os.path.join(directory, u'{pid}-{id}.sock'.format(pid=os.getpid(), id=uuid.uuid4().hex[:12]))
+    self._socket = None
+    self._thread = None
+    self._stopping = False
+
+  def start(self, receive):
+    self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    self._socket.bind(self.path)
+    self._thread = threading.Thread(target=self._listen, args=(receive,), name=u'feature-flag-invalidations')
+    self._thread.daemon = True
+    self._thread.start()
+
+  def send(self, message, sender):
+    sock = self._socket
+    for name in os.listdir(self.directory):
+      path = os.path.join(self.directory, name)
+      if not name.endswith(u'.sock') or path == self.path:
+        continue
+      try:
+        sock.sendto(message, path)
+      except socket.error as e:
+        if e.errno in (errno.ECONNREFUSED, errno.ENOENT):
+          # Nobody's listening any more
+          self._remove(path)
+        else:
+          log.warning(u"Couldn't send a feature flag invalidation to %s: %s", path, e)
+
+  def stop(self, receive=None):
+    if self._socket is None:
+      return
+    self._stopping = True
+    # Wake the listener up; closing a socket doesn't reliably interrupt a blocked recv()
+    try:
+      self._socket.sendto(b'', self.path)
+    except socket.error:
+      pass
+    self._thread.join()
+    self._socket.close()
+    self._socket = None
+    self._remove(self.path)
+
+  def _listen(self, receive):
+    while True:
+      try:
+        message = self._socket.recv(MAX_MESSAGE_SIZE)
+      except socket.error:
+        log.exception(u"Feature flag invalidation listener failed")
+        return
+      if self._stopping:
+        return
+      if message:
+        receive(message)
+
+  def _remove(self, path):
+    try:
+      os.unlink(path)
+    except OSError:
+      pass
@@ -0,0 +1,93 @@
+"""
+A small cache for handlers that look flags up somewhere slow.
+"""
+import threading
+import time
+
+try:
+  from collections import OrderedDict
+except ImportError:  # python 2.6
+  from ordereddict import OrderedDict
+
+try:
+  from types import MappingProxyType as _frozen_dict
+except ImportError:  # python 2 doesn't have a read-only dict, so a copy nobody else holds will have to do
+  _frozen_dict = dict
+
+# time.monotonic doesn't exist on python 2, and isn't affected by the wall clock jumping around
+_timer = getattr(time, 'monotonic', time.time)
+
+# Marker for "not in the cache". Flags that don't exist are cached as FEATURE_NOT_FOUND.
+MISSING = object()
+
+
+class FeatureFlagCache(object):
+  """ A thread-safe, size-bounded LRU cache whose entries expire after ``ttl`` seconds.
+
+  Keeps count of hits, misses and evictions so you can tell whether it's sized sensibly. """
+
+  def __init__(self, ttl=30, maxsize=1024, timer=_timer):
+    self.ttl = ttl
+    self.maxsize = maxsize
+    self.timer = timer
+
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+    self._data = OrderedDict()
+    self._lock = threading.Lock()
+
+  def __len__(self):
+    return len(self._data)
+
+  def get(self, feature):
+    """ Return the cached value, or MISSING if we don't have a fresh one. """
+    with self._lock:
+      try:
+        value, expires = self._data.pop(feature)
+      except KeyError:
+        self.misses += 1
+        return MISSING
+
+      # re-inserting moves it to the most recently used end. Expired entries are kept for get_stale().
+      self._data[feature] = (value, expires)
+      if expires <= self.timer():
+        self.misses += 1
+        return MISSING
+
+      self.hits += 1
+      return value
+
+  def get_stale(self, feature):
+    """ Return the cached value even if it's expired, or MISSING if it's not here at all. For falling back on when
+    wherever the flags really live can't be reached. Doesn't count as a hit or a miss. """
+    with self._lock:
+      entry = self._data.get(feature)
+    return entry[0] if entry is not None else MISSING
+
+  def set(self, feature, value):
+    with self._lock:
+      self._data.pop(feature, None)
+      self._data[feature] = (value, self.timer() + self.ttl)
+
+      while len(self._data) > self.maxsize:
+        self._data.popitem(last=False)
+        self.evictions += 1
+
+  def invalidate(self, feature=None):
+    """ Forget one feature, or everything if no feature is given. """
+    with self._lock:
+      if feature is None:
+        self._data.clear()
+      else:
+        self._data.pop(feature, None)
+
+  def stats(self):
+    return {
+      'hits': self.hits,
+      'misses': self.misses,
+      'evictions': self.evictions,
+      'size': len(self._data),
+      'maxsize': self.maxsize,
+    }
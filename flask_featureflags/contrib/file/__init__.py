@@ -0,0 +1,140 @@
+from __future__ import with_statement
+
+import json
+import os
+import threading
+
+from flask.ext.featureflags import FEATURE_NOT_FOUND, LookupFlagHandler, log
+from flask.ext.featureflags.bus import ChangeNotifier
+from flask.ext.featureflags.cache import _timer
+
+
+def _load_json(data):
+  return json.loads(data.decode('utf-8'))
+
+
+def _load_yaml(data):
+  try:
+    import yaml
+  except ImportError:
+    raise ImportError(u"Loading feature flags from YAML needs PyYAML: pip install PyYAML")
+  return yaml.safe_load(data)
+
+
+def _load_toml(data):
+  try:
+    import tomllib
+    return tomllib.loads(data.decode('utf-8'))
+  except ImportError:  # tomllib is new in python 3.11
+    pass
+  try:
+    import toml
+  except ImportError:
+    raise ImportError(u"Loading feature flags from TOML needs python 3.11 or the toml package: pip install toml")
+  return toml.loads(data.decode('utf-8'))
+
+
+LOADERS = {
+  'json': _load_json,
+  'yaml': _load_yaml,
+  'toml': _load_toml,
+}
+
+EXTENSIONS = {
+  '.json': 'json',
+  '.yaml': 'yaml',
+  '.yml': 'yaml',
+  '.toml': 'toml',
+}
+
+
+def _signature(stat):
+  """ Enough of a stat result to tell that the file changed, whether it was edited in place or replaced. """
+  return (getattr(stat, 'st_mtime_ns', stat.st_mtime), stat.st_ino, stat.st_size)
+
+
+class FileFeatureFlag(LookupFlagHandler):
+  """ Reads feature flags from a JSON, YAML or TOML file, and picks up changes without a restart.
+
+    feature_flags.add_handler(FileFeatureFlag('/etc/myapp/flags.yaml'))
+
+  The file holds a mapping of feature names to true or false (real booleans, not strings). It's parsed once, and
+  then only when it changes: at most once every ``check_interval`` seconds, a check looks at the file's
+  modification time, inode and size. If the new contents don't parse, or have a value that isn't a boolean, the
+  old flags are kept. Features that aren't in the file are passed on to the
+  next handler. """
+
+  # Checks are a dict lookup, plus a stat() at most once every check_interval
+  blocking = False
+
+  def __init__(self, path, format=None, check_interval=1.0):
+    if format is None:
+      format = EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if format not in LOADERS:
+      raise ValueError(u"Can't tell what format {path} is in, pass format='json', 'yaml' or 'toml'".format(path=path))
+
+    self.path = path
+    self.format = format
+    self.check_interval = check_interval
+
+    self._flags = {}
+    self._signature = None
+    self._next_check = None
+    self._reload_lock = threading.Lock()
+    # Tells FeatureFlag when the file turns out to hold different flags
+    self.changes = ChangeNotifier()
+
+    # Fail loudly at startup rather than quietly turning every feature off
+    self.reload()
+
+  def lookup(self, feature):
+    """ Same as calling the handler, but returns FEATURE_NOT_FOUND instead of raising NoFeatureFlagFound. """
+    if _timer() >= self._next_check:
+      self._poll()
+    return self._flags.get(feature, FEATURE_NOT_FOUND)
+
+  def check_many(self, features):
+    if _timer() >= self._next_check:
+      self._poll()
+    flags = self._flags
+    return dict((feature, flags[feature]) for feature in features if feature in flags)
+
+  def reload(self):
+    """ Read the file now, whether or not it's changed. Raises if it can't be read or parsed. """
+    with self._reload_lock:
+      self._load(os.stat(self.path))
+
+  def invalidate(self, feature=None):
+    """ Look at the file again on the next check, rather than waiting for check_interval to pass. """
+    self._next_check = float('-inf')
+
+  def _poll(self):
+    # Only one thread needs to look; the others carry on with the flags we already have
+    if not self._reload_lock.acquire(False):
+      return
+    try:
+      self._next_check = _timer() + self.check_interval
+      stat = os.stat(self.path)
+      if _signature(stat) != self._signature:
+        self._load(stat)
+    except Exception:
+      log.exception(u"Couldn't reload feature flags from %s, keeping the old ones", self.path)
+    finally:
+      self._reload_lock.release()
+
+  def _load(self, stat):
+    with open(self.path, 'rb') as f:
+      flags = LOADERS[self.format](f.read())
+    if not isinstance(flags, dict):
+      raise ValueError(u"{path} should contain a mapping of feature names to True or False".format(path=self.path))
+    for feature, value in flags.items():
+      # Quoted "false" would otherwise come out as True
+      if not isinstance(value, bool):
+        raise ValueError(u"{feature} in {path} should be true or false, not {value!r}".format(
+          feature=feature, path=self.path, value=value))
+
+    # One assignment, so checks in other threads see either all of the old flags or all of the new ones
+    old, self._flags = self._flags, dict(flags)
+    self._signature = _signature(stat)
+    self._next_check = _timer() + self.check_interval
+    self.changes.notify_diff(old, self._flags)
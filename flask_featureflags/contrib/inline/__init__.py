@@ -1,18 +1,31 @@
 from flask import current_app
 from flask.ext.featureflags import FEATURE_FLAGS_CONFIG
-from flask.ext.featureflags import NoFeatureFlagFound
+from flask.ext.featureflags import FEATURE_NOT_FOUND
+from flask.ext.featureflags import LookupFlagHandler
 from flask.ext.featureflags import log
 
 
-class InlineFeatureFlag(object):
-  def __call__(self, feature):
+class InlineFeatureFlag(LookupFlagHandler):
+  # Only reads the config, so async checks can call it directly
+  blocking = False
+
+  def lookup(self, feature):
     if not current_app:
-      log.warn(u"Got a request to check for {feature} but we're outside the request context. Returning False".format(feature=feature))
+      log.warning(u"Got a request to check for %s but we're outside the request context. Returning False", feature)
       return False
 
     feature_cfg = "{prefix}_{feature}".format(prefix=FEATURE_FLAGS_CONFIG, feature=feature)
+    return current_app.config.get(feature_cfg, FEATURE_NOT_FOUND)
+
+  def check_many(self, features):
+    if not current_app:
+      log.warning(u"Got a request to check for %s but we're outside the request context. Returning False", features)
+      return dict((feature, False) for feature in features)
 
-    try:
-      return current_app.config[feature_cfg]
-    except KeyError:
-      raise NoFeatureFlagFound()
+    config = current_app.config
+    results = {}
+    for feature in features:
+      feature_cfg = "{prefix}_{feature}".format(prefix=FEATURE_FLAGS_CONFIG, feature=feature)
+      if feature_cfg in config:
+        results[feature] = config[feature_cfg]
+    return results
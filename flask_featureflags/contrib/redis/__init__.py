@@ -0,0 +1,149 @@
+from __future__ import absolute_import
+
+import socket
+
+from flask.ext.featureflags import FEATURE_NOT_FOUND, LookupFlagHandler, log
+from flask.ext.featureflags.cache import FeatureFlagCache, MISSING
+
+# Values that mean "on". Anything else stored under a flag's key means off.
+TRUE_VALUES = frozenset([u'1', u'true', u'on', u'yes'])
+
+
+def _client_errors():
+  """ What a Redis client raises when the server can't be reached or doesn't answer in time. """
+  try:
+    import redis
+  except ImportError:
+    return (socket.error,)
+  return (redis.RedisError, socket.error)
+
+
+def _parse(value):
+  if value is None:
+    return FEATURE_NOT_FOUND
+  if isinstance(value, bytes):
+    value = value.decode('utf-8')
+  return value.strip().lower() in TRUE_VALUES
+
+
+class RedisFeatureFlag(LookupFlagHandler):
+  """ Keeps feature flags in Redis (or anything that speaks its protocol), so every server sees the same flags.
+
+    handler = RedisFeatureFlag(url='redis://flags.internal:6379/0', cache_ttl=5)
+    feature_flags.add_handler(handler)
+
+  Each flag is a key, ``prefix + feature``, holding ``1`` or ``0``. Batch checks fetch every flag they need with
+  one MGET. With ``cache_ttl`` set, answers are also kept in a local near-cache for that many seconds, so most checks
+  don't leave the process at all; flags you change through this handler are dropped from its cache right away.
+
+  Pass ``client`` to use a client you already have. It needs ``get``, ``mget``, ``set``, ``delete`` and ``pipeline``,
+  like redis-py's. Otherwise one is made from ``url``, with a connection pool shared by every thread; any other
+  keyword arguments (such as ``max_connections``) are passed on to the pool. Features that aren't in Redis are
+  passed on to the next handler.
+
+  If Redis can't be reached, checks log a warning and fall back on the near-cache, even if its answer has expired.
+  Features it doesn't have are passed on to the next handler. Pass ``errors`` (a tuple of exception classes) if your
+  client raises something other than redis-py's errors or socket errors. """
+
+  # Doesn't depend on the handlers before it, so concurrent checks can overlap the round trip with theirs
+  independent = True
+
+  def __init__(self, client=None, url=u'redis://localhost:6379/0', prefix=u'feature_flags:', cache_ttl=None,
+               cache_size=1024, errors=None, **pool_options):
+    if client is None:
+      import redis
+      client = redis.StrictRedis(connection_pool=redis.ConnectionPool.from_url(url, **pool_options))
+    self.client = client
+    self.prefix = prefix
+    self.errors = errors if errors is not None else _client_errors()
+
+    self.cache = None
+    if cache_ttl:
+      self.cache = FeatureFlagCache(ttl=cache_ttl, maxsize=cache_size)
+
+  def key(self, feature):
+    return self.prefix + feature
+
+  def lookup(self, feature):
+    """ Same as calling the handler, but returns FEATURE_NOT_FOUND instead of raising NoFeatureFlagFound. """
+    cache = self.cache
+    if cache is not None:
+      value = cache.get(feature)
+      if value is not MISSING:
+        return value
+
+    try:
+      value = _parse(self.client.get(self.key(feature)))
+    except self.errors as e:
+      log.warning(u"Couldn't get feature flag %s from Redis: %s", feature, e)
+      return self._fallback(feature)
+
+    if cache is not None:
+      cache.set(feature, value)
+    return value
+
+  def check_many(self, features):
+    """ Look up several features in one round trip (or none at all, if they're all in the near-cache).
+
+    Returns a dict of the features that exist. """
+    results = {}
+    cache = self.cache
+    to_fetch = []
+
+    for feature in features:
+      value = cache.get(feature) if cache is not None else MISSING
+      if value is MISSING:
+        to_fetch.append(feature)
+      elif value is not FEATURE_NOT_FOUND:
+        results[feature] = value
+
+    if to_fetch:
+      try:
+        values = self.client.mget([self.key(feature) for feature in to_fetch])
+      except self.errors as e:
+        log.warning(u"Couldn't get %s feature flags from Redis: %s", len(to_fetch), e)
+        for feature in to_fetch:
+          value = self._fallback(feature)
+          if value is not FEATURE_NOT_FOUND:
+            results[feature] = value
+        return results
+
+      for feature, value in zip(to_fetch, values):
+        value = _parse(value)
+        if value is not FEATURE_NOT_FOUND:
+          results[feature] = value
+        if cache is not None:
+          cache.set(feature, value)
+
+    return results
+
+  def set(self, feature, active):
+    """ Turn a feature on or off for everyone. """
+    self.client.set(self.key(feature), u'1' if active else u'0')
+    self.invalidate(feature)
+
+  def set_many(self, flags):
+    """ Set several features from a {feature: True/False} dict, in one pipelined round trip. """
+    pipeline = self.client.pipeline(transaction=False)
+    for feature, active in flags.items():
+      pipeline.set(self.key(feature), u'1' if active else u'0')
+    pipeline.execute()
+    for feature in flags:
+      self.invalidate(feature)
+
+  def delete(self, feature):
+    """ Forget about a feature, so it's passed on to the next handler. """
+    self.client.delete(self.key(feature))
+    self.invalidate(feature)
+
+  def _fallback(self, feature):
+    """ The last answer we had for a feature, however old, or FEATURE_NOT_FOUND to let the next handler decide. """
+    if self.cache is None:
+      return FEATURE_NOT_FOUND
+    value = self.cache.get_stale(feature)
+    return FEATURE_NOT_FOUND if value is MISSING else value
+
+  def invalidate(self, feature=None):
+    """ Drop a feature (or all features) from the near-cache, e.g. after another process changed it. """
+    if self.cache is not None:
+      self.cache.invalidate(feature)
@@ -0,0 +1,110 @@
+import zlib
+
+from flask import has_request_context, request
+from flask.ext.featureflags import FEATURE_NOT_FOUND, LookupFlagHandler
+
+# Percentages are resolved to 1/100th of a percent
+BUCKETS = 10000
+
+
+def _to_bytes(value):
+  if isinstance(value, bytes):
+    return value
+  if not isinstance(value, type(u'')):
+    value = u'%s' % value
+  return value.encode('utf-8')
+
+
+def _mix(h):
+  """ murmur3's 32 bit finalizer. crc32 on its own is linear, which would put the same users in every rollout. """
+  h ^= h >> 16
+  h = (h * 0x85ebca6b) & 0xffffffff
+  h ^= h >> 13
+  h = (h * 0xc2b2ae35) & 0xffffffff
+  h ^= h >> 16
+  return h
+
+
+def remote_addr():
+  """ The default rollout key: the client's IP address. """
+  if has_request_context():
+    return request.remote_addr
+  return None
+
+
+class PercentageRolloutFeatureFlag(LookupFlagHandler):
+  """ Turns features on for a fixed percentage of users.
+
+  Each user is put in a bucket by hashing the feature name together with a key for the user, as returned by
+  ``key_func`` (by default, their IP address). The hash is stable, so a given user always gets the same answer
+  for a feature, across requests, workers and machines, and raising the percentage only ever adds users.
+
+    rollout = PercentageRolloutFeatureFlag({'new_checkout': 5}, key_func=lambda: current_user.id)
+    feature_flags.add_handler(rollout)
+
+  Features this handler doesn't know about are passed on to the next handler. """
+
+  # Everything's in memory, so async checks can call it directly
+  blocking = False
+
+  def __init__(self, percentages=None, key_func=remote_addr):
+    self.key_func = key_func
+
+    # feature -> (crc32 of the feature name, number of buckets that get the feature)
+    self._rollouts = {}
+    for feature, percentage in (percentages or {}).items():
+      self.set_percentage(feature, percentage)
+
+  def set_percentage(self, feature, percentage):
+    """ Roll a feature out to ``percentage`` (0-100) percent of users. """
+    if not 0 <= percentage <= 100:
+      raise ValueError(u'Rollout percentage for {feature} must be between 0 and 100, not {percentage}'.format(feature=feature, percentage=percentage))
+
+    # Swap in a new dict rather than changing the old one, so checks in other threads never see it half-updated
+    rollouts = dict(self._rollouts)
+    rollouts[feature] = (zlib.crc32(_to_bytes(feature)), int(round(percentage * BUCKETS / 100.0)))
+    self._rollouts = rollouts
+
+  def remove(self, feature):
+    """ Stop handling a feature. """
+    rollouts = dict(self._rollouts)
+    rollouts.pop(feature, None)
+    self._rollouts = rollouts
+
+  def percentage(self, feature):
+    """ The percentage a feature is rolled out to, or None if we don't know about it. """
+    try:
+      return self._rollouts[feature][1] * 100.0 / BUCKETS
+    except KeyError:
+      return None
+
+  def bucket(self, feature, key):
+    """ Which of the BUCKETS a key falls in for this feature. The feature is on for buckets below its threshold. """
+    # crc32 of the feature name is the starting value, which is the same as hashing feature + key without the concatenation
+    seed = self._rollouts[feature][0] if feature in self._rollouts else zlib.crc32(_to_bytes(feature))
+    return _mix(zlib.crc32(_to_bytes(key), seed) & 0xffffffff) % BUCKETS
+
+  def lookup(self, feature):
+    try:
+      seed, threshold = self._rollouts[feature]
+    except KeyError:
+      return FEATURE_NOT_FOUND
+
+    if threshold <= 0:
+      return False
+    elif threshold >= BUCKETS:
+      return True
+
+    key = self.key_func()
+    if key is None:
+      return False
+
+    return _mix(zlib.crc32(_to_bytes(key), seed) & 0xffffffff) % BUCKETS < threshold
+
+  def check_many(self, features):
+    results = {}
+    for feature in features:
+      result = self.lookup(feature)
+      if result is not FEATURE_NOT_FOUND:
+        results[feature] = result
+    return results
@@ -0,0 +1,146 @@
+from flask import has_request_context, request
+from flask.ext.featureflags import FEATURE_NOT_FOUND, LookupFlagHandler
+
+HEADER_PREFIX = u'header:'
+
+# Key in a rule that says what to return when it matches, instead of being a condition
+ACTIVE = u'active'
+
+_string_types = (type(u''), type(''))
+
+
+def _header_getter(name):
+  def get_header():
+    if has_request_context():
+      return request.headers.get(name)
+    return None
+  return get_header
+
+
+def _compile_condition(attribute, allowed):
+  """ Turn ``attribute: allowed values`` into a predicate on a _Context.
+
+  The allowed values go in a frozenset, so matching costs the same whether there are 3 of them or 300,000. If the
+  attribute's value is a list or set (say, a user's groups), any one of them being allowed is a match. """
+  if isinstance(allowed, _string_types) or not hasattr(allowed, '__iter__'):
+    allowed = [allowed]
+  allowed = frozenset(allowed)
+
+  def matches(context):
+    value = context.get(attribute)
+    if value is None:
+      return False
+    if isinstance(value, (list, tuple, set, frozenset)):
+      return not allowed.isdisjoint(value)
+    return value in allowed
+  return matches
+
+
+class _Context(object):
+  """ Looks up attributes of the current request, at most once each per check. """
+
+  def __init__(self, getters):
+    self.getters = getters
+    self.values = {}
+
+  def get(self, attribute):
+    try:
+      return self.values[attribute]
+    except KeyError:
+      value = self.values[attribute] = self.getters[attribute]()
+      return value
+
+
+class RulesFeatureFlag(LookupFlagHandler):
+  """ Turns features on for requests that match a set of rules.
+
+  ``attributes`` maps names to functions that describe the current request, e.g.::
+
+    attributes = {
+      'user_id': lambda: current_user.id,
+      'groups': lambda: current_user.groups,
+      'country': lambda: request.headers.get('CF-IPCountry'),
+    }
+
+  Request headers are always available as ``header:<Header-Name>``.
+
+  ``rules`` maps each feature to a list of rules. A rule is a dict of ``attribute: allowed values``, and matches
+  when every attribute has one of its allowed values. The first rule to match decides: the feature is on, unless
+  the rule says ``'active': False``. If no rule matches, the feature is off::
+
+    rules = {
+      'new_dashboard': [
+        {'country': ['NZ'], 'active': False},
+        {'user_id': beta_tester_ids},
+        {'groups': ['staff']},
+        {'header:X-Beta': '1'},
+      ],
+    }
+
+  Rules are compiled when they're loaded, so a check costs one set lookup per condition, no matter how long the
+  lists of allowed values are. Features without rules are passed on to the next handler. """
+
+  # Everything's in memory, so async checks can call it directly
+  blocking = False
+
+  def __init__(self, rules=None, attributes=None):
+    self.attributes = dict(attributes or {})
+    self._rules = {}
+    if rules:
+      self.load(rules)
+
+  def load(self, rules):
+    """ Replace all the rules. Everything is compiled before the old rules are swapped out. """
+    self._rules = dict((feature, self._compile(feature, feature_rules)) for feature, feature_rules in rules.items())
+
+  def set_rules(self, feature, rules):
+    """ Replace the rules for a single feature. """
+    compiled = dict(self._rules)
+    compiled[feature] = self._compile(feature, rules)
+    self._rules = compiled
+
+  def remove(self, feature):
+    compiled = dict(self._rules)
+    compiled.pop(feature, None)
+    self._rules = compiled
+
+  def _compile(self, feature, rules):
+    compiled = []
+    for rule in rules:
+      predicates = []
+      for attribute, allowed in rule.items():
+        if attribute == ACTIVE:
+          continue
+        if attribute not in self.attributes:
+          if not attribute.startswith(HEADER_PREFIX):
+            raise ValueError(u'Rule for {feature} uses {attribute}, but no such attribute was set up'.format(feature=feature, attribute=attribute))
+          self.attributes[attribute] = _header_getter(attribute[len(HEADER_PREFIX):])
+        predicates.append(_compile_condition(attribute, allowed))
+      compiled.append((tuple(predicates), bool(rule.get(ACTIVE, True))))
+    return tuple(compiled)
+
+  def lookup(self, feature, _context=None):
+    try:
+      rules = self._rules[feature]
+    except KeyError:
+      return FEATURE_NOT_FOUND
+
+    context = _context or _Context(self.attributes)
+    for predicates, active in rules:
+      for predicate in predicates:
+        if not predicate(context):
+          break
+      else:
+        return active
+
+    return False
+
+  def check_many(self, features):
+    # Share one context, so each attribute is only looked up once for the whole batch
+    context = _Context(self.attributes)
+    results = {}
+    for feature in features:
+      result = self.lookup(feature, context)
+      if result is not FEATURE_NOT_FOUND:
+        results[feature] = result
+    return results
@@ -0,0 +1,180 @@
+from __future__ import with_statement
+
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from flask.ext.featureflags import FEATURE_NOT_FOUND, LookupFlagHandler, log
+from flask.ext.featureflags.bus import ChangeNotifier
+from flask.ext.featureflags.cache import _timer
+
+# The file starts with a fixed header: magic, format version, (unused), generation. The flags follow as JSON.
+MAGIC = b'FFSS'
+FORMAT_VERSION = 1
+_HEADER = struct.Struct('<4sHHQ')
+_GENERATION = struct.Struct('<Q')
+_GENERATION_OFFSET = 8
+
+
+def _read_header(buf):
+  magic, version, _, generation = _HEADER.unpack_from(buf, 0)
+  if magic != MAGIC or version != FORMAT_VERSION:
+    raise ValueError(u"Not a feature flag snapshot (or one from a different version)")
+  return generation
+
+
+class _Snapshot(object):
+  """ One mapped snapshot file, and the flags decoded from it. """
+
+  def __init__(self, mapped, generation, flags):
+    self.mapped = mapped
+    self.generation = generation
+    self.flags = flags
+
+  @property
+  def current(self):
+    # The writer overwrites the generation in the old file once a new one has replaced it
+    return _GENERATION.unpack_from(self.mapped, _GENERATION_OFFSET)[0] == self.generation
+
+
+class SharedSnapshotFeatureFlag(LookupFlagHandler):
+  """ Answers checks from a snapshot file that one process writes (with SharedSnapshotWriter) and every worker
+  memory-maps, so a host full of workers doesn't hit your database once per worker.
+
+    handler = SharedSnapshotFeatureFlag('/dev/shm/feature_flags')
+    feature_flags.add_handler(handler)
+
+  Each check reads the generation counter out of the mapped file, and only decodes the flags again when the writer
+  has published a new snapshot. Features that aren't in the snapshot (or everything, if there's no snapshot yet)
+  are passed on to the next handler. """
+
+  # Checks are a read from memory, except for the occasional reload
+  blocking = False
+
+  def __init__(self, path, retry_interval=1.0):
+    self.path = path
+    # How long to wait before trying again if the file is missing or broken, so we don't open it on every check
+    self.retry_interval = retry_interval
+
+    self._snapshot = None
+    self._retry_at = None
+    self._lock = threading.Lock()
+    # Tells FeatureFlag when a new snapshot holds different flags
+    self.changes = ChangeNotifier()
+
+  @property
+  def generation(self):
+    """ The generation of the snapshot we're answering from, or None if we haven't loaded one. """
+    snapshot = self._snapshot
+    return snapshot.generation if snapshot is not None else None
+
+  def lookup(self, feature):
+    """ Same as calling the handler, but returns FEATURE_NOT_FOUND instead of raising NoFeatureFlagFound. """
+    return self._flags().get(feature, FEATURE_NOT_FOUND)
+
+  def check_many(self, features):
+    flags = self._flags()
+    return dict((feature, flags[feature]) for feature in features if feature in flags)
+
+  def reload(self):
+    """ Map the file again now, whether or not it's changed. """
+    with self._lock:
+      self._retry_at = None
+      return self._load()
+
+  def _flags(self):
+    snapshot = self._snapshot
+    if snapshot is not None and snapshot.current:
+      return snapshot.flags
+
+    with self._lock:
+      # Another thread may have reloaded while we waited
+      snapshot = self._snapshot
+      if snapshot is not None and snapshot.current:
+        return snapshot.flags
+      if self._retry_at is not None and _timer() < self._retry_at:
+        return snapshot.flags if snapshot is not None else {}
+      return self._load()
+
+  def _load(self):
+    try:
+      with open(self.path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+      generation = _read_header(mapped)
+      flags = json.loads(mapped[_HEADER.size:].decode('utf-8'))
+    except (IOError, OSError, ValueError, struct.error):
+      log.exception(u"Couldn't load the feature flag snapshot from %s", self.path)
+      self._retry_at = _timer() + self.retry_interval
+      snapshot = self._snapshot
+      return snapshot.flags if snapshot is not None else {}
+
+    # The old mapping isn't closed here: other threads may still be reading it, and it goes away with its last reference
+    old = self._snapshot
+    self._snapshot = _Snapshot(mapped, generation, flags)
+    self._retry_at = None
+    self.changes.notify_diff(old.flags if old is not None else {}, flags)
+    return flags
+
+
+class SharedSnapshotWriter(object):
+  """ Publishes snapshots for SharedSnapshotFeatureFlag. Run exactly one of these per file, typically in a small
+  refresher process:
+
+    writer = SharedSnapshotWriter('/dev/shm/feature_flags')
+    while True:
+      writer.write(load_flags_from_the_database())
+      time.sleep(30)
+
+  Each snapshot is written to a new file that atomically replaces the old one, so readers never see half of one.
+  The old file's generation is then bumped, which tells readers still mapping it to switch over. """
+
+  def __init__(self, path, mode=0o644):
+    self.path = path
+    self.mode = mode
+    self.generation = self._existing_generation()
+
+  def write(self, flags):
+    """ Publish {feature: True/False} as the new snapshot, and return its generation. """
+    generation = self.generation + 1
+    payload = json.dumps(dict((feature, bool(value)) for feature, value in flags.items()), sort_keys=True)
+
+    directory, name = os.path.split(os.path.abspath(self.path))
+    old = None
+    fd, temp_path = tempfile.mkstemp(prefix=u'.' + name + u'.', dir=directory)
+    try:
+      with os.fdopen(fd, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, 0, generation))
+        f.write(payload.encode('utf-8'))
+      os.chmod(temp_path, self.mode)
+
+      try:
+        old = open(self.path, 'r+b')
+      except (IOError, OSError):
+        old = None
+      os.rename(temp_path, self.path)
+    except Exception:
+      if old is not None:
+        old.close()
+      if os.path.exists(temp_path):
+        os.unlink(temp_path)
+      raise
+
+    if old is not None:
+      with old:
+        old.seek(_GENERATION_OFFSET)
+        old.write(_GENERATION.pack(generation))
+
+    self.generation = generation
+    return generation
+
+  def _existing_generation(self):
+    """ Carry on from the generation already on disk, so restarting the writer doesn't go backwards. """
+    try:
+      with open(self.path, 'rb') as f:
+        return _read_header(f.read(_HEADER.size))
+    except (IOError, OSError, ValueError, struct.error):
+      return 0
@@ -1,25 +1,209 @@
+import threading
+
 from sqlalchemy import Column, Integer, Boolean, String
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm.exc import NoResultFound
 from flask import current_app
-from flask.ext.featureflags import NoFeatureFlagFound, log
+from flask.ext.featureflags import FEATURE_NOT_FOUND, LookupFlagHandler, log
+from flask.ext.featureflags.bus import ChangeNotifier
+from flask.ext.featureflags.cache import FeatureFlagCache, MISSING as _MISSING, _frozen_dict, _timer
+
+
+class FlagSnapshot(object):
+  """ An immutable copy of the whole feature flag table, as of ``loaded_at``. """
+
+  def __init__(self, flags, loaded_at, load_seconds):
+    self.flags = _frozen_dict(flags)
+    self.loaded_at = loaded_at
+    self.load_seconds = load_seconds
 
 
-class SQLAlchemyFeatureFlags(object):
+class SQLAlchemyFeatureFlags(LookupFlagHandler):
 
-  def __init__(self, db, model=None):
+  def __init__(self, db, model=None, cache_ttl=None, cache_size=1024, snapshot=False, refresh_interval=None):
     if not model:
       model = self._make_model(db)
     self.model = model
 
-  def __call__(self, feature=None):
+    # Caching is off unless you ask for it, since it means other processes' writes take up to cache_ttl to show up
+    self.cache = None
+    if cache_ttl:
+      self.cache = FeatureFlagCache(ttl=cache_ttl, maxsize=cache_size)
+
+    # In snapshot mode we load every flag with one query and answer from memory, reloading
+    # every refresh_interval seconds (or only when refresh() is called, if there's no interval)
+    self.snapshot = snapshot
+    self.refresh_interval = refresh_interval
+    self._snapshot = None
+    # Set by invalidate(), so the next lookup reloads the snapshot
+    self._stale = False
+    self._refresh_lock = threading.Lock()
+    self.refresher = None
+    # Tells FeatureFlag when a refresh turns up different flags
+    self.changes = ChangeNotifier()
+
+    self.snapshot_loads = 0
+    self.snapshot_load_seconds = 0.0
+    self.snapshot_lookups = 0
+    self.snapshot_failures = 0
+
+  @property
+  def blocking(self):
+    """ Async checks run us in a thread pool, unless we're answering from a snapshot. """
+    return not self.snapshot
+
+  def lookup(self, feature):
+    """ Same as calling the handler, but returns FEATURE_NOT_FOUND instead of raising NoFeatureFlagFound. """
     if not current_app:
-      log.warn(u"Got a request to check for {feature} but we're outside the request context. Returning False".format(feature=feature))
+      log.warning(u"Got a request to check for %s but we're outside the request context. Returning False", feature)
       return False
 
+    if self.snapshot:
+      self.snapshot_lookups += 1
+      return self._current_snapshot().flags.get(feature, FEATURE_NOT_FOUND)
+
+    cache = self.cache
+    if cache is not None:
+      value = cache.get(feature)
+      if value is not _MISSING:
+        return value
+
     try:
-      return self.model.check(feature)
+      value = self.model.check(feature)
     except NoResultFound:
-      raise NoFeatureFlagFound()
+      value = FEATURE_NOT_FOUND
+
+    if cache is not None:
+      cache.set(feature, value)
+    return value
+
+  def check_many(self, features):
+    """ Look up several features with a single ``IN (...)`` query (or none at all, from the snapshot or cache).
+
+    Returns a dict of the features that exist. """
+    if not current_app:
+      log.warning(u"Got a request to check for %s but we're outside the request context. Returning False", features)
+      return dict((feature, False) for feature in features)
+
+    if self.snapshot:
+      self.snapshot_lookups += len(features)
+      flags = self._current_snapshot().flags
+      return dict((feature, flags[feature]) for feature in features if feature in flags)
+
+    results = {}
+    cache = self.cache
+    to_query = []
+
+    for feature in features:
+      value = cache.get(feature) if cache is not None else _MISSING
+      if value is _MISSING:
+        to_query.append(feature)
+      elif value is not FEATURE_NOT_FOUND:
+        results[feature] = value
+
+    if to_query:
+      queried = self._check_many(to_query)
+      results.update(queried)
+
+      if cache is not None:
+        for feature in to_query:
+          cache.set(feature, queried.get(feature, FEATURE_NOT_FOUND))
+
+    return results
+
+  def invalidate(self, feature=None):
+    """ Drop a feature (or all features) from the cache, e.g. after you've changed it in the database.
+
+    In snapshot mode, the whole snapshot is reloaded on the next lookup instead. """
+    if self.cache is not None:
+      self.cache.invalidate(feature)
+    if self._snapshot is not None:
+      self._stale = True
+
+  def refresh(self):
+    """ Load every flag from the database in a single query, and swap it in as the current snapshot.
+
+    Needs an app context. Returns the new snapshot. """
+    # Cleared before loading, so an invalidation that arrives mid-load isn't lost
+    self._stale = False
+    started = _timer()
+    flags = self._load_all()
+    finished = _timer()
+
+    snapshot = FlagSnapshot(flags, loaded_at=finished, load_seconds=finished - started)
+    old = self._snapshot
+    self._snapshot = snapshot
+    if old is not None:
+      self.changes.notify_diff(old.flags, snapshot.flags)
+
+    self.snapshot_loads += 1
+    self.snapshot_load_seconds += snapshot.load_seconds
+    return snapshot
+
+  def start_refresher(self, app, interval=None, scheduler=None):
+    """ Reload the snapshot in the background instead of inside whichever request notices it's expired.
+
+    See SnapshotRefresher for the arguments. Returns the running refresher. """
+    if self.refresher is not None:
+      self.refresher.stop()
+
+    self.snapshot = True
+    self.refresher = SnapshotRefresher(self, app, interval=interval or self.refresh_interval or 30, scheduler=scheduler)
+    self.refresher.start()
+    return self.refresher
+
+  def stop_refresher(self):
+    if self.refresher is not None:
+      self.refresher.stop()
+      self.refresher = None
+
+  def snapshot_stats(self):
+    """ How often the snapshot has been loaded and read, and what that cost. """
+    snapshot = self._snapshot
+    return {
+      'loads': self.snapshot_loads,
+      'total_load_seconds': self.snapshot_load_seconds,
+      'last_load_seconds': snapshot.load_seconds if snapshot else None,
+      'age_seconds': _timer() - snapshot.loaded_at if snapshot else None,
+      'size': len(snapshot.flags) if snapshot else 0,
+      'lookups': self.snapshot_lookups,
+      'failures': self.snapshot_failures,
+    }
+
+  def _current_snapshot(self):
+    snapshot = self._snapshot
+    if snapshot is None:
+      with self._refresh_lock:
+        # somebody else may have loaded it while we were waiting
+        return self._snapshot or self.refresh()
+
+    expired = self.refresher is None and self.refresh_interval and snapshot.loaded_at + self.refresh_interval <= _timer()
+    if self._stale or expired:
+      # Only one thread needs to do the reload; everybody else keeps using the old snapshot meanwhile
+      if self._refresh_lock.acquire(False):
+        try:
+          snapshot = self.refresh()
+        except SQLAlchemyError:
+          # Better to serve slightly stale flags than to fail the request
+          self._stale = True
+          self.snapshot_failures += 1
+          log.exception(u"Couldn't refresh the feature flag snapshot, using the one from %s seconds ago", _timer() - snapshot.loaded_at)
+        finally:
+          self._refresh_lock.release()
+
+    return snapshot
+
+  def _check_many(self, features):
+    if hasattr(self.model, 'check_many'):
+      return self.model.check_many(features)
+    rows = self.model.query.filter(self.model.feature.in_(features))
+    return dict((row.feature, row.is_active) for row in rows)
+
+  def _load_all(self):
+    """ Return a {feature: is_active} dict of everything in the table. """
+    if hasattr(self.model, 'load_all'):
+      return self.model.load_all()
+    return dict((row.feature, row.is_active) for row in self.model.query.all())
 
   def _make_model(self, db):
 
@@ -33,4 +217,85 @@ class SQLAlchemyFeatureFlags(object):
         r = cls.query.filter_by(feature=feature).one()
         return r.is_active
 
+      @classmethod
+      def check_many(cls, features):
+        return dict(cls.query.with_entities(cls.feature, cls.is_active).filter(cls.feature.in_(features)))
+
+      @classmethod
+      def load_all(cls):
+        return dict(cls.query.with_entities(cls.feature, cls.is_active))
+
     return FeatureFlag
+
+
+class SnapshotRefresher(object):
+  """ Reloads a SQLAlchemyFeatureFlags snapshot every ``interval`` seconds, inside its own app context.
+
+  By default this runs in a daemon thread. If you already have a scheduler, pass ``scheduler``: it's called
+  as ``scheduler(refresher.run_once, interval)`` and may return a function that cancels the job, which we'll
+  call from stop().
+
+  New snapshots are swapped in whole, so readers never wait and never see a half-loaded table. If the
+  database is unavailable, the previous snapshot is kept until a reload succeeds. """
+
+  def __init__(self, handler, app, interval=30, scheduler=None):
+    self.handler = handler
+    self.app = app
+    self.interval = interval
+    self.scheduler = scheduler
+
+    self._stopped = threading.Event()
+    self._thread = None
+    self._cancel = None
+
+  @property
+  def running(self):
+    if self.scheduler is not None:
+      return self._cancel is not None and not self._stopped.is_set()
+    return self._thread is not None and self._thread.is_alive()
+
+  def start(self):
+    """ Load the snapshot right away, then keep it fresh in the background. """
+    self._stopped.clear()
+    self.run_once()
+
+    if self.scheduler is not None:
+      self._cancel = self.scheduler(self.run_once, self.interval) or (lambda: None)
+    else:
+      self._thread = threading.Thread(target=self._run, name=u'feature-flag-refresher')
+      self._thread.daemon = True
+      self._thread.start()
+
+  def stop(self, timeout=None):
+    """ Stop refreshing. The last snapshot stays in place. """
+    self._stopped.set()
+
+    if self._cancel is not None:
+      self._cancel()
+      self._cancel = None
+
+    if self._thread is not None:
+      if self._thread is not threading.current_thread():
+        self._thread.join(timeout)
+      self._thread = None
+
+  def run_once(self):
+    """ Reload the snapshot once. Returns True if it worked. """
+    try:
+      with self.app.app_context():
+        self.handler.refresh()
+    except Exception:
+      # Keep serving the old snapshot; we'll try again next time around
+      self.handler.snapshot_failures += 1
+      log.exception(u"Couldn't refresh the feature flag snapshot in the background")
+      return False
+    return True
+
+  def _run(self):
+    while True:
+      # Wakes up as soon as we're stopped, instead of sleeping out the interval. (Don't use what wait() returns:
+      # it's always None on python 2.6.)
+      self._stopped.wait(self.interval)
+      if self._stopped.is_set():
+        return
+      self.run_once()
@@ -0,0 +1,219 @@
+"""
+Template helpers for feature flags.
+"""
+import threading
+
+from flask import current_app
+from jinja2 import nodes
+from jinja2.ext import Extension
+from jinja2.lexer import Token
+
+try:
+  from collections import OrderedDict
+except ImportError:  # python 2.6
+  from ordereddict import OrderedDict
+
+try:
+  from jinja2 import pass_context
+except ImportError:  # jinja2 < 3.0
+  from jinja2 import contextfilter as pass_context
+
+from flask_featureflags import EXTENSION_NAME, FEATURE_FLAGS_CONFIG, STATIC_FEATURE_FLAGS, FeatureFlag
+
+JINJA_TEST_NAME = FeatureFlag.JINJA_TEST_NAME
+
+# The template filter that rewritten tests call
+CHECK_FILTER = u'_feature_flags_check'
+
+
+def check_filter(check):
+  """ Wrap FeatureFlag.check as a filter jinja won't run at compile time; it never does for filters that take the
+  template context. """
+  @pass_context
+  def feature_flags_check(context, feature):
+    return check(feature)
+  return feature_flags_check
+
+
+def static_flags(config):
+  """ {feature: True/False} for the flags in FEATURE_FLAGS that STATIC_FEATURE_FLAGS says never change.
+
+  STATIC_FEATURE_FLAGS is either a list of flag names, or True for every flag in FEATURE_FLAGS. """
+  static = config.get(STATIC_FEATURE_FLAGS)
+  flags = config.get(FEATURE_FLAGS_CONFIG) or {}
+  if not static:
+    return {}
+  if static is True:
+    static = flags
+  return dict((feature, bool(flags[feature])) for feature in static if feature in flags)
+
+
+class FeatureFlagsExtension(Extension):
+  """ Rewrites ``'feature' is active_feature`` tests when a template is compiled.
+
+  Left alone, Jinja's optimizer runs tests on constants (like a feature name written into the template) while it
+  compiles, and bakes in whatever the flag happened to be at the time. So checks on a feature name are turned into
+  a filter that calls FeatureFlag.check when the template is rendered, like any other check.
+
+  Flags listed in STATIC_FEATURE_FLAGS are different: they never change, so the test is folded into ``true`` or
+  ``false``, straight from FEATURE_FLAGS. The ``if`` around it then compiles to a constant test, and Python leaves
+  the branch that can never run out of the compiled template altogether, so static flags cost nothing at render
+  time, even inside loops.
+
+  FeatureFlag.init_app adds this extension for you. """
+
+  def filter_stream(self, stream):
+    app = getattr(self.environment, 'app', None)
+    flags = static_flags(app.config) if app is not None else {}
+    return _rewrite(list(stream), flags)
+
+
+def _is_name(token, value):
+  return token.type == 'name' and token.value == value
+
+
+def _rewrite(tokens, flags):
+  i = 0
+  count = len(tokens)
+  while i < count:
+    token = tokens[i]
+
+    # Looking for: string, "is", optionally "not", the test name - and no arguments after it
+    if token.type == 'string' and i + 2 < count and _is_name(tokens[i + 1], u'is'):
+      negated = _is_name(tokens[i + 2], u'not')
+      test = i + 3 if negated else i + 2
+      after = test + 1
+      matches = (test < count and _is_name(tokens[test], JINJA_TEST_NAME) and
+                 (after >= count or tokens[after].type != 'lparen') and
+                 # two strings in a row are joined together, so this one isn't the whole feature name
+                 (i == 0 or tokens[i - 1].type != 'string'))
+      if matches:
+        for rewritten in _replacement(token, negated, flags):
+          yield rewritten
+        i = after
+        continue
+
+    yield token
+    i += 1
+
+
+def _replacement(token, negated, flags):
+  lineno = token.lineno
+  if token.value in flags:
+    yield Token(lineno, 'name', u'true' if flags[token.value] != negated else u'false')
+    return
+
+  # ((not) 'feature'|CHECK_FILTER), in brackets so it can go anywhere the test could
+  yield Token(lineno, 'lparen', u'(')
+  if negated:
+    yield Token(lineno, 'name', u'not')
+  yield token
+  yield Token(lineno, 'pipe', u'|')
+  yield Token(lineno, 'name', CHECK_FILTER)
+  yield Token(lineno, 'rparen', u')')
+
+
+class FragmentCache(object):
+  """ Rendered template fragments, keyed on a name and the state of the flags they depend on.
+
+  A fragment is rendered again whenever one of its flags comes out differently, and FeatureFlag.notify_changed
+  drops fragments that depend on the flag that changed. The least recently used fragments are dropped once there
+  are more than ``maxsize``. """
+
+  def __init__(self, maxsize=256):
+    self.maxsize = maxsize
+    self.hits = 0
+    self.misses = 0
+
+    self._data = OrderedDict()
+    # feature -> keys of the fragments that depend on it
+    self._by_feature = {}
+    self._lock = threading.Lock()
+
+  def __len__(self):
+    return len(self._data)
+
+  def get_or_render(self, name, states, render):
+    """ The fragment cached for ``name`` and ``states`` (a {feature: True/False} dict), or ``render()`` if we
+    don't have one yet. """
+    key = (name, tuple(sorted(states.items())))
+    with self._lock:
+      try:
+        # re-inserting moves it to the most recently used end
+        self._data[key] = fragment = self._data.pop(key)
+        self.hits += 1
+        return fragment
+      except KeyError:
+        self.misses += 1
+
+    # Render outside the lock; two threads might render the same fragment, but nobody waits on anybody else
+    fragment = render()
+
+    with self._lock:
+      self._data.pop(key, None)
+      self._data[key] = fragment
+      for feature in states:
+        self._by_feature.setdefault(feature, set()).add(key)
+
+      while len(self._data) > self.maxsize:
+        self._forget(next(iter(self._data)))
+    return fragment
+
+  def invalidate(self, feature=None):
+    """ Drop the fragments that depend on a feature, or every fragment if no feature is given. """
+    with self._lock:
+      if feature is None:
+        self._data.clear()
+        self._by_feature.clear()
+        return
+      for key in list(self._by_feature.get(feature, ())):
+        self._forget(key)
+
+  def stats(self):
+    return {
+      'hits': self.hits,
+      'misses': self.misses,
+      'size': len(self._data),
+      'maxsize': self.maxsize,
+    }
+
+  def _forget(self, key):
+    self._data.pop(key, None)
+    for feature, _ in key[1]:
+      keys = self._by_feature.get(feature)
+      if keys is not None:
+        keys.discard(key)
+        if not keys:
+          del self._by_feature[feature]
+
+
+class FragmentCacheExtension(Extension):
+  """ Adds a ``flagcache`` tag, which caches what's inside it for as long as the flags it depends on don't change::
+
+    {% flagcache 'sidebar' using 'new_sidebar', 'beta_banner' %}
+      ...expensive stuff that depends on those flags...
+    {% endflagcache %}
+
+  The flags are looked up with FeatureFlag.check_many when the tag is rendered, and the fragments are kept in the
+  FeatureFlag's ``fragments`` cache. FeatureFlag.init_app adds this extension for you. """
+
+  tags = set(['flagcache'])
+
+  def parse(self, parser):
+    lineno = next(parser.stream).lineno
+    name = parser.parse_expression()
+
+    features = []
+    if parser.stream.skip_if('name:using'):
+      features.append(parser.parse_expression())
+      while parser.stream.skip_if('comma'):
+        features.append(parser.parse_expression())
+
+    body = parser.parse_statements(['name:endflagcache'], drop_needle=True)
+    call = self.call_method('_render_fragment', [name, nodes.List(features)])
+    return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+  def _render_fragment(self, name, features, caller):
+    feature_flagger = current_app.extensions[EXTENSION_NAME]
+    states = feature_flagger.check_many(features) if features else {}
+    return feature_flagger.fragments.get_or_render(name, states, caller)
@@ -0,0 +1,174 @@
+"""
+Counting which feature flags get checked, and how they come out.
+"""
+import logging
+import threading
+import weakref
+
+log = logging.getLogger(u'flask-featureflags')
+
+
+class UsageTracker(object):
+  """ Counts how many times each feature is checked, and how many of those checks came out on and off.
+
+  Each thread counts into its own dict, so recording a check never waits on a lock. The dicts are merged when
+  you read the counts, and a thread's dict is folded into a shared one when the thread finishes, so servers that
+  start a thread per request don't pile them up. Call flush() (or start_flusher()) to hand the counts since the last flush to your
+  exporters and start again; all-time counts are kept too, so you can find flags nobody checks any more. """
+
+  def __init__(self):
+    self._local = threading.local()
+    self._lock = threading.Lock()
+
+    # Bumped by flush(); a thread that sees a new generation starts a fresh dict
+    self._generation = 0
+    # Counts from threads that have finished since the last flush; always the first shard
+    self._retired = {}
+    self._shards = [self._retired]
+    self._totals = {}
+    # Weak references to each thread's _ShardOwner, which tell us when the thread is gone
+    self._owners = set()
+
+    self.exporters = []
+    self._flusher = None
+    self._stop_flusher = threading.Event()
+
+  def record(self, feature, result):
+    local = self._local
+    if getattr(local, 'generation', None) != self._generation:
+      counts = self._new_shard()
+    else:
+      counts = local.counts
+
+    entry = counts.get(feature)
+    if entry is None:
+      entry = counts[feature] = [0, 0]
+    entry[0 if result else 1] += 1
+
+  def _new_shard(self):
+    counts = {}
+    owner = _ShardOwner()
+    with self._lock:
+      generation = self._generation
+      self._shards.append(counts)
+      self._owners.add(weakref.ref(owner, lambda ref: self._retire(ref, counts, generation)))
+
+    # Outside the lock: replacing an old owner retires its shard, which takes the lock
+    local = self._local
+    local.counts = counts
+    local.generation = generation
+    local.owner = owner
+    return counts
+
+  def _retire(self, ref, counts, generation):
+    """ A thread finished (or moved on to a new generation): fold its shard into the shared one. """
+    with self._lock:
+      self._owners.discard(ref)
+      if generation != self._generation:
+        # Already handed over by flush()
+        return
+      for i, shard in enumerate(self._shards):
+        if shard is counts:
+          del self._shards[i]
+          break
+      else:
+        return
+      retired = self._retired
+      for feature, (true, false) in counts.copy().items():
+        entry = retired.get(feature)
+        if entry is None:
+          entry = retired[feature] = [0, 0]
+        entry[0] += true
+        entry[1] += false
+
+  def counts(self):
+    """ {feature: {'checks': n, 'true': n, 'false': n}} since the last flush. """
+    with self._lock:
+      shards = list(self._shards)
+    return _merge(shards)
+
+  def totals(self):
+    """ Same as counts(), but since the tracker was created. """
+    with self._lock:
+      shards = list(self._shards)
+      totals = dict((feature, list(entry)) for feature, entry in self._totals.items())
+    return _merge(shards, totals)
+
+  def unused(self, features):
+    """ Which of these features have never been checked. """
+    totals = self.totals()
+    return [feature for feature in features if feature not in totals]
+
+  def flush(self):
+    """ Start counting afresh, give the counts since the last flush to every exporter, and return them.
+
+    Checks that are being recorded at the same moment may be missed, which is the price of not locking. """
+    with self._lock:
+      shards = self._shards
+      self._retired = {}
+      self._shards = [self._retired]
+      self._generation += 1
+
+    counts = _merge(shards)
+
+    with self._lock:
+      for feature, entry in counts.items():
+        total = self._totals.setdefault(feature, [0, 0])
+        total[0] += entry['true']
+        total[1] += entry['false']
+
+    for exporter in list(self.exporters):
+      try:
+        exporter(counts)
+      except Exception:
+        log.exception(u"Feature flag usage exporter %r failed", exporter)
+
+    return counts
+
+  def add_exporter(self, exporter):
+    """ Call ``exporter(counts)`` every time the counts are flushed. """
+    self.exporters.append(exporter)
+
+  def start_flusher(self, interval=60):
+    """ Flush every ``interval`` seconds from a daemon thread, so exporting never holds up a request. """
+    self.stop_flusher()
+    self._stop_flusher.clear()
+    self._flusher = threading.Thread(target=self._run_flusher, args=(interval,), name=u'feature-flag-usage-flusher')
+    self._flusher.daemon = True
+    self._flusher.start()
+
+  def stop_flusher(self, flush=True):
+    """ Stop the flusher thread, flushing one last time unless told not to. """
+    if self._flusher is None:
+      return
+    self._stop_flusher.set()
+    self._flusher.join()
+    self._flusher = None
+    if flush:
+      self.flush()
+
+  def _run_flusher(self, interval):
+    while True:
+      # Don't use what wait() returns: it's always None on python 2.6
+      self._stop_flusher.wait(interval)
+      if self._stop_flusher.is_set():
+        return
+      self.flush()
+
+
+class _ShardOwner(object):
+  """ Kept in a thread's locals; it goes away when the thread does. """
+  __slots__ = ('__weakref__',)
+
+
+def _merge(shards, totals=None):
+  merged = totals or {}
+  for shard in shards:
+    # copy() is atomic, so the owning thread can keep counting while we read
+    for feature, (true, false) in shard.copy().items():
+      entry = merged.setdefault(feature, [0, 0])
+      entry[0] += true
+      entry[1] += false
+
+  return dict((feature, {'checks': true + false, 'true': true, 'false': false})
+              for feature, (true, false) in merged.items())
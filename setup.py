@@ -2,7 +2,7 @@ import codecs
 import os
 import re
 from setuptools import setup
-from sys import argv
+from sys import argv, version_info
 
 here = os.path.abspath(os.path.dirname(__file__))
 
@@ -49,12 +49,17 @@ setup(
   packages=[
     'flask_featureflags',
     'flask_featureflags.contrib',
+    'flask_featureflags.contrib.file',
     'flask_featureflags.contrib.inline',
+    'flask_featureflags.contrib.redis',
+    'flask_featureflags.contrib.rollout',
+    'flask_featureflags.contrib.rules',
+    'flask_featureflags.contrib.shared',
     'flask_featureflags.contrib.sqlalchemy',
   ],
   install_requires=[
     'Flask',
-    ],
+    ] + (['ordereddict'] if version_info < (2, 7) else []),
   classifiers=[
     'Development Status :: 3 - Alpha',
     'Environment :: Web Environment',
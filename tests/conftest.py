@@ -0,0 +1,12 @@
+import sys
+
+# async def is a syntax error before python 3.5, so don't even try to import these
+collect_ignore = []
+if sys.version_info < (3, 5):
+  collect_ignore.append('test_async.py')
+
+# concurrent checks need the "futures" backport on python 2
+try:
+  import concurrent.futures
+except ImportError:
+  collect_ignore.append('test_concurrent_checks.py')
@@ -0,0 +1,156 @@
+from __future__ import with_statement
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import flask_featureflags as feature_flags
+from flask_featureflags.contrib.file import FileFeatureFlag
+
+from tests.fixtures import app
+from tests.fixtures import feature_setup
+
+try:
+  import yaml
+except ImportError:
+  yaml = None
+
+try:
+  import tomllib as toml
+except ImportError:
+  try:
+    import toml
+  except ImportError:
+    toml = None
+
+
+class FileFeatureFlagTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.path = os.path.join(self.directory, 'flags.json')
+    self.write({'on': True, 'off': False})
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def write(self, flags, path=None):
+    with open(path or self.path, 'w') as f:
+      f.write(flags if isinstance(flags, str) else json.dumps(flags))
+
+  def test_reads_flags(self):
+    handler = FileFeatureFlag(self.path)
+    self.assertTrue(handler('on'))
+    self.assertFalse(handler('off'))
+    self.assertRaises(feature_flags.NoFeatureFlagFound, handler, 'missing')
+    self.assertTrue(handler.lookup('missing') is feature_flags.FEATURE_NOT_FOUND)
+
+  def test_check_many(self):
+    handler = FileFeatureFlag(self.path)
+    self.assertEqual(handler.check_many(['on', 'off', 'missing']), {'on': True, 'off': False})
+
+  def test_changes_are_picked_up(self):
+    handler = FileFeatureFlag(self.path, check_interval=0)
+    self.write({'on': False, 'new': True})
+    self.assertFalse(handler('on'))
+    self.assertTrue(handler('new'))
+
+  def test_replaced_file_is_picked_up(self):
+    handler = FileFeatureFlag(self.path, check_interval=0)
+    temp_path = os.path.join(self.directory, 'new.json')
+    self.write({'on': False, 'off': True}, path=temp_path)
+    os.rename(temp_path, self.path)
+    self.assertFalse(handler('on'))
+
+  def test_file_is_not_parsed_again_if_it_has_not_changed(self):
+    handler = FileFeatureFlag(self.path, check_interval=0)
+    flags = handler._flags
+    handler('on')
+    self.assertTrue(handler._flags is flags)
+
+  def test_file_is_only_checked_every_interval(self):
+    handler = FileFeatureFlag(self.path, check_interval=3600)
+    self.write({'on': False})
+    self.assertTrue(handler('on'))
+
+    handler.reload()
+    self.assertFalse(handler('on'))
+
+  def test_invalidate_checks_the_file_on_the_next_lookup(self):
+    handler = FileFeatureFlag(self.path, check_interval=3600)
+    self.write({'on': False})
+    handler.invalidate('on')
+    self.assertFalse(handler('on'))
+
+  def test_changes_are_reported(self):
+    handler = FileFeatureFlag(self.path, check_interval=0)
+    changed = []
+    handler.changes.add_listener(changed.append)
+
+    self.write({'on': True, 'off': True})
+    handler('on')
+    self.assertEqual(changed, ['off'])
+
+    # Rewritten, but the same flags
+    self.write({'off': True, 'on': True})
+    handler.reload()
+    self.assertEqual(changed, ['off'])
+
+  def test_broken_changes_keep_the_old_flags(self):
+    handler = FileFeatureFlag(self.path, check_interval=0)
+    self.write('{"on": fal')
+    self.assertTrue(handler('on'))
+
+    self.write(['on'])
+    self.assertTrue(handler('on'))
+
+  def test_values_must_be_booleans(self):
+    for value in (u'false', u'off', u'0', 1, None):
+      self.write({'on': True, 'quoted': value})
+      self.assertRaises(ValueError, FileFeatureFlag, self.path)
+
+  def test_non_boolean_changes_keep_the_old_flags(self):
+    handler = FileFeatureFlag(self.path, check_interval=0)
+    self.write({'on': u'false'})
+    self.assertTrue(handler('on'))
+
+  def test_broken_file_at_startup_raises(self):
+    self.write('{"on": fal')
+    self.assertRaises(ValueError, FileFeatureFlag, self.path)
+    self.assertRaises(EnvironmentError, FileFeatureFlag, os.path.join(self.directory, 'nope.json'))
+
+  def test_unknown_format(self):
+    self.assertRaises(ValueError, FileFeatureFlag, os.path.join(self.directory, 'flags.ini'))
+
+  def test_format_can_be_given(self):
+    path = os.path.join(self.directory, 'flags')
+    self.write({'on': True}, path=path)
+    self.assertTrue(FileFeatureFlag(path, format='json')('on'))
+
+  # Only defined when the parser is installed, since python 2.6's unittest can't skip tests
+  if yaml is not None:
+    def test_yaml(self):
+      path = os.path.join(self.directory, 'flags.yml')
+      self.write('on_feature: true\noff_feature: false\n', path=path)
+      handler = FileFeatureFlag(path)
+      self.assertTrue(handler('on_feature'))
+      self.assertFalse(handler('off_feature'))
+
+  if toml is not None:
+    def test_toml(self):
+      path = os.path.join(self.directory, 'flags.toml')
+      self.write('on_feature = true\noff_feature = false\n', path=path)
+      handler = FileFeatureFlag(path)
+      self.assertTrue(handler('on_feature'))
+      self.assertFalse(handler('off_feature'))
+
+  def test_in_the_handler_chain(self):
+    handler = FileFeatureFlag(self.path)
+    feature_setup.add_handler(handler)
+    try:
+      with app.test_request_context('/'):
+        self.assertTrue(feature_flags.is_active('on'))
+    finally:
+      feature_setup.remove_handler(handler)
@@ -1,5 +1,6 @@
 import unittest
 
+from flask import Flask
 import flask_featureflags as feature_flags
 from flask_featureflags.contrib.inline import InlineFeatureFlag
 
@@ -40,3 +41,35 @@ class InlineFeatureFlagTest(unittest.TestCase):
   def test_flag_not_found_raise_handler_exception(self):
     self.assertRaises(feature_flags.NoFeatureFlagFound,
                       inline_feature_flag, "NOT_FOUND")
+
+  def test_check_many(self):
+    self.assertEqual(inline_feature_flag.check_many(["ACTIVE", "INACTIVE", "NOT_FOUND"]),
+                     {"ACTIVE": True, "INACTIVE": False})
+
+
+class BetaEverywhere(InlineFeatureFlag):
+  """ An old-style customisation: overrides __call__, and knows nothing about lookup """
+
+  def __call__(self, feature):
+    if feature == 'beta':
+      return True
+    return super(BetaEverywhere, self).__call__(feature)
+
+
+class SubclassedInlineFeatureFlagTest(unittest.TestCase):
+
+  def setUp(self):
+    self.app = Flask(__name__)
+    self.feature_flagger = feature_flags.FeatureFlag(self.app)
+    self.feature_flagger.handlers = [BetaEverywhere()]
+
+  def test_overridden_call_is_still_used(self):
+    with self.app.test_request_context('/'):
+      self.assertTrue(feature_flags.is_active('beta'))
+      self.assertEqual(feature_flags.is_active_many(['beta', 'other']), {'beta': True, 'other': False})
+
+  def test_handlers_that_do_not_override_call_use_lookup(self):
+    handler = InlineFeatureFlag()
+    lookup, check_many = feature_flags._handler_methods(handler)
+    self.assertEqual(lookup, handler.lookup)
+    self.assertEqual(check_many, handler.check_many)
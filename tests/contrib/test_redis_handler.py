@@ -0,0 +1,253 @@
+import socket
+import sys
+import types
+import unittest
+
+import flask_featureflags as feature_flags
+from flask_featureflags.contrib.redis import RedisFeatureFlag
+
+from tests.fixtures import app
+from tests.fixtures import feature_setup
+
+
+class FakeRedis(object):
+  """ Stands in for a Redis server and client, in memory. Counts round trips so we can tell what got batched. """
+
+  def __init__(self):
+    self.data = {}
+    self.round_trips = 0
+
+  def get(self, key):
+    self.round_trips += 1
+    return self.data.get(key)
+
+  def mget(self, keys):
+    self.round_trips += 1
+    return [self.data.get(key) for key in keys]
+
+  def set(self, key, value):
+    self.round_trips += 1
+    self.data[key] = value.encode('utf-8')
+
+  def delete(self, key):
+    self.round_trips += 1
+    self.data.pop(key, None)
+
+  def pipeline(self, transaction=True):
+    return FakePipeline(self)
+
+
+class UnreachableRedis(FakeRedis):
+  """ A FakeRedis whose reads fail once it's been told the server is down """
+
+  def __init__(self):
+    super(UnreachableRedis, self).__init__()
+    self.down = False
+
+  def get(self, key):
+    if self.down:
+      raise socket.error(u'Connection refused')
+    return super(UnreachableRedis, self).get(key)
+
+  def mget(self, keys):
+    if self.down:
+      raise socket.error(u'Connection refused')
+    return super(UnreachableRedis, self).mget(keys)
+
+
+class FakeRedisModule(types.ModuleType):
+  """ Stands in for the redis package, remembering how the handler built its client """
+
+  class RedisError(Exception):
+    pass
+
+  def __init__(self):
+    super(FakeRedisModule, self).__init__('redis')
+    self.pools = []
+    module = self
+
+    class ConnectionPool(object):
+      @classmethod
+      def from_url(cls, url, **options):
+        pool = cls()
+        pool.url, pool.options = url, options
+        module.pools.append(pool)
+        return pool
+
+    class StrictRedis(FakeRedis):
+      def __init__(self, connection_pool=None):
+        super(StrictRedis, self).__init__()
+        self.connection_pool = connection_pool
+
+    self.ConnectionPool = ConnectionPool
+    self.StrictRedis = StrictRedis
+
+
+class FakeClock(object):
+
+  def __init__(self):
+    self.now = 0.0
+
+  def __call__(self):
+    return self.now
+
+
+class FakePipeline(object):
+
+  def __init__(self, server):
+    self.server = server
+    self.commands = []
+
+  def set(self, key, value):
+    self.commands.append((key, value))
+
+  def execute(self):
+    self.server.round_trips += 1
+    for key, value in self.commands:
+      self.server.data[key] = value.encode('utf-8')
+    self.commands = []
+
+
+class RedisFeatureFlagTest(unittest.TestCase):
+
+  def setUp(self):
+    self.server = FakeRedis()
+    self.server.data = {u'feature_flags:on': b'1', u'feature_flags:off': b'0', u'feature_flags:yes': b'true'}
+    self.handler = RedisFeatureFlag(client=self.server)
+
+  def test_reads_flags(self):
+    self.assertTrue(self.handler('on'))
+    self.assertFalse(self.handler('off'))
+    self.assertTrue(self.handler('yes'))
+    self.assertRaises(feature_flags.NoFeatureFlagFound, self.handler, 'missing')
+    self.assertTrue(self.handler.lookup('missing') is feature_flags.FEATURE_NOT_FOUND)
+
+  def test_check_many_is_one_round_trip(self):
+    self.assertEqual(self.handler.check_many(['on', 'off', 'missing']), {'on': True, 'off': False})
+    self.assertEqual(self.server.round_trips, 1)
+
+  def test_without_a_cache_every_check_goes_to_the_server(self):
+    self.handler('on')
+    self.handler('on')
+    self.assertEqual(self.server.round_trips, 2)
+
+  def test_near_cache(self):
+    handler = RedisFeatureFlag(client=self.server, cache_ttl=60)
+    self.assertTrue(handler('on'))
+    self.assertTrue(handler.lookup('missing') is feature_flags.FEATURE_NOT_FOUND)
+    self.server.data['feature_flags:on'] = b'0'
+
+    self.assertTrue(handler('on'))
+    self.assertTrue(handler.lookup('missing') is feature_flags.FEATURE_NOT_FOUND)
+    self.assertEqual(self.server.round_trips, 2)
+
+    handler.invalidate('on')
+    self.assertFalse(handler('on'))
+
+  def test_check_many_only_fetches_what_is_not_cached(self):
+    handler = RedisFeatureFlag(client=self.server, cache_ttl=60)
+    handler('on')
+    self.assertEqual(handler.check_many(['on', 'off', 'missing']), {'on': True, 'off': False})
+    self.assertEqual(handler.check_many(['on', 'off', 'missing']), {'on': True, 'off': False})
+    self.assertEqual(self.server.round_trips, 2)
+
+  def test_writes_drop_the_cached_value(self):
+    handler = RedisFeatureFlag(client=self.server, cache_ttl=60)
+    self.assertTrue(handler('on'))
+
+    handler.set('on', False)
+    self.assertFalse(handler('on'))
+
+    handler.delete('on')
+    self.assertTrue(handler.lookup('on') is feature_flags.FEATURE_NOT_FOUND)
+
+  def test_set_many_is_pipelined(self):
+    handler = RedisFeatureFlag(client=self.server, cache_ttl=60)
+    handler('on')
+    self.server.round_trips = 0
+
+    handler.set_many({'on': False, 'new': True})
+    self.assertEqual(self.server.round_trips, 1)
+    self.assertFalse(handler('on'))
+    self.assertTrue(handler('new'))
+
+  def test_prefix(self):
+    handler = RedisFeatureFlag(client=self.server, prefix=u'myapp:')
+    handler.set('on', True)
+    self.assertEqual(self.server.data['myapp:on'], b'1')
+
+  def test_in_the_handler_chain(self):
+    feature_setup.add_handler(self.handler)
+    try:
+      with app.test_request_context('/'):
+        self.assertTrue(feature_flags.is_active('on'))
+        self.assertEqual(feature_flags.is_active_many(['yes', 'off']), {'yes': True, 'off': False})
+    finally:
+      feature_setup.remove_handler(self.handler)
+
+
+class DefaultClientTest(unittest.TestCase):
+
+  def setUp(self):
+    self.real_redis = sys.modules.get('redis')
+    self.redis = sys.modules['redis'] = FakeRedisModule()
+
+  def tearDown(self):
+    if self.real_redis is None:
+      del sys.modules['redis']
+    else:
+      sys.modules['redis'] = self.real_redis
+
+  def test_client_is_made_from_the_url_with_a_shared_pool(self):
+    handler = RedisFeatureFlag(url=u'redis://flags.internal:6379/2', max_connections=5)
+
+    self.assertTrue(isinstance(handler.client, self.redis.StrictRedis))
+    self.assertEqual(len(self.redis.pools), 1)
+    self.assertTrue(handler.client.connection_pool is self.redis.pools[0])
+    self.assertEqual(self.redis.pools[0].url, u'redis://flags.internal:6379/2')
+    self.assertEqual(self.redis.pools[0].options, {'max_connections': 5})
+
+  def test_redis_errors_are_caught_by_default(self):
+    handler = RedisFeatureFlag()
+    self.assertEqual(handler.errors, (self.redis.RedisError, socket.error))
+
+
+class RedisOutageTest(unittest.TestCase):
+
+  def setUp(self):
+    self.server = UnreachableRedis()
+    self.server.data = {u'feature_flags:on': b'1', u'feature_flags:off': b'0'}
+
+  def test_without_a_cache_features_are_passed_on(self):
+    handler = RedisFeatureFlag(client=self.server)
+    self.server.down = True
+    self.assertTrue(handler.lookup('on') is feature_flags.FEATURE_NOT_FOUND)
+    self.assertRaises(feature_flags.NoFeatureFlagFound, handler, 'on')
+    self.assertEqual(handler.check_many(['on', 'off']), {})
+
+  def test_expired_answers_are_served_while_redis_is_down(self):
+    handler = RedisFeatureFlag(client=self.server, cache_ttl=5)
+    clock = handler.cache.timer = FakeClock()
+    self.assertTrue(handler('on'))
+    self.assertFalse(handler('off'))
+
+    clock.now = 60
+    self.server.down = True
+    self.assertTrue(handler('on'))
+    self.assertEqual(handler.check_many(['on', 'off', 'never_seen']), {'on': True, 'off': False})
+    self.assertTrue(handler.lookup('never_seen') is feature_flags.FEATURE_NOT_FOUND)
+
+    # Back up: fresh answers again
+    self.server.down = False
+    self.server.data[u'feature_flags:on'] = b'0'
+    self.assertFalse(handler('on'))
+
+  def test_outage_does_not_fail_the_request(self):
+    handler = RedisFeatureFlag(client=self.server)
+    self.server.down = True
+    feature_setup.add_handler(handler)
+    try:
+      with app.test_request_context('/'):
+        self.assertFalse(feature_flags.is_active('on'))
+    finally:
+      feature_setup.remove_handler(handler)
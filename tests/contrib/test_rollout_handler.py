@@ -0,0 +1,92 @@
+import unittest
+
+import flask_featureflags as feature_flags
+from flask_featureflags.contrib.rollout import PercentageRolloutFeatureFlag, BUCKETS
+
+from tests.fixtures import app
+from tests.fixtures import feature_setup
+
+
+class CurrentUser(object):
+  """ Stands in for whatever the app uses to find out who's logged in """
+
+  def __init__(self):
+    self.id = None
+
+  def __call__(self):
+    return self.id
+
+
+class PercentageRolloutFeatureFlagTest(unittest.TestCase):
+
+  def setUp(self):
+    self.user = CurrentUser()
+    self.rollout = PercentageRolloutFeatureFlag({'five': 5, 'none': 0, 'all': 100}, key_func=self.user)
+
+  def _active_users(self, feature, users=10000):
+    active = set()
+    for user_id in range(users):
+      self.user.id = user_id
+      if self.rollout(feature):
+        active.add(user_id)
+    return active
+
+  def test_roughly_the_right_percentage_of_users_get_the_feature(self):
+    active = len(self._active_users('five'))
+    self.assertTrue(400 < active < 600, u'%s users out of 10000 got a 5%% feature' % active)
+
+  def test_zero_and_one_hundred_percent(self):
+    self.assertEqual(len(self._active_users('none', users=100)), 0)
+    self.assertEqual(len(self._active_users('all', users=100)), 100)
+
+  def test_buckets_are_stable(self):
+    # These must never change, or users would flip between old and new behavior on upgrade
+    self.assertEqual(self.rollout.bucket('five', 42), self.rollout.bucket('five', u'42'))
+    self.assertEqual(self.rollout.bucket('five', 42), PercentageRolloutFeatureFlag().bucket('five', 42))
+    self.assertTrue(0 <= self.rollout.bucket('five', 42) < BUCKETS)
+
+  def test_raising_the_percentage_only_adds_users(self):
+    before = self._active_users('five', users=2000)
+    self.rollout.set_percentage('five', 20)
+    after = self._active_users('five', users=2000)
+    self.assertTrue(before < after)
+
+  def test_features_are_rolled_out_to_different_users(self):
+    self.rollout.set_percentage('other', 5)
+    overlap = self._active_users('five') & self._active_users('other')
+    # Independent 5% rollouts should share about 0.25% of users, not all of them
+    self.assertTrue(len(overlap) < 100, u'%s users got both features' % len(overlap))
+
+  def test_unknown_features_are_not_found(self):
+    self.assertRaises(feature_flags.NoFeatureFlagFound, self.rollout, 'unknown')
+    self.assertTrue(self.rollout.lookup('unknown') is feature_flags.FEATURE_NOT_FOUND)
+
+  def test_no_key_means_no_feature(self):
+    self.assertFalse(self.rollout('five'))
+
+  def test_percentage_must_be_sensible(self):
+    self.assertRaises(ValueError, self.rollout.set_percentage, 'bad', 101)
+    self.assertRaises(ValueError, self.rollout.set_percentage, 'bad', -1)
+
+  def test_percentage_and_remove(self):
+    self.assertEqual(self.rollout.percentage('five'), 5)
+    self.rollout.remove('five')
+    self.assertTrue(self.rollout.percentage('five') is None)
+
+
+class RolloutChainTest(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(cls):
+    cls.rollout = PercentageRolloutFeatureFlag({'all': 100, 'none': 0})
+    feature_setup.add_handler(cls.rollout)
+
+  @classmethod
+  def tearDownClass(cls):
+    feature_setup.clear_handlers()
+
+  def test_works_in_the_handler_chain_with_the_default_key(self):
+    with app.test_request_context('/', environ_base={'REMOTE_ADDR': '10.0.0.1'}):
+      self.assertTrue(feature_flags.is_active('all'))
+      self.assertFalse(feature_flags.is_active('none'))
+      self.assertEqual(feature_flags.is_active_many(['all', 'none']), {'all': True, 'none': False})
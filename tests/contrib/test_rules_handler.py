@@ -0,0 +1,110 @@
+import unittest
+
+import flask_featureflags as feature_flags
+from flask_featureflags.contrib.rules import RulesFeatureFlag
+
+from tests.fixtures import app
+from tests.fixtures import feature_setup
+
+
+class FakeUser(object):
+  id = None
+  groups = ()
+  country = None
+
+
+class RulesFeatureFlagTest(unittest.TestCase):
+
+  def setUp(self):
+    self.user = FakeUser()
+    self.lookups = []
+
+    def user_id():
+      self.lookups.append('user_id')
+      return self.user.id
+
+    self.handler = RulesFeatureFlag({
+      'beta': [
+        {'country': 'NZ', 'active': False},
+        {'user_id': range(100000)},
+        {'groups': ['staff', 'admin']},
+        {'header:X-Beta': '1'},
+      ],
+      'kiwis_only': [
+        {'country': ['NZ'], 'groups': 'staff'},
+      ],
+    }, attributes={
+      'user_id': user_id,
+      'groups': lambda: self.user.groups,
+      'country': lambda: self.user.country,
+    })
+
+    self.ctx = app.test_request_context('/')
+    self.ctx.push()
+
+  def tearDown(self):
+    self.ctx.pop()
+
+  def test_allowlisted_users_get_the_feature(self):
+    self.user.id = 99999
+    self.assertTrue(self.handler('beta'))
+
+    self.user.id = 100000
+    self.assertFalse(self.handler('beta'))
+
+  def test_any_of_a_users_groups_can_match(self):
+    self.user.groups = ['users', 'admin']
+    self.assertTrue(self.handler('beta'))
+
+  def test_first_matching_rule_wins(self):
+    self.user.id = 1
+    self.user.country = 'NZ'
+    self.assertFalse(self.handler('beta'))
+
+  def test_every_condition_in_a_rule_must_match(self):
+    self.user.country = 'NZ'
+    self.assertFalse(self.handler('kiwis_only'))
+    self.user.groups = ['staff']
+    self.assertTrue(self.handler('kiwis_only'))
+
+  def test_headers(self):
+    with app.test_request_context('/', headers={'X-Beta': '1'}):
+      self.assertTrue(self.handler('beta'))
+
+  def test_attributes_are_looked_up_once_per_batch(self):
+    self.user.id = 5
+    self.assertEqual(self.handler.check_many(['beta', 'kiwis_only', 'unknown']), {'beta': True, 'kiwis_only': False})
+    self.assertEqual(self.lookups, ['user_id'])
+
+  def test_features_without_rules_are_not_found(self):
+    self.assertRaises(feature_flags.NoFeatureFlagFound, self.handler, 'unknown')
+
+  def test_unknown_attributes_are_caught_when_loading(self):
+    self.assertRaises(ValueError, self.handler.set_rules, 'broken', [{'shoe_size': 12}])
+    self.assertRaises(feature_flags.NoFeatureFlagFound, self.handler, 'broken')
+
+  def test_rules_can_be_replaced(self):
+    self.handler.set_rules('beta', [{'country': 'AU'}])
+    self.user.country = 'AU'
+    self.assertTrue(self.handler('beta'))
+
+    self.handler.remove('beta')
+    self.assertRaises(feature_flags.NoFeatureFlagFound, self.handler, 'beta')
+
+
+class RulesChainTest(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(cls):
+    feature_setup.add_handler(RulesFeatureFlag({'beta': [{'header:X-Beta': '1'}]}))
+
+  @classmethod
+  def tearDownClass(cls):
+    feature_setup.clear_handlers()
+
+  def test_works_in_the_handler_chain(self):
+    with app.test_request_context('/', headers={'X-Beta': '1'}):
+      self.assertTrue(feature_flags.is_active('beta'))
+
+    with app.test_request_context('/'):
+      self.assertFalse(feature_flags.is_active('beta'))
@@ -0,0 +1,106 @@
+from __future__ import with_statement
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import flask_featureflags as feature_flags
+from flask_featureflags.contrib.shared import SharedSnapshotFeatureFlag, SharedSnapshotWriter
+
+from tests.fixtures import app
+from tests.fixtures import feature_setup
+
+
+class SharedSnapshotTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.path = os.path.join(self.directory, 'flags')
+    self.writer = SharedSnapshotWriter(self.path)
+    self.handler = SharedSnapshotFeatureFlag(self.path, retry_interval=0)
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def test_reads_what_the_writer_wrote(self):
+    self.assertEqual(self.writer.write({'on': True, 'off': False}), 1)
+
+    self.assertTrue(self.handler('on'))
+    self.assertFalse(self.handler('off'))
+    self.assertEqual(self.handler.generation, 1)
+    self.assertRaises(feature_flags.NoFeatureFlagFound, self.handler, 'missing')
+    self.assertTrue(self.handler.lookup('missing') is feature_flags.FEATURE_NOT_FOUND)
+
+  def test_check_many(self):
+    self.writer.write({'on': True, 'off': False})
+    self.assertEqual(self.handler.check_many(['on', 'off', 'missing']), {'on': True, 'off': False})
+
+  def test_new_snapshots_are_picked_up(self):
+    self.writer.write({'feature': False})
+    self.assertFalse(self.handler('feature'))
+
+    self.writer.write({'feature': True})
+    self.assertTrue(self.handler('feature'))
+
+    # Several writes between checks still land on the latest one
+    self.writer.write({'feature': False})
+    self.writer.write({'feature': True, 'other': True})
+    self.assertTrue(self.handler('other'))
+    self.assertEqual(self.handler.generation, 4)
+
+  def test_flags_are_only_decoded_when_the_generation_changes(self):
+    self.writer.write({'feature': True})
+    self.handler('feature')
+    flags = self.handler._snapshot.flags
+
+    self.handler('feature')
+    self.assertTrue(self.handler._snapshot.flags is flags)
+
+  def test_changes_are_reported(self):
+    changed = []
+    self.handler.changes.add_listener(changed.append)
+
+    self.writer.write({'feature': False, 'other': True})
+    self.handler('feature')
+    self.writer.write({'feature': True, 'other': True})
+    self.handler('feature')
+    self.assertEqual(changed, [None, 'feature'])
+
+  def test_no_snapshot_yet(self):
+    self.assertTrue(self.handler.lookup('feature') is feature_flags.FEATURE_NOT_FOUND)
+
+    self.writer.write({'feature': True})
+    self.assertTrue(self.handler('feature'))
+
+  def test_missing_file_is_retried_later(self):
+    handler = SharedSnapshotFeatureFlag(self.path, retry_interval=3600)
+    self.assertTrue(handler.lookup('feature') is feature_flags.FEATURE_NOT_FOUND)
+
+    self.writer.write({'feature': True})
+    self.assertTrue(handler.lookup('feature') is feature_flags.FEATURE_NOT_FOUND)
+    self.assertTrue(handler.reload()['feature'])
+
+  def test_broken_file_is_not_loaded(self):
+    with open(self.path, 'wb') as f:
+      f.write(b'not a snapshot at all')
+    self.assertTrue(self.handler.lookup('feature') is feature_flags.FEATURE_NOT_FOUND)
+
+  def test_new_writer_carries_on_from_the_existing_generation(self):
+    self.writer.write({'feature': True})
+    self.writer.write({'feature': True})
+    self.assertEqual(SharedSnapshotWriter(self.path).write({'feature': False}), 3)
+
+  def test_only_the_snapshot_is_left_behind(self):
+    self.writer.write({'feature': True})
+    self.writer.write({'feature': False})
+    self.assertEqual(os.listdir(self.directory), ['flags'])
+
+  def test_in_the_handler_chain(self):
+    self.writer.write({'feature': True})
+    feature_setup.add_handler(self.handler)
+    try:
+      with app.test_request_context('/'):
+        self.assertTrue(feature_flags.is_active('feature'))
+    finally:
+      feature_setup.remove_handler(self.handler)
@@ -1,10 +1,15 @@
 # -*- coding: utf-8 -*-
+import operator
+import sys
+import time
 import unittest
 
 from flask.ext.sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import SQLAlchemyError
 
 import flask_featureflags as feature_flags
-from flask_featureflags.contrib.sqlalchemy import SQLAlchemyFeatureFlags
+from flask_featureflags.cache import _timer
+from flask_featureflags.contrib.sqlalchemy import SQLAlchemyFeatureFlags, FeatureFlagCache, _MISSING
 
 from tests.fixtures import app, feature_setup
 
@@ -48,3 +53,279 @@ class SQLAlchemyFeatureFlagTest(unittest.TestCase):
   def test_flag_not_found_raise_handler_exception(self):
     self.assertRaises(feature_flags.NoFeatureFlagFound,
                       SQLAlchemyHandler, 'not_found')
+
+  def test_check_many(self):
+    self.assertEqual(SQLAlchemyHandler.check_many(['active', 'inactive', 'not_found']),
+                     {'active': True, 'inactive': False})
+
+  def test_is_active_many(self):
+    self.assertEqual(feature_flags.is_active_many(['active', 'inactive', 'not_found']),
+                     {'active': True, 'inactive': False, 'not_found': False})
+
+
+class FakeTimer(object):
+  def __init__(self):
+    self.now = 0
+
+  def __call__(self):
+    return self.now
+
+
+class FeatureFlagCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.timer = FakeTimer()
+    self.cache = FeatureFlagCache(ttl=10, maxsize=2, timer=self.timer)
+
+  def test_entries_expire_after_ttl(self):
+    self.cache.set('a', True)
+    self.assertTrue(self.cache.get('a'))
+
+    self.timer.now = 10
+    self.assertTrue(self.cache.get('a') is _MISSING)
+    self.assertEqual(self.cache.hits, 1)
+    self.assertEqual(self.cache.misses, 1)
+
+  def test_least_recently_used_entry_is_evicted(self):
+    self.cache.set('a', True)
+    self.cache.set('b', True)
+    self.cache.get('a')
+    self.cache.set('c', True)
+
+    self.assertTrue(self.cache.get('b') is _MISSING)
+    self.assertTrue(self.cache.get('a'))
+    self.assertTrue(self.cache.get('c'))
+    self.assertEqual(self.cache.evictions, 1)
+    self.assertEqual(len(self.cache), 2)
+
+
+class CachedSQLAlchemyFeatureFlagTest(unittest.TestCase):
+
+  def setUp(self):
+    self.app_ctx = app.app_context()
+    self.app_ctx.push()
+    db.create_all()
+    db.session.add(SQLAlchemyHandler.model(feature='active', is_active=True))
+    db.session.commit()
+
+    self.handler = SQLAlchemyFeatureFlags(db, model=SQLAlchemyHandler.model, cache_ttl=60)
+
+  def tearDown(self):
+    db.session.close()
+    db.drop_all()
+    self.app_ctx.pop()
+
+  def _set_flag(self, feature, is_active):
+    SQLAlchemyHandler.model.query.filter_by(feature=feature).update({'is_active': is_active})
+    db.session.commit()
+
+  def test_cached_value_is_served_until_invalidated(self):
+    self.assertTrue(self.handler('active'))
+    self._set_flag('active', False)
+    self.assertTrue(self.handler('active'))
+
+    self.handler.invalidate('active')
+    self.assertFalse(self.handler('active'))
+    self.assertEqual(self.handler.cache.stats()['hits'], 1)
+    self.assertEqual(self.handler.cache.stats()['misses'], 2)
+
+  def test_missing_flags_are_cached_too(self):
+    self.assertRaises(feature_flags.NoFeatureFlagFound, self.handler, 'not_found')
+
+    db.session.add(SQLAlchemyHandler.model(feature='not_found', is_active=True))
+    db.session.commit()
+
+    self.assertRaises(feature_flags.NoFeatureFlagFound, self.handler, 'not_found')
+    self.assertEqual(self.handler.cache.hits, 1)
+
+  def test_check_many_fills_and_uses_the_cache(self):
+    self.assertEqual(self.handler.check_many(['active', 'not_found']), {'active': True})
+    self._set_flag('active', False)
+
+    self.assertEqual(self.handler.check_many(['active', 'not_found']), {'active': True})
+    self.assertEqual(self.handler.cache.hits, 2)
+
+  def test_cache_is_off_by_default(self):
+    self.assertTrue(SQLAlchemyHandler.cache is None)
+
+
+class SnapshotSQLAlchemyFeatureFlagTest(unittest.TestCase):
+
+  def setUp(self):
+    self.app_ctx = app.app_context()
+    self.app_ctx.push()
+    db.create_all()
+    db.session.add_all([SQLAlchemyHandler.model(feature='active', is_active=True),
+                        SQLAlchemyHandler.model(feature='inactive')])
+    db.session.commit()
+
+    self.handler = SQLAlchemyFeatureFlags(db, model=SQLAlchemyHandler.model, snapshot=True, refresh_interval=60)
+
+  def tearDown(self):
+    db.session.close()
+    db.drop_all()
+    self.app_ctx.pop()
+
+  def _set_flag(self, feature, is_active):
+    SQLAlchemyHandler.model.query.filter_by(feature=feature).update({'is_active': is_active})
+    db.session.commit()
+
+  def test_flags_are_answered_from_one_load(self):
+    self.assertTrue(self.handler('active'))
+    self.assertFalse(self.handler('inactive'))
+    self.assertRaises(feature_flags.NoFeatureFlagFound, self.handler, 'not_found')
+
+    stats = self.handler.snapshot_stats()
+    self.assertEqual(stats['loads'], 1)
+    self.assertEqual(stats['lookups'], 3)
+    self.assertEqual(stats['size'], 2)
+
+  # No read-only dicts before python 3.3 (and no unittest.skipIf before 2.7)
+  if sys.version_info >= (3, 3):
+    def test_snapshot_is_read_only(self):
+      snapshot = self.handler.refresh()
+      self.assertRaises(TypeError, operator.setitem, snapshot.flags, 'active', False)
+
+  def test_check_many_reads_the_snapshot(self):
+    self.assertEqual(self.handler.check_many(['active', 'inactive', 'not_found']),
+                     {'active': True, 'inactive': False})
+    self.assertEqual(self.handler.snapshot_loads, 1)
+
+  def test_snapshot_is_reloaded_on_demand(self):
+    self.assertTrue(self.handler('active'))
+    self._set_flag('active', False)
+    self.assertTrue(self.handler('active'))
+
+    self.handler.refresh()
+    self.assertFalse(self.handler('active'))
+
+  def test_invalidate_reloads_the_snapshot(self):
+    self.assertTrue(self.handler('active'))
+    self._set_flag('active', False)
+
+    self.handler.invalidate('active')
+    self.assertFalse(self.handler('active'))
+    self.assertEqual(self.handler.snapshot_loads, 2)
+
+    self.handler('active')
+    self.assertEqual(self.handler.snapshot_loads, 2)
+
+  def test_notify_changed_reaches_the_snapshot(self):
+    feature_setup.add_handler(self.handler)
+    try:
+      with app.test_request_context('/'):
+        self.assertTrue(feature_flags.is_active('active'))
+      self._set_flag('active', False)
+
+      feature_setup.notify_changed('active')
+      with app.test_request_context('/'):
+        self.assertFalse(feature_flags.is_active('active'))
+    finally:
+      feature_setup.remove_handler(self.handler)
+
+  def test_refresh_reports_changes(self):
+    self.handler.refresh()
+    changed = []
+    self.handler.changes.add_listener(changed.append)
+
+    self.handler.refresh()
+    self.assertEqual(changed, [])
+
+    self._set_flag('active', False)
+    self.handler.refresh()
+    self.assertEqual(changed, ['active'])
+
+  def test_snapshot_is_reloaded_after_the_refresh_interval(self):
+    self.assertTrue(self.handler('active'))
+    self._set_flag('active', False)
+
+    self.handler._snapshot.loaded_at -= 60
+    self.assertFalse(self.handler('active'))
+    self.assertEqual(self.handler.snapshot_loads, 2)
+
+
+class ManualScheduler(object):
+  """ Lets the test decide when the refresher's job runs """
+
+  def __init__(self):
+    self.job = None
+    self.cancelled = False
+
+  def __call__(self, job, interval):
+    self.job = job
+    return self.cancel
+
+  def cancel(self):
+    self.cancelled = True
+
+
+class SnapshotRefresherTest(unittest.TestCase):
+
+  def setUp(self):
+    self.app_ctx = app.app_context()
+    self.app_ctx.push()
+    db.create_all()
+    db.session.add(SQLAlchemyHandler.model(feature='active', is_active=True))
+    db.session.commit()
+
+    self.handler = SQLAlchemyFeatureFlags(db, model=SQLAlchemyHandler.model, snapshot=True, refresh_interval=60)
+
+  def tearDown(self):
+    self.handler.stop_refresher()
+    db.session.close()
+    db.drop_all()
+    self.app_ctx.pop()
+
+  def test_refresher_loads_the_snapshot_on_its_schedule(self):
+    scheduler = ManualScheduler()
+    self.handler.start_refresher(app, scheduler=scheduler)
+    self.assertEqual(self.handler.snapshot_loads, 1)
+    self.assertTrue(self.handler('active'))
+
+    SQLAlchemyHandler.model.query.filter_by(feature='active').update({'is_active': False})
+    db.session.commit()
+
+    # Expired snapshots aren't reloaded inline when there's a refresher
+    self.handler._snapshot.loaded_at -= 60
+    self.assertTrue(self.handler('active'))
+
+    scheduler.job()
+    self.assertFalse(self.handler('active'))
+
+    self.handler.stop_refresher()
+    self.assertTrue(scheduler.cancelled)
+
+  def test_old_snapshot_is_kept_if_the_database_is_unavailable(self):
+    scheduler = ManualScheduler()
+    self.handler.start_refresher(app, scheduler=scheduler)
+
+    def broken_load_all():
+      raise SQLAlchemyError(u'database went away')
+    self.handler._load_all = broken_load_all
+
+    self.assertFalse(scheduler.job())
+    self.assertTrue(self.handler('active'))
+    self.assertEqual(self.handler.snapshot_failures, 1)
+
+  def test_inline_refresh_falls_back_to_the_old_snapshot(self):
+    self.assertTrue(self.handler('active'))
+
+    def broken_load_all():
+      raise SQLAlchemyError(u'database went away')
+    self.handler._load_all = broken_load_all
+
+    self.handler._snapshot.loaded_at -= 60
+    self.assertTrue(self.handler('active'))
+    self.assertEqual(self.handler.snapshot_failures, 1)
+
+  def test_background_thread_stops_cleanly(self):
+    refresher = self.handler.start_refresher(app, interval=0.01)
+    self.assertTrue(refresher.running)
+
+    deadline = _timer() + 5
+    while self.handler.snapshot_loads + self.handler.snapshot_failures < 2 and _timer() < deadline:
+      time.sleep(0.01)
+
+    self.handler.stop_refresher()
+    self.assertFalse(refresher.running)
+    self.assertTrue(self.handler('active'))
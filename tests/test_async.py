@@ -0,0 +1,229 @@
+from __future__ import with_statement
+
+import asyncio
+import threading
+import unittest
+import warnings
+
+from flask import Flask, render_template_string
+from werkzeug.exceptions import NotFound
+import flask_featureflags as feature_flags
+
+from .fixtures import FEATURE_NAME, FLAG_CONFIG
+
+
+def run(coroutine):
+  loop = asyncio.new_event_loop()
+  try:
+    return loop.run_until_complete(coroutine)
+  finally:
+    loop.close()
+
+
+class SlowAsyncHandler(object):
+  """ Pretends to wait on the network, and keeps track of what it was doing """
+
+  def __init__(self, answer, delay=0.05):
+    self.answer = answer
+    self.delay = delay
+    self.started = 0
+    self.cancelled = 0
+
+  async def lookup_async(self, feature):
+    self.started += 1
+    try:
+      await asyncio.sleep(self.delay)
+    except asyncio.CancelledError:
+      self.cancelled += 1
+      raise
+    return self.answer
+
+  def __call__(self, feature):
+    return self.answer
+
+
+class ThreadRecordingHandler(object):
+  """ A regular blocking handler that remembers which thread it was run on """
+
+  def __init__(self, answer):
+    self.answer = answer
+    self.threads = []
+
+  def __call__(self, feature):
+    self.threads.append(threading.current_thread())
+    if self.answer is None:
+      raise feature_flags.NoFeatureFlagFound()
+    return self.answer
+
+
+class TestCheckAsync(unittest.TestCase):
+
+  def setUp(self):
+    self.app = Flask(__name__)
+    self.app.config[FLAG_CONFIG] = {FEATURE_NAME: True, u'off': False}
+    self.app.config[feature_flags.CACHE_FEATURES_PER_REQUEST] = False
+    self.feature_flagger = feature_flags.FeatureFlag(self.app)
+
+  def test_same_answers_as_check(self):
+    with self.app.test_request_context('/'):
+      self.assertTrue(run(feature_flags.is_active_async(FEATURE_NAME)))
+      self.assertFalse(run(feature_flags.is_active_async(u'off')))
+      self.assertFalse(run(feature_flags.is_active_async(u'missing')))
+
+  def test_async_handlers_run_concurrently(self):
+    handlers = [SlowAsyncHandler(feature_flags.FEATURE_NOT_FOUND, delay=0.2) for _ in range(5)]
+    self.feature_flagger.handlers = handlers + [feature_flags.AppConfigFlagHandler]
+
+    with self.app.test_request_context('/'):
+      loop = asyncio.new_event_loop()
+      try:
+        started = loop.time()
+        self.assertTrue(loop.run_until_complete(self.feature_flagger.check_async(FEATURE_NAME)))
+        elapsed = loop.time() - started
+      finally:
+        loop.close()
+
+    self.assertTrue(elapsed < 0.5, u'Five 0.2s handlers took %.2fs, so they ran one after another' % elapsed)
+
+  def test_chain_order_still_decides(self):
+    stopper = SlowAsyncHandler(feature_flags.STOP_CHECKING, delay=0.05)
+    later = SlowAsyncHandler(True, delay=1)
+    self.feature_flagger.handlers = [stopper, later]
+
+    with self.app.test_request_context('/'):
+      self.assertFalse(run(self.feature_flagger.check_async(FEATURE_NAME)))
+
+    # the slow handler was started, but cancelled as soon as the answer was known
+    self.assertEqual(later.started, 1)
+    self.assertEqual(later.cancelled, 1)
+
+  def test_blocking_handlers_run_in_a_thread_pool_inside_the_request(self):
+    handler = ThreadRecordingHandler(None)
+    self.feature_flagger.handlers = [handler, feature_flags.AppConfigFlagHandler]
+
+    with self.app.test_request_context('/'):
+      self.assertTrue(run(self.feature_flagger.check_async(FEATURE_NAME)))
+
+    self.assertEqual(len(handler.threads), 1)
+    self.assertNotEqual(handler.threads[0], threading.current_thread())
+
+  def test_blocking_handlers_dont_tear_down_the_request(self):
+    torn_down = []
+    self.app.teardown_request(lambda exc: torn_down.append(u'request'))
+    self.app.teardown_appcontext(lambda exc: torn_down.append(u'app'))
+    self.feature_flagger.handlers = [ThreadRecordingHandler(None), feature_flags.AppConfigFlagHandler]
+
+    with self.app.test_request_context('/'):
+      self.assertTrue(run(self.feature_flagger.check_async(FEATURE_NAME)))
+      self.assertEqual(torn_down, [])
+
+    self.assertEqual(torn_down, [u'request', u'app'])
+
+  def test_sync_checks_skip_async_handlers(self):
+    async def always_on(feature):
+      return True
+
+    class AsyncCallable(object):
+      async def __call__(self, feature):
+        return True
+
+    self.feature_flagger.handlers = [always_on, AsyncCallable(), feature_flags.AppConfigFlagHandler]
+
+    with warnings.catch_warnings(record=True) as caught:
+      warnings.simplefilter('always')
+      with self.app.test_request_context('/'):
+        self.assertFalse(self.feature_flagger.check(u'off'))
+        self.assertFalse(feature_flags.is_active(u'missing'))
+        self.assertTrue(self.feature_flagger.check(FEATURE_NAME))
+        self.assertEqual(render_template_string(u"{% if 'off' is active_feature %}on{% endif %}"), u'')
+        self.assertEqual(self.feature_flagger.check_many([u'off']), {u'off': False})
+
+        # Async checks still use them
+        self.assertTrue(run(self.feature_flagger.check_async(u'off')))
+    self.assertEqual([w for w in caught if 'never awaited' in str(w.message)], [])
+
+  def test_results_are_cached_for_the_request(self):
+    self.app.config[feature_flags.CACHE_FEATURES_PER_REQUEST] = True
+    handler = ThreadRecordingHandler(True)
+    self.feature_flagger.handlers = [handler]
+
+    with self.app.test_request_context('/'):
+      self.assertTrue(run(self.feature_flagger.check_async(FEATURE_NAME)))
+      self.assertTrue(self.feature_flagger.check(FEATURE_NAME))
+
+    self.assertEqual(len(handler.threads), 1)
+
+
+class TestAsyncDecorator(unittest.TestCase):
+
+  def setUp(self):
+    self.app = Flask(__name__)
+    self.app.config[FLAG_CONFIG] = {FEATURE_NAME: True, u'off': False}
+    self.feature_flagger = feature_flags.FeatureFlag(self.app)
+
+    @self.app.route('/old')
+    def old():
+      return u'old'
+
+  def test_async_view_runs_if_feature_is_on(self):
+    @feature_flags.is_active_feature(FEATURE_NAME)
+    async def view():
+      return u'OK'
+
+    with self.app.test_request_context('/'):
+      self.assertEqual(run(view()), u'OK')
+
+  def test_async_view_404s_if_feature_is_off(self):
+    @feature_flags.is_active_feature(u'off')
+    async def view():
+      return u'OK'
+
+    with self.app.test_request_context('/'):
+      self.assertRaises(NotFound, run, view())
+
+  def test_async_view_redirects_if_feature_is_off(self):
+    @feature_flags.is_active_feature(u'off', redirect='old')
+    async def view():
+      return u'OK'
+
+    with self.app.test_request_context('/'):
+      response = run(view())
+      self.assertEqual(response.status_code, 302)
+
+  def test_async_view_responses_are_cached(self):
+    from flask_featureflags.cache import FeatureFlagCache
+    calls = []
+
+    @feature_flags.is_active_feature(FEATURE_NAME, flags=[u'off'], etag=True, cache=FeatureFlagCache(ttl=60))
+    async def view():
+      calls.append(1)
+      return u'OK'
+
+    for _ in range(2):
+      with self.app.test_request_context('/'):
+        response = run(view())
+        self.assertEqual(response.get_data(), b'OK')
+        self.assertTrue(response.headers['ETag'])
+    self.assertEqual(len(calls), 1)
+
+  def test_bound_decorator_on_async_views(self):
+    @self.feature_flagger.is_active_feature(u'off', redirect='old')
+    async def view():
+      return u'OK'
+
+    with self.app.test_request_context('/'):
+      response = run(view())
+      self.assertEqual(response.status_code, 302)
+      self.assertTrue(response.location.endswith(u'/old'))
+
+  def test_async_cache_is_keyed_on_vary_headers(self):
+    from flask import request
+    from flask_featureflags.cache import FeatureFlagCache
+
+    @feature_flags.is_active_feature(FEATURE_NAME, vary=[u'Authorization'], cache=FeatureFlagCache(ttl=60))
+    async def view():
+      return u'hello %s' % request.headers.get(u'Authorization')
+
+    for user in (u'alice', u'bob'):
+      with self.app.test_request_context('/', headers={'Authorization': user}):
+        self.assertEqual(run(view()).get_data(), (u'hello %s' % user).encode('utf-8'))
@@ -0,0 +1,99 @@
+from __future__ import with_statement
+
+import unittest
+
+from flask import Flask
+import flask_featureflags as feature_flags
+
+from .fixtures import FLAG_CONFIG, AlwaysOffFlagHandler
+
+
+class BatchFlagHandler(object):
+  """ Knows about whatever's in its dict, and remembers how it was asked """
+
+  def __init__(self, flags):
+    self.flags = flags
+    self.batches = []
+
+  def __call__(self, feature):
+    try:
+      return self.flags[feature]
+    except KeyError:
+      raise feature_flags.NoFeatureFlagFound()
+
+  def check_many(self, features):
+    self.batches.append(list(features))
+    return dict((f, self.flags[f]) for f in features if f in self.flags)
+
+
+class TestBatchChecks(unittest.TestCase):
+
+  def setUp(self):
+    self.app = Flask(__name__)
+    self.app.config[FLAG_CONFIG] = {u'on': True, u'off': False}
+    self.feature_flagger = feature_flags.FeatureFlag(self.app)
+
+  def test_default_handler_answers_a_batch(self):
+    with self.app.test_request_context('/'):
+      results = feature_flags.is_active_many([u'on', u'off', u'missing'])
+      self.assertEqual(results, {u'on': True, u'off': False, u'missing': False})
+
+  def test_batch_answers_match_single_answers(self):
+    self.feature_flagger.add_handler(BatchFlagHandler({u'off': True}))
+    self.feature_flagger.add_handler(lambda feature: feature == u'missing')
+
+    features = [u'on', u'off', u'missing', u'really missing']
+    with self.app.test_request_context('/'):
+      many = self.feature_flagger.check_many(features)
+
+    self.app.config[feature_flags.CACHE_FEATURES_PER_REQUEST] = False
+    with self.app.test_request_context('/'):
+      single = dict((feature, self.feature_flagger.check(feature)) for feature in features)
+
+    self.assertEqual(many, single)
+
+  def test_batch_handlers_only_see_unresolved_features(self):
+    batch_handler = BatchFlagHandler({u'b': True})
+    self.feature_flagger.add_handler(batch_handler)
+
+    with self.app.test_request_context('/'):
+      self.feature_flagger.check_many([u'on', u'off', u'b'])
+
+    self.assertEqual(batch_handler.batches, [[u'off', u'b']])
+
+  def test_stopping_the_chain_turns_everything_off(self):
+    self.feature_flagger.clear_handlers()
+    self.feature_flagger.add_handler(AlwaysOffFlagHandler)
+    self.feature_flagger.add_handler(feature_flags.AppConfigFlagHandler)
+
+    with self.app.test_request_context('/'):
+      self.assertEqual(feature_flags.is_active_many([u'on']), {u'on': False})
+
+  def test_missing_features_are_signalled(self):
+    missing = []
+
+    def signal_handler(sender, feature):
+      missing.append(feature)
+
+    feature_flags.missing_feature.connect(signal_handler)
+    try:
+      with self.app.test_request_context('/'):
+        feature_flags.is_active_many([u'on', u'missing'])
+    finally:
+      feature_flags.missing_feature.disconnect(signal_handler)
+
+    self.assertEqual(missing, [u'missing'])
+
+  def test_batch_results_are_cached_for_the_request(self):
+    batch_handler = BatchFlagHandler({u'b': True})
+    self.feature_flagger.add_handler(batch_handler)
+
+    with self.app.test_request_context('/'):
+      self.feature_flagger.check_many([u'b', u'b'])
+      self.assertTrue(self.feature_flagger.check(u'b'))
+      self.feature_flagger.check_many([u'b'])
+
+    self.assertEqual(batch_handler.batches, [[u'b']])
+
+  def test_checking_many_outside_request_context_returns_false(self):
+    self.assertEqual(feature_flags.is_active_many([u'on']), {u'on': False})
@@ -0,0 +1,18 @@
+import unittest
+
+from benchmarks import bench_flag_checks
+
+
+class TestBenchmarksRun(unittest.TestCase):
+  """ We don't care about the numbers here, just that the benchmarks don't rot. """
+
+  def test_every_benchmark_runs(self):
+    results = bench_flag_checks.run(repeat=1, scale=0.001)
+
+    for name, number, setup in bench_flag_checks.BENCHMARKS:
+      if not name.startswith('sqlalchemy'):
+        self.assertTrue(name in results['results'], u'%s did not run' % name)
+
+  def test_filter(self):
+    results = bench_flag_checks.run(names=['is_active_feature.on'], repeat=1, scale=0.001)
+    self.assertEqual(list(results['results']), ['is_active_feature.on'])
@@ -5,6 +5,8 @@ import unittest
 from flask import url_for
 from .fixtures import app, feature_setup, FEATURE_NAME, AlwaysOnFlagHandler, AlwaysOffFlagHandler, FEATURE_IS_ON, FLAG_CONFIG
 
+import flask_featureflags as feature_flags
+
 
 class TestHandlerChaining(unittest.TestCase):
 
@@ -76,3 +78,81 @@ class TestHandlerChaining(unittest.TestCase):
       response = self.test_client.get(url)
       assert response.status_code == 404, u'Unexpected status code'
       assert FEATURE_IS_ON not in response.data.decode(u'utf-8')
+
+
+class TestSentinelHandlers(unittest.TestCase):
+
+  def setUp(self):
+    app.config[FLAG_CONFIG] = {FEATURE_NAME: True}
+    app.config['TESTING'] = True
+    self.app = app
+
+  def tearDown(self):
+    feature_setup.clear_handlers()
+    feature_setup.add_handler(feature_flags.AppConfigFlagHandler)
+
+  def test_returning_stop_checking_stops_the_chain(self):
+    feature_setup.clear_handlers()
+    feature_setup.add_handler(lambda feature: feature_flags.STOP_CHECKING)
+    feature_setup.add_handler(AlwaysOnFlagHandler)
+
+    with self.app.test_request_context('/'):
+      self.assertFalse(feature_flags.is_active(FEATURE_NAME))
+
+  def test_returning_not_found_moves_on_to_the_next_handler(self):
+    feature_setup.clear_handlers()
+    feature_setup.add_handler(lambda feature: feature_flags.FEATURE_NOT_FOUND)
+    feature_setup.add_handler(AlwaysOnFlagHandler)
+
+    with self.app.test_request_context('/'):
+      self.assertTrue(feature_flags.is_active(FEATURE_NAME))
+
+  def test_returning_not_found_from_every_handler_means_the_feature_is_missing(self):
+    feature_setup.clear_handlers()
+    feature_setup.add_handler(lambda feature: feature_flags.FEATURE_NOT_FOUND)
+    missing = []
+
+    def signal_handler(sender, feature):
+      missing.append(feature)
+
+    feature_flags.missing_feature.connect(signal_handler)
+    try:
+      with self.app.test_request_context('/'):
+        self.assertFalse(feature_flags.is_active(FEATURE_NAME))
+    finally:
+      feature_flags.missing_feature.disconnect(signal_handler)
+
+    self.assertEqual(missing, [FEATURE_NAME])
+
+  def test_sentinels_are_falsy(self):
+    self.assertFalse(feature_flags.FEATURE_NOT_FOUND)
+    self.assertFalse(feature_flags.STOP_CHECKING)
+
+  def test_default_handler_still_raises_when_called_directly(self):
+    with self.app.test_request_context('/'):
+      self.assertRaises(feature_flags.NoFeatureFlagFound, feature_flags.AppConfigFlagHandler, u'missing')
+      self.assertTrue(feature_flags.AppConfigFlagHandler.lookup(u'missing') is feature_flags.FEATURE_NOT_FOUND)
+
+  def test_lookup_handlers_raise_when_called_directly(self):
+    class OnlyBeta(feature_flags.LookupFlagHandler):
+      def __init__(self):
+        self.lookups = 0
+
+      def lookup(self, feature):
+        self.lookups += 1
+        return True if feature == u'beta' else feature_flags.FEATURE_NOT_FOUND
+
+    handler = OnlyBeta()
+    self.assertTrue(handler(u'beta'))
+    self.assertRaises(feature_flags.NoFeatureFlagFound, handler, u'missing')
+
+    feature_setup.handlers = [handler, AlwaysOnFlagHandler]
+    with self.app.test_request_context('/'):
+      self.assertTrue(feature_flags.is_active(u'missing'))
+    self.assertEqual(handler.lookups, 3)
+
+  def test_assigning_handlers_recompiles_the_chain(self):
+    feature_setup.handlers = [AlwaysOffFlagHandler]
+
+    with self.app.test_request_context('/'):
+      self.assertFalse(feature_flags.is_active(FEATURE_NAME))
@@ -0,0 +1,104 @@
+from __future__ import with_statement
+
+import threading
+import time
+import unittest
+
+from flask import Flask, request
+import flask_featureflags as feature_flags
+from flask_featureflags.cache import _timer
+
+from .fixtures import FEATURE_NAME, FLAG_CONFIG
+
+
+class SlowHandler(object):
+  """ Takes a while to answer, like a handler that talks to another server """
+  independent = True
+
+  def __init__(self, answer, delay=0.2):
+    self.answer = answer
+    self.delay = delay
+    self.paths = []
+
+  def __call__(self, feature):
+    # Make sure we can still see the request from the thread pool
+    self.paths.append(request.path)
+    time.sleep(self.delay)
+    if self.answer is None:
+      raise feature_flags.NoFeatureFlagFound()
+    return self.answer
+
+
+class TestConcurrentChecks(unittest.TestCase):
+
+  def setUp(self):
+    self.app = Flask(__name__)
+    self.app.config[FLAG_CONFIG] = {FEATURE_NAME: True}
+    self.app.config[feature_flags.CACHE_FEATURES_PER_REQUEST] = False
+    self.app.config[feature_flags.CHECK_FEATURES_CONCURRENTLY] = True
+    self.feature_flagger = feature_flags.FeatureFlag(self.app)
+
+  def _timed_check(self, feature=FEATURE_NAME):
+    with self.app.test_request_context('/somewhere'):
+      started = _timer()
+      result = feature_flags.is_active(feature)
+      return result, _timer() - started
+
+  def test_independent_handlers_run_at_the_same_time(self):
+    handlers = [SlowHandler(None) for _ in range(4)]
+    self.feature_flagger.handlers = handlers + [feature_flags.AppConfigFlagHandler]
+
+    result, elapsed = self._timed_check()
+    self.assertTrue(result)
+    self.assertTrue(elapsed < 0.6, u'Four 0.2s handlers took %.2fs' % elapsed)
+    self.assertEqual([h.paths for h in handlers], [['/somewhere']] * 4)
+
+  def test_answers_are_used_in_chain_order(self):
+    self.feature_flagger.handlers = [SlowHandler(feature_flags.STOP_CHECKING, delay=0.1), SlowHandler(True, delay=0)]
+    self.assertFalse(self._timed_check()[0])
+
+    self.feature_flagger.handlers = [SlowHandler(True, delay=0.1), SlowHandler(feature_flags.STOP_CHECKING, delay=0)]
+    self.assertTrue(self._timed_check()[0])
+
+  def test_handlers_that_miss_the_deadline_are_skipped(self):
+    self.app.config[feature_flags.FEATURE_CHECK_TIMEOUT] = 0.1
+    feature_flagger = feature_flags.FeatureFlag(self.app)
+    feature_flagger.handlers = [SlowHandler(False, delay=1), feature_flags.AppConfigFlagHandler]
+
+    result, elapsed = self._timed_check()
+    self.assertTrue(result)
+    self.assertTrue(elapsed < 0.5, u'Waited %.2fs for a handler with a 0.1s deadline' % elapsed)
+
+  def test_handlers_that_arent_independent_run_in_order_on_this_thread(self):
+    threads = []
+
+    def handler(feature):
+      threads.append(threading.current_thread())
+      return True
+
+    self.feature_flagger.handlers = [SlowHandler(None, delay=0), handler]
+    self.assertTrue(self._timed_check()[0])
+    self.assertEqual(threads, [threading.current_thread()])
+
+  def test_worker_threads_dont_tear_down_the_request(self):
+    torn_down = []
+    self.app.teardown_request(lambda exc: torn_down.append(u'request'))
+    self.app.teardown_appcontext(lambda exc: torn_down.append(u'app'))
+    self.feature_flagger.handlers = [SlowHandler(None, delay=0), SlowHandler(True, delay=0)]
+
+    with self.app.test_request_context('/'):
+      self.assertTrue(feature_flags.is_active(FEATURE_NAME))
+      self.assertEqual(torn_down, [])
+
+    self.assertEqual(torn_down, [u'request', u'app'])
+
+  def test_off_by_default(self):
+    app = Flask(__name__)
+    feature_flagger = feature_flags.FeatureFlag(app)
+    handlers = [SlowHandler(None, delay=0.1) for _ in range(3)]
+    feature_flagger.handlers = handlers
+
+    with app.test_request_context('/'):
+      started = _timer()
+      feature_flags.is_active(FEATURE_NAME)
+      self.assertTrue(_timer() - started >= 0.3)
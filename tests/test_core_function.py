@@ -203,9 +203,13 @@ class TestFeatureFlagCoreFunctionality(unittest.TestCase):
       app.config[FLAG_CONFIG][feature] = True
       assert feature == expected_feature, u'Signal received wrong feature %s' % feature
 
-    with self.app.test_request_context('/'):
-      feature_flags.is_active(expected_feature)
-      assert app.config[FLAG_CONFIG][expected_feature], u'Missing feature handler was not called'
+    try:
+      with self.app.test_request_context('/'):
+        feature_flags.is_active(expected_feature)
+        assert app.config[FLAG_CONFIG][expected_feature], u'Missing feature handler was not called'
+    finally:
+      # Don't leave the receiver around to trip up tests that run after this one
+      feature_flags.missing_feature.disconnect(signal_handler)
 
 
 class TestAppFactory(unittest.TestCase):
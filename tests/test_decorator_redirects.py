@@ -0,0 +1,147 @@
+from __future__ import with_statement
+
+import unittest
+
+from flask import Blueprint, Flask
+from werkzeug.exceptions import NotFound
+import flask_featureflags as feature_flags
+
+from .fixtures import FEATURE_NAME, FLAG_CONFIG
+
+
+class CountingUrlFor(object):
+  """ Stands in for url_for, and counts how often the decorator asks it for a URL """
+
+  def __init__(self):
+    self.calls = 0
+    self.url_for = feature_flags.url_for
+
+  def __call__(self, endpoint, **values):
+    self.calls += 1
+    return self.url_for(endpoint, **values)
+
+
+class TestRedirectTarget(unittest.TestCase):
+
+  def setUp(self):
+    self.app = Flask(__name__)
+    self.app.config[FLAG_CONFIG] = {FEATURE_NAME: False}
+    self.feature_flagger = feature_flags.FeatureFlag(self.app)
+
+    @self.app.route('/old')
+    def old():
+      return u'old'
+
+    @self.feature_flagged(redirect='old')
+    def view():
+      return u'new'
+    self.view = view
+
+    self.url_for = CountingUrlFor()
+    feature_flags.url_for = self.url_for
+
+  def tearDown(self):
+    feature_flags.url_for = self.url_for.url_for
+
+  def feature_flagged(self, **kwargs):
+    return feature_flags.is_active_feature(FEATURE_NAME, **kwargs)
+
+  def redirect(self, view=None, base_url=None):
+    with self.app.test_request_context('/', base_url=base_url):
+      response = (view or self.view)()
+    self.assertEqual(response.status_code, 302)
+    return response.location
+
+  def test_url_is_only_built_once(self):
+    self.assertEqual(self.redirect(), u'/old')
+    self.assertEqual(self.redirect(), u'/old')
+    self.assertEqual(self.url_for.calls, 1)
+
+  def test_new_rules_are_picked_up(self):
+    self.redirect()
+
+    @self.app.route('/older')
+    def older():
+      return u'older'
+
+    self.redirect()
+    self.assertEqual(self.url_for.calls, 2)
+
+  def test_urls_follow_where_the_app_is_mounted(self):
+    self.assertEqual(self.redirect(base_url='http://localhost/'), u'/old')
+    self.assertEqual(self.redirect(base_url='http://localhost/mounted/'), u'/mounted/old')
+
+  def test_each_app_gets_its_own_url(self):
+    self.redirect()
+
+    other = Flask(__name__)
+    other.config[FLAG_CONFIG] = {FEATURE_NAME: False}
+    feature_flags.FeatureFlag(other)
+    other.add_url_rule('/somewhere/else', 'old', lambda: u'old')
+
+    with other.test_request_context('/'):
+      self.assertEqual(self.view().location, u'/somewhere/else')
+
+  def test_url_defaults_are_respected(self):
+    @self.app.url_defaults
+    def add_nothing(endpoint, values):
+      pass
+
+    self.redirect()
+    self.redirect()
+    self.assertEqual(self.url_for.calls, 2)
+
+  def test_relative_endpoints_follow_the_blueprint(self):
+    for name in (u'first', u'second'):
+      blueprint = Blueprint(name, __name__)
+
+      @blueprint.route('/old', endpoint='old')
+      @self.feature_flagged(redirect='.old')
+      def view():
+        return u'new'
+      self.app.register_blueprint(blueprint, url_prefix='/' + name)
+
+    client = self.app.test_client()
+    self.assertTrue(client.get('/first/old').location.endswith(u'/first/old'))
+    self.assertTrue(client.get('/second/old').location.endswith(u'/second/old'))
+
+  def test_fixed_urls(self):
+    @self.feature_flagged(redirect_to='/elsewhere')
+    def view():
+      return u'new'
+    self.assertEqual(self.redirect(view), u'/elsewhere')
+    self.assertEqual(self.url_for.calls, 0)
+
+  def test_responses_are_not_shared(self):
+    with self.app.test_request_context('/'):
+      first = self.view()
+      first.headers['X-Extra'] = u'1'
+      self.assertFalse('X-Extra' in self.view().headers)
+
+
+class TestBoundDecorator(TestRedirectTarget):
+  """ Everything above, through FeatureFlag.is_active_feature """
+
+  def feature_flagged(self, **kwargs):
+    return self.feature_flagger.is_active_feature(FEATURE_NAME, **kwargs)
+
+  def test_checks_go_straight_to_the_feature_flag(self):
+    app = Flask(__name__)
+    app.config[FLAG_CONFIG] = {FEATURE_NAME: True}
+    self.feature_flagger.init_app(app)
+
+    @self.feature_flagger.is_active_feature(FEATURE_NAME)
+    def view():
+      return u'new'
+
+    with app.test_request_context('/'):
+      del app.extensions[feature_flags.EXTENSION_NAME]
+      self.assertEqual(view(), u'new')
+
+  def test_404(self):
+    @self.feature_flagger.is_active_feature(FEATURE_NAME)
+    def view():
+      return u'new'
+
+    with self.app.test_request_context('/'):
+      self.assertRaises(NotFound, view)
@@ -0,0 +1,84 @@
+from __future__ import with_statement
+
+import unittest
+
+from flask import Flask, render_template_string
+import flask_featureflags as feature_flags
+from flask_featureflags.templating import FragmentCache
+
+from .fixtures import FEATURE_NAME, FLAG_CONFIG
+
+TEMPLATE = u"""{% flagcache 'fragment' using '""" + FEATURE_NAME + u"""', 'other' -%}
+{{ render() }}:{% if '""" + FEATURE_NAME + u"""' is active_feature %}new{% else %}old{% endif %}
+{%- endflagcache %}"""
+
+
+class TestFragmentCaching(unittest.TestCase):
+
+  def setUp(self):
+    self.app = Flask(__name__)
+    self.app.config[FLAG_CONFIG] = {FEATURE_NAME: True, u'other': False}
+    self.feature_flagger = feature_flags.FeatureFlag(self.app)
+    self.renders = 0
+
+  def render_fragment(self):
+    self.renders += 1
+    return self.renders
+
+  def render(self, source=TEMPLATE):
+    # A new request each time, so the request cache doesn't hide flag changes
+    with self.app.test_request_context('/'):
+      return render_template_string(source, render=self.render_fragment)
+
+  def test_fragments_are_reused(self):
+    self.assertEqual(self.render(), u'1:new')
+    self.assertEqual(self.render(), u'1:new')
+    self.assertEqual(self.renders, 1)
+
+  def test_fragments_are_rendered_again_when_a_flag_changes(self):
+    self.assertEqual(self.render(), u'1:new')
+    self.app.config[FLAG_CONFIG][FEATURE_NAME] = False
+    self.assertEqual(self.render(), u'2:old')
+
+    # ...and flipping back finds the first one again
+    self.app.config[FLAG_CONFIG][FEATURE_NAME] = True
+    self.assertEqual(self.render(), u'1:new')
+
+  def test_change_notifications_drop_fragments(self):
+    self.render()
+    self.feature_flagger.notify_changed(u'other')
+    self.assertEqual(self.render(), u'2:new')
+
+    self.feature_flagger.notify_changed(u'unrelated')
+    self.assertEqual(self.render(), u'2:new')
+
+  def test_fragments_without_flags(self):
+    source = u"{% flagcache 'plain' %}{{ render() }}{% endflagcache %}"
+    self.assertEqual(self.render(source), u'1')
+    self.assertEqual(self.render(source), u'1')
+
+  def test_fragments_are_escaped_once(self):
+    source = u"{% autoescape true %}{% flagcache 'escaped' %}{{ '<b>' }}{% endflagcache %}{% endautoescape %}"
+    self.assertEqual(self.render(source), u'&lt;b&gt;')
+    self.assertEqual(self.render(source), u'&lt;b&gt;')
+
+
+class TestFragmentCache(unittest.TestCase):
+
+  def test_least_recently_used_are_dropped(self):
+    cache = FragmentCache(maxsize=2)
+    cache.get_or_render(u'a', {}, lambda: u'a')
+    cache.get_or_render(u'b', {u'flag': True}, lambda: u'b')
+    cache.get_or_render(u'a', {}, lambda: u'not used')
+    cache.get_or_render(u'c', {}, lambda: u'c')
+
+    self.assertEqual(len(cache), 2)
+    self.assertEqual(cache.get_or_render(u'b', {u'flag': True}, lambda: u'b again'), u'b again')
+    self.assertEqual(cache.stats()['hits'], 1)
+
+  def test_invalidate_everything(self):
+    cache = FragmentCache()
+    cache.get_or_render(u'a', {u'flag': True}, lambda: u'a')
+    cache.invalidate()
+    self.assertEqual(len(cache), 0)
+    self.assertEqual(cache._by_feature, {})
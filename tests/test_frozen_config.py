@@ -0,0 +1,81 @@
+from __future__ import with_statement
+
+import unittest
+
+from flask import Flask
+import flask_featureflags as feature_flags
+
+from .fixtures import FEATURE_NAME, FLAG_CONFIG
+
+
+class TestFrozenConfig(unittest.TestCase):
+
+  def setUp(self):
+    self.app = Flask(__name__)
+    self.app.config[FLAG_CONFIG] = {FEATURE_NAME: True, u'off': 0}
+    self.app.config[feature_flags.FREEZE_FEATURE_FLAGS] = True
+    self.feature_flagger = feature_flags.FeatureFlag(self.app)
+
+  def test_flags_are_read_from_the_frozen_copy(self):
+    self.app.config[FLAG_CONFIG][FEATURE_NAME] = False
+
+    with self.app.test_request_context('/'):
+      self.assertTrue(feature_flags.is_active(FEATURE_NAME))
+      self.assertFalse(feature_flags.is_active(u'off'))
+      self.assertFalse(feature_flags.is_active(u'missing'))
+
+  def test_reload_config_picks_up_changes(self):
+    self.app.config[FLAG_CONFIG] = {FEATURE_NAME: False}
+
+    with self.app.test_request_context('/'):
+      self.feature_flagger.reload_config()
+      self.assertFalse(feature_flags.is_active(FEATURE_NAME))
+
+  def test_values_are_normalized(self):
+    self.assertTrue(self.feature_flagger._config_tables[self.app][u'off'] is False)
+
+  def test_batch_checks_use_the_frozen_copy(self):
+    self.app.config[FLAG_CONFIG][FEATURE_NAME] = False
+
+    with self.app.test_request_context('/'):
+      self.assertEqual(feature_flags.is_active_many([FEATURE_NAME, u'off', u'missing']),
+                       {FEATURE_NAME: True, u'off': False, u'missing': False})
+
+  def test_missing_features_are_still_signalled(self):
+    missing = []
+
+    def signal_handler(sender, feature):
+      missing.append(feature)
+
+    feature_flags.missing_feature.connect(signal_handler)
+    try:
+      with self.app.test_request_context('/'):
+        feature_flags.is_active(u'missing')
+    finally:
+      feature_flags.missing_feature.disconnect(signal_handler)
+
+    self.assertEqual(missing, [u'missing'])
+
+  def test_each_app_gets_its_own_copy(self):
+    other_app = Flask(__name__)
+    other_app.config[FLAG_CONFIG] = {FEATURE_NAME: False}
+    self.feature_flagger.init_app(other_app)
+
+    with self.app.test_request_context('/'):
+      self.assertTrue(feature_flags.is_active(FEATURE_NAME))
+
+    with other_app.test_request_context('/'):
+      self.assertFalse(feature_flags.is_active(FEATURE_NAME))
+      other_app.config[FLAG_CONFIG][FEATURE_NAME] = True
+      self.feature_flagger.invalidate()
+      # other_app isn't frozen, so it sees changes straight away
+      self.assertTrue(feature_flags.is_active(FEATURE_NAME))
+
+  def test_config_is_not_frozen_by_default(self):
+    app = Flask(__name__)
+    app.config[FLAG_CONFIG] = {FEATURE_NAME: True}
+    feature_flags.FeatureFlag(app)
+
+    with app.test_request_context('/'):
+      app.config[FLAG_CONFIG][FEATURE_NAME] = False
+      self.assertFalse(feature_flags.is_active(FEATURE_NAME))
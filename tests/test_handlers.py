@@ -45,6 +45,31 @@ class TestAddRemoveHandlers(unittest.TestCase):
     assert len(feature_setup.handlers) == 1
 
 
+  def test_changing_the_list_in_place_recompiles_the_chain(self):
+    feature_setup.clear_handlers()
+    with self.app.test_request_context('/'):
+      self.assertFalse(feature_setup.check(FEATURE_NAME))
+
+    feature_setup.handlers.append(AlwaysOnFlagHandler)
+    with self.app.test_request_context('/'):
+      self.assertTrue(feature_setup.check(FEATURE_NAME))
+
+    feature_setup.handlers.insert(0, AlwaysOffFlagHandler)
+    with self.app.test_request_context('/'):
+      self.assertFalse(feature_setup.check(FEATURE_NAME))
+
+    del feature_setup.handlers[0]
+    with self.app.test_request_context('/'):
+      self.assertTrue(feature_setup.check(FEATURE_NAME))
+
+    feature_setup.handlers[:] = [NullFlagHandler]
+    with self.app.test_request_context('/'):
+      self.assertFalse(feature_setup.check(FEATURE_NAME))
+
+    feature_setup.handlers += [AlwaysOnFlagHandler]
+    with self.app.test_request_context('/'):
+      self.assertTrue(feature_setup.check(FEATURE_NAME))
+
 class TestDefaultHandlers(unittest.TestCase):
 
   def setUp(self):
@@ -0,0 +1,118 @@
+from __future__ import with_statement
+
+import unittest
+
+from flask import Flask
+import flask_featureflags as feature_flags
+
+from .fixtures import FEATURE_NAME, FLAG_CONFIG, AlwaysOffFlagHandler
+
+
+class TestInstrumentation(unittest.TestCase):
+
+  def setUp(self):
+    self.app = Flask(__name__)
+    self.app.config[FLAG_CONFIG] = {FEATURE_NAME: True, u'off': False}
+    self.app.config[feature_flags.CACHE_FEATURES_PER_REQUEST] = False
+    self.app.config[feature_flags.INSTRUMENT_FEATURE_FLAGS] = True
+    self.feature_flagger = feature_flags.FeatureFlag(self.app)
+
+  def test_outcomes_and_calls_are_counted(self):
+    with self.app.test_request_context('/'):
+      feature_flags.is_active(FEATURE_NAME)
+      feature_flags.is_active(u'off')
+      feature_flags.is_active(u'missing')
+
+    stats, = self.feature_flagger.handler_stats()
+    self.assertEqual(stats['handler'], u'AppConfigFlagHandler')
+    self.assertEqual(stats['calls'], 3)
+    self.assertEqual(stats['outcomes'][feature_flags.OUTCOME_TRUE], 1)
+    self.assertEqual(stats['outcomes'][feature_flags.OUTCOME_FALSE], 1)
+    self.assertEqual(stats['outcomes'][feature_flags.OUTCOME_NOT_FOUND], 1)
+    self.assertEqual(sum(count for bound, count in stats['histogram']), 3)
+    self.assertTrue(stats['total_seconds'] > 0)
+
+  def test_exceptions_are_counted_as_outcomes(self):
+    self.feature_flagger.handlers = [AlwaysOffFlagHandler]
+
+    with self.app.test_request_context('/'):
+      self.assertFalse(feature_flags.is_active(FEATURE_NAME))
+
+    stats, = self.feature_flagger.handler_stats()
+    self.assertEqual(stats['handler'], u'AlwaysOffFlagHandler')
+    self.assertEqual(stats['outcomes'][feature_flags.OUTCOME_STOP], 1)
+
+  def test_batches_count_as_one_call(self):
+    with self.app.test_request_context('/'):
+      feature_flags.is_active_many([FEATURE_NAME, u'off', u'missing'])
+
+    stats, = self.feature_flagger.handler_stats()
+    self.assertEqual(stats['calls'], 1)
+    self.assertEqual(stats['outcomes'][feature_flags.OUTCOME_NOT_FOUND], 1)
+
+  def test_batches_that_stop_the_chain_count_as_stops(self):
+    class StopEverything(object):
+      def __call__(self, feature):
+        raise feature_flags.StopCheckingFeatureFlags()
+
+      def check_many(self, features):
+        raise feature_flags.StopCheckingFeatureFlags()
+
+    self.feature_flagger.handlers = [StopEverything()]
+
+    with self.app.test_request_context('/'):
+      self.assertEqual(feature_flags.is_active_many([FEATURE_NAME, u'off']), {FEATURE_NAME: False, u'off': False})
+
+    stats, = self.feature_flagger.handler_stats()
+    self.assertEqual(stats['calls'], 1)
+    self.assertEqual(stats['outcomes'][feature_flags.OUTCOME_STOP], 2)
+    self.assertEqual(stats['outcomes'][feature_flags.OUTCOME_NOT_FOUND], 0)
+
+  def test_signal_is_sent_for_each_handler_call(self):
+    calls = []
+
+    def receiver(sender, handler, feature, outcome, duration):
+      calls.append((handler, feature, outcome))
+
+    feature_flags.handler_checked.connect(receiver)
+    try:
+      with self.app.test_request_context('/'):
+        feature_flags.is_active(FEATURE_NAME)
+    finally:
+      feature_flags.handler_checked.disconnect(receiver)
+
+    self.assertEqual(calls, [(feature_flags.AppConfigFlagHandler, FEATURE_NAME, feature_flags.OUTCOME_TRUE)])
+
+  def test_stats_survive_changing_the_chain(self):
+    with self.app.test_request_context('/'):
+      feature_flags.is_active(FEATURE_NAME)
+      self.feature_flagger.add_handler(AlwaysOffFlagHandler)
+      feature_flags.is_active(FEATURE_NAME)
+
+    stats = self.feature_flagger.handler_stats()
+    self.assertEqual([s['calls'] for s in stats], [2, 0])
+
+    self.feature_flagger.reset_handler_stats()
+    self.assertEqual(self.feature_flagger.handler_stats()[0]['calls'], 0)
+
+  def test_can_be_turned_off(self):
+    self.feature_flagger.disable_instrumentation()
+
+    with self.app.test_request_context('/'):
+      feature_flags.is_active(FEATURE_NAME)
+
+    self.assertEqual(self.feature_flagger.handler_stats()[0]['calls'], 0)
+
+  def test_off_by_default(self):
+    app = Flask(__name__)
+    feature_flagger = feature_flags.FeatureFlag(app)
+
+    with app.test_request_context('/'):
+      feature_flags.is_active(FEATURE_NAME)
+
+    self.assertEqual(feature_flagger.handler_stats(), [])
+
+    feature_flagger.enable_instrumentation()
+    with app.test_request_context('/'):
+      feature_flags.is_active(FEATURE_NAME)
+    self.assertEqual(feature_flagger.handler_stats()[0]['calls'], 1)
@@ -0,0 +1,185 @@
+from __future__ import with_statement
+
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+
+from flask import Flask
+import flask_featureflags as feature_flags
+from flask_featureflags.bus import InvalidationBus, LocalTransport, UnixSocketTransport
+
+from .fixtures import FEATURE_NAME
+
+
+class CachingHandler(object):
+  """ Remembers every answer until it's told to forget, like the cached contrib handlers """
+
+  def __init__(self, flags):
+    self.flags = flags
+    self.cache = {}
+
+  def __call__(self, feature):
+    if feature not in self.cache:
+      self.cache[feature] = self.flags.get(feature, False)
+    return self.cache[feature]
+
+  def invalidate(self, feature=None):
+    if feature is None:
+      self.cache.clear()
+    else:
+      self.cache.pop(feature, None)
+
+
+class TestNotifyChanged(unittest.TestCase):
+
+  def setUp(self):
+    self.flags = {FEATURE_NAME: False}
+    self.app = Flask(__name__)
+    self.app.config[feature_flags.CACHE_FEATURES_PER_REQUEST] = True
+    self.feature_flagger = feature_flags.FeatureFlag(self.app)
+    self.handler = CachingHandler(self.flags)
+    self.feature_flagger.handlers = [self.handler]
+
+  def test_without_a_bus_handlers_are_invalidated_locally(self):
+    with self.app.test_request_context('/'):
+      self.assertFalse(feature_flags.is_active(FEATURE_NAME))
+
+      self.flags[FEATURE_NAME] = True
+      self.feature_flagger.notify_changed(FEATURE_NAME)
+      self.assertTrue(feature_flags.is_active(FEATURE_NAME))
+
+  def test_flag_changed_signal(self):
+    changed = []
+
+    def receiver(sender, feature):
+      changed.append(feature)
+
+    feature_flags.flag_changed.connect(receiver)
+    try:
+      self.feature_flagger.notify_changed(FEATURE_NAME)
+      self.feature_flagger.notify_changed()
+    finally:
+      feature_flags.flag_changed.disconnect(receiver)
+
+    self.assertEqual(changed, [FEATURE_NAME, None])
+
+  def test_changes_reach_other_instances_on_the_same_transport(self):
+    transport = LocalTransport()
+    self.feature_flagger.connect_bus(InvalidationBus(transport))
+
+    other_flags = {FEATURE_NAME: False}
+    other_app = Flask(__name__)
+    other_flagger = feature_flags.FeatureFlag(other_app)
+    other_handler = CachingHandler(other_flags)
+    other_flagger.handlers = [other_handler]
+    other_flagger.connect_bus(InvalidationBus(transport))
+
+    with other_app.test_request_context('/'):
+      self.assertFalse(feature_flags.is_active(FEATURE_NAME))
+
+    other_flags[FEATURE_NAME] = True
+    self.feature_flagger.notify_changed(FEATURE_NAME)
+
+    with other_app.test_request_context('/'):
+      self.assertTrue(feature_flags.is_active(FEATURE_NAME))
+
+
+class TestInvalidationBus(unittest.TestCase):
+
+  def test_failing_subscriber_does_not_stop_others(self):
+    bus = InvalidationBus()
+    heard = []
+
+    def broken(feature):
+      raise RuntimeError(u'oops')
+
+    bus.subscribe(broken)
+    bus.subscribe(heard.append)
+    bus.publish(FEATURE_NAME)
+    self.assertEqual(heard, [FEATURE_NAME])
+
+  def test_unsubscribe(self):
+    bus = InvalidationBus()
+    heard = []
+    bus.subscribe(heard.append)
+    bus.unsubscribe(heard.append)
+    bus.unsubscribe(heard.append)
+    bus.publish(FEATURE_NAME)
+    self.assertEqual(heard, [])
+
+  def test_garbage_is_ignored(self):
+    bus = InvalidationBus()
+    heard = []
+    bus.subscribe(heard.append)
+    bus._receive(b'not json')
+    bus._receive(b'{}')
+    self.assertEqual(heard, [])
+
+
+class TestUnixSocketTransport(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.buses = []
+
+  def tearDown(self):
+    for bus in self.buses:
+      bus.close()
+    shutil.rmtree(self.directory)
+
+  def listening_bus(self):
+    bus = InvalidationBus(UnixSocketTransport(self.directory))
+    self.buses.append(bus)
+    heard = []
+    arrived = threading.Event()
+
+    def subscriber(feature):
+      heard.append(feature)
+      arrived.set()
+
+    bus.subscribe(subscriber)
+    return bus, heard, arrived
+
+  def test_changes_reach_every_other_socket(self):
+    sender, sender_heard, _ = self.listening_bus()
+    first, first_heard, first_arrived = self.listening_bus()
+    second, second_heard, second_arrived = self.listening_bus()
+
+    sender.publish(FEATURE_NAME)
+
+    # wait() returns None on python 2.6, so check is_set() instead
+    first_arrived.wait(5)
+    second_arrived.wait(5)
+    self.assertTrue(first_arrived.is_set() and second_arrived.is_set())
+    self.assertEqual(first_heard, [FEATURE_NAME])
+    self.assertEqual(second_heard, [FEATURE_NAME])
+    # The sender hears about its own change straight away, and only once
+    self.assertEqual(sender_heard, [FEATURE_NAME])
+
+  def test_invalidate_everything(self):
+    sender, _, _ = self.listening_bus()
+    listener, heard, arrived = self.listening_bus()
+
+    sender.publish()
+    arrived.wait(5)
+    self.assertTrue(arrived.is_set())
+    self.assertEqual(heard, [None])
+
+  def test_sockets_left_by_dead_processes_are_removed(self):
+    stale = os.path.join(self.directory, u'12345-dead.sock')
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.bind(stale)
+    sock.close()
+
+    sender, _, _ = self.listening_bus()
+    sender.publish(FEATURE_NAME)
+    self.assertFalse(os.path.exists(stale))
+
+  def test_close_removes_the_socket(self):
+    bus, _, _ = self.listening_bus()
+    self.buses.remove(bus)
+    bus.close()
+    self.assertEqual(os.listdir(self.directory), [])
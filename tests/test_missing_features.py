@@ -0,0 +1,104 @@
+from __future__ import with_statement
+
+import logging
+import unittest
+
+from flask import Flask
+import flask_featureflags as feature_flags
+
+from .fixtures import FEATURE_NAME, FLAG_CONFIG
+
+
+class ListHandler(logging.Handler):
+
+  def __init__(self):
+    logging.Handler.__init__(self)
+    self.messages = []
+
+  def emit(self, record):
+    self.messages.append(record.getMessage())
+
+
+class TestMissingFeatureReports(unittest.TestCase):
+
+  def setUp(self):
+    self.app = Flask(__name__)
+    self.app.config[FLAG_CONFIG] = {FEATURE_NAME: True}
+    self.app.config[feature_flags.CACHE_FEATURES_PER_REQUEST] = False
+    self.app.config[feature_flags.MISSING_FEATURE_REPORT_INTERVAL] = 60
+    self.feature_flagger = feature_flags.FeatureFlag(self.app)
+
+    self.now = 1000.0
+    self.real_timer = feature_flags._timer
+    feature_flags._timer = lambda: self.now
+
+    self.signalled = []
+    feature_flags.missing_feature.connect(self.receiver)
+
+    self.log_handler = ListHandler()
+    feature_flags.log.addHandler(self.log_handler)
+    self.log_level = feature_flags.log.level
+    feature_flags.log.setLevel(logging.INFO)
+
+  def tearDown(self):
+    feature_flags._timer = self.real_timer
+    feature_flags.missing_feature.disconnect(self.receiver)
+    feature_flags.log.removeHandler(self.log_handler)
+    feature_flags.log.setLevel(self.log_level)
+
+  def receiver(self, sender, feature):
+    self.signalled.append(feature)
+
+  def check(self, feature, times=1):
+    with self.app.test_request_context('/'):
+      for i in range(times):
+        self.assertFalse(feature_flags.is_active(feature))
+
+  def test_reported_once_per_interval(self):
+    self.check(u'typo', times=5)
+    self.assertEqual(self.signalled, [u'typo'])
+    self.assertEqual(self.log_handler.messages, [u'No feature flag defined for typo'])
+
+    self.now += 61
+    self.check(u'typo')
+    self.assertEqual(self.signalled, [u'typo', u'typo'])
+    self.assertEqual(self.log_handler.messages[-1], u'No feature flag defined for typo (checked 4 more times since the last report)')
+
+  def test_each_feature_has_its_own_window(self):
+    self.check(u'typo')
+    self.check(u'other')
+    self.assertEqual(self.signalled, [u'typo', u'other'])
+
+  def test_counts_include_unreported_checks(self):
+    self.check(u'typo', times=3)
+    with self.app.test_request_context('/'):
+      self.assertTrue(feature_flags.is_active(FEATURE_NAME))
+    self.assertEqual(self.feature_flagger.missing_features(), {u'typo': 3})
+
+    self.feature_flagger.reset_missing_features()
+    self.assertEqual(self.feature_flagger.missing_features(), {})
+    self.check(u'typo')
+    self.assertEqual(self.signalled, [u'typo', u'typo'])
+
+  def test_every_check_is_reported_by_default(self):
+    self.feature_flagger._report_interval = None
+    self.check(u'typo', times=3)
+    self.assertEqual(self.signalled, [u'typo'] * 3)
+
+  def test_nothing_is_counted_by_default(self):
+    self.feature_flagger._report_interval = None
+    self.check(u'typo', times=3)
+    self.assertEqual(self.feature_flagger.missing_features(), {})
+
+  def test_number_of_features_counted_is_capped(self):
+    real_max = feature_flags._MAX_MISSING_FEATURES
+    feature_flags._MAX_MISSING_FEATURES = 2
+    try:
+      for feature in (u'one', u'two', u'three', u'three', u'one'):
+        self.check(feature)
+    finally:
+      feature_flags._MAX_MISSING_FEATURES = real_max
+
+    self.assertEqual(self.feature_flagger.missing_features(), {u'one': 2, u'two': 1})
+    # names past the cap aren't rate limited, so they're reported every time
+    self.assertEqual(self.signalled, [u'one', u'two', u'three', u'three'])
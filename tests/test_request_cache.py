@@ -0,0 +1,108 @@
+from __future__ import with_statement
+
+import unittest
+
+from flask import Flask
+import flask_featureflags as feature_flags
+
+from .fixtures import FEATURE_NAME, FLAG_CONFIG
+
+
+class CountingFlagHandler(object):
+  """ Returns whatever the config says, but keeps track of how often it's been asked """
+
+  def __init__(self, value=True):
+    self.value = value
+    self.calls = 0
+
+  def __call__(self, feature):
+    self.calls += 1
+    return self.value
+
+
+class TestRequestCache(unittest.TestCase):
+
+  def setUp(self):
+    self.app = Flask(__name__)
+    self.app.config[FLAG_CONFIG] = {FEATURE_NAME: True}
+    self.feature_flagger = feature_flags.FeatureFlag(self.app)
+
+    self.handler = CountingFlagHandler()
+    self.feature_flagger.clear_handlers()
+    self.feature_flagger.add_handler(self.handler)
+
+  def test_handlers_run_once_per_feature_per_request(self):
+    with self.app.test_request_context('/'):
+      for _ in range(5):
+        self.assertTrue(feature_flags.is_active(FEATURE_NAME))
+      self.assertEqual(self.handler.calls, 1)
+
+      feature_flags.is_active(u'some other feature')
+      self.assertEqual(self.handler.calls, 2)
+
+  def test_app_context_alone_isnt_cached(self):
+    with self.app.app_context():
+      self.assertTrue(feature_flags.is_active(FEATURE_NAME))
+      self.handler.value = False
+      self.assertFalse(feature_flags.is_active(FEATURE_NAME))
+
+    self.assertEqual(self.handler.calls, 2)
+
+  def test_cache_is_dropped_when_a_request_ends_inside_a_longer_app_context(self):
+    with self.app.app_context():
+      with self.app.test_request_context('/'):
+        self.assertTrue(feature_flags.is_active(FEATURE_NAME))
+
+      self.handler.value = False
+
+      with self.app.test_request_context('/'):
+        self.assertFalse(feature_flags.is_active(FEATURE_NAME))
+
+    self.assertEqual(self.handler.calls, 2)
+
+  def test_jinja_test_uses_the_same_cache(self):
+    with self.app.test_request_context('/'):
+      feature_flags.is_active(FEATURE_NAME)
+      template = self.app.jinja_env.from_string(u"{% for i in range(10) %}{% if name is active_feature %}x{% endif %}{% endfor %}")
+      self.assertEqual(template.render(name=FEATURE_NAME), u'x' * 10)
+      self.assertEqual(self.handler.calls, 1)
+
+  def test_cache_is_dropped_between_requests(self):
+    with self.app.test_request_context('/'):
+      self.assertTrue(feature_flags.is_active(FEATURE_NAME))
+
+    self.handler.value = False
+
+    with self.app.test_request_context('/'):
+      self.assertFalse(feature_flags.is_active(FEATURE_NAME))
+
+    self.assertEqual(self.handler.calls, 2)
+
+  def test_can_invalidate_a_single_feature_mid_request(self):
+    with self.app.test_request_context('/'):
+      self.assertTrue(feature_flags.is_active(FEATURE_NAME))
+      self.handler.value = False
+      self.assertTrue(feature_flags.is_active(FEATURE_NAME))
+
+      self.feature_flagger.invalidate(FEATURE_NAME)
+      self.assertFalse(feature_flags.is_active(FEATURE_NAME))
+      self.assertEqual(self.handler.calls, 2)
+
+  def test_changing_handlers_invalidates_the_cache(self):
+    with self.app.test_request_context('/'):
+      self.assertTrue(feature_flags.is_active(FEATURE_NAME))
+
+      self.feature_flagger.clear_handlers()
+      self.assertFalse(feature_flags.is_active(FEATURE_NAME))
+
+  def test_cache_can_be_turned_off(self):
+    self.app.config[feature_flags.CACHE_FEATURES_PER_REQUEST] = False
+
+    with self.app.test_request_context('/'):
+      for _ in range(5):
+        feature_flags.is_active(FEATURE_NAME)
+      self.assertEqual(self.handler.calls, 5)
+
+  def test_invalidating_outside_a_request_is_a_noop(self):
+    self.feature_flagger.invalidate(FEATURE_NAME)
+    self.feature_flagger.invalidate()
@@ -0,0 +1,151 @@
+from __future__ import with_statement
+
+import unittest
+
+from flask import Flask, make_response, request
+import flask_featureflags as feature_flags
+from flask_featureflags.cache import FeatureFlagCache
+
+from .fixtures import FEATURE_NAME, FLAG_CONFIG
+
+
+class TestResponseCaching(unittest.TestCase):
+
+  def setUp(self):
+    self.app = Flask(__name__)
+    self.app.config[FLAG_CONFIG] = {FEATURE_NAME: True, u'other': False}
+    feature_flags.FeatureFlag(self.app)
+    self.cache = FeatureFlagCache(ttl=60, maxsize=10)
+    self.calls = 0
+
+    @self.app.route('/tagged')
+    @feature_flags.is_active_feature(FEATURE_NAME, flags=[u'other'], etag=True, vary=[u'Cookie'])
+    def tagged():
+      return u'other is %s' % feature_flags.is_active(u'other')
+
+    @self.app.route('/versioned')
+    @feature_flags.is_active_feature(FEATURE_NAME, etag=True)
+    def versioned():
+      response = make_response(u'same body')
+      response.set_etag(u'v1')
+      return response
+
+    @self.app.route('/cached', methods=['GET', 'POST'])
+    @feature_flags.is_active_feature(FEATURE_NAME, flags=[u'other'], cache=self.cache)
+    def cached():
+      self.calls += 1
+      return u'%s:%s' % (self.calls, feature_flags.is_active(u'other'))
+
+    @self.app.route('/whoami')
+    @feature_flags.is_active_feature(FEATURE_NAME, vary=[u'Authorization'], cache=self.cache)
+    def whoami():
+      self.calls += 1
+      return u'hello %s' % request.headers.get(u'Authorization')
+
+    @self.app.route('/private')
+    @feature_flags.is_active_feature(FEATURE_NAME, cache=self.cache)
+    def private():
+      self.calls += 1
+      response = make_response(u'hello %s' % request.cookies.get(u'user'))
+      response.headers['Cache-Control'] = u'private, no-store'
+      response.vary.add(u'Cookie')
+      return response
+
+    @self.app.route('/varies')
+    @feature_flags.is_active_feature(FEATURE_NAME, cache=self.cache)
+    def varies():
+      self.calls += 1
+      response = make_response(u'hello %s' % request.headers.get(u'Accept-Language'))
+      response.vary.add(u'Accept-Language')
+      return response
+
+    @self.app.route('/cookie')
+    @feature_flags.is_active_feature(FEATURE_NAME, cache=self.cache)
+    def cookie():
+      self.calls += 1
+      response = make_response(u'hi')
+      response.set_cookie(u'seen', u'1')
+      return response
+
+    self.client = self.app.test_client()
+
+  def test_fingerprint(self):
+    self.assertEqual(feature_flags.flag_fingerprint({u'a': True, u'b': False}),
+                     feature_flags.flag_fingerprint({u'b': 0, u'a': 1}))
+    self.assertNotEqual(feature_flags.flag_fingerprint({u'a': True, u'b': False}),
+                        feature_flags.flag_fingerprint({u'a': True, u'b': True}))
+
+  def test_etag_changes_with_flags(self):
+    first = self.client.get('/tagged')
+    self.assertTrue(first.headers['ETag'])
+    self.assertTrue(u'Cookie' in first.headers['Vary'])
+
+    self.app.config[FLAG_CONFIG][u'other'] = True
+    second = self.client.get('/tagged')
+    self.assertNotEqual(first.headers['ETag'], second.headers['ETag'])
+
+  def test_view_etags_are_combined_with_flags(self):
+    first = self.client.get('/versioned')
+    self.assertTrue(first.headers['ETag'].startswith(u'"v1-'))
+
+    not_modified = self.client.get('/versioned', headers={'If-None-Match': first.headers['ETag']})
+    self.assertEqual(not_modified.status_code, 304)
+
+  def test_conditional_requests(self):
+    etag = self.client.get('/tagged').headers['ETag']
+    self.assertEqual(self.client.get('/tagged', headers={'If-None-Match': etag}).status_code, 304)
+
+    self.app.config[FLAG_CONFIG][u'other'] = True
+    self.assertEqual(self.client.get('/tagged', headers={'If-None-Match': etag}).status_code, 200)
+
+  def test_cached_responses_skip_the_view(self):
+    self.assertEqual(self.client.get('/cached').data, b'1:False')
+    self.assertEqual(self.client.get('/cached').data, b'1:False')
+    self.assertEqual(self.calls, 1)
+
+  def test_cache_is_keyed_on_flags_and_url(self):
+    self.client.get('/cached')
+    self.app.config[FLAG_CONFIG][u'other'] = True
+    self.assertEqual(self.client.get('/cached').data, b'2:True')
+    self.assertEqual(self.client.get('/cached?page=2').data, b'3:True')
+
+    self.app.config[FLAG_CONFIG][u'other'] = False
+    self.assertEqual(self.client.get('/cached').data, b'1:False')
+
+  def test_cache_is_keyed_on_vary_headers(self):
+    self.assertEqual(self.client.get('/whoami', headers={'Authorization': 'alice'}).data, b'hello alice')
+    self.assertEqual(self.client.get('/whoami', headers={'Authorization': 'bob'}).data, b'hello bob')
+    self.assertEqual(self.client.get('/whoami', headers={'Authorization': 'alice'}).data, b'hello alice')
+    self.assertEqual(self.calls, 2)
+
+  def test_private_responses_are_not_shared(self):
+    self.client.set_cookie('localhost', 'user', 'alice')
+    self.assertEqual(self.client.get('/private').data, b'hello alice')
+    self.client.set_cookie('localhost', 'user', 'bob')
+    self.assertEqual(self.client.get('/private').data, b'hello bob')
+    self.assertEqual(self.calls, 2)
+
+  def test_responses_varying_on_other_headers_are_not_cached(self):
+    self.assertEqual(self.client.get('/varies', headers={'Accept-Language': 'en'}).data, b'hello en')
+    self.assertEqual(self.client.get('/varies', headers={'Accept-Language': 'fr'}).data, b'hello fr')
+    self.assertEqual(self.calls, 2)
+
+  def test_vary_headers_we_key_on_are_fine(self):
+    self.client.get('/whoami', headers={'Authorization': 'alice'})
+    self.client.get('/whoami', headers={'Authorization': 'alice'})
+    self.assertEqual(self.calls, 1)
+
+  def test_only_gets_are_cached(self):
+    self.client.post('/cached')
+    self.client.post('/cached')
+    self.assertEqual(self.calls, 2)
+
+  def test_responses_setting_cookies_are_not_cached(self):
+    self.client.get('/cookie')
+    self.client.get('/cookie')
+    self.assertEqual(self.calls, 2)
+
+  def test_feature_off(self):
+    self.app.config[FLAG_CONFIG][FEATURE_NAME] = False
+    self.assertEqual(self.client.get('/cached').status_code, 404)
+    self.assertEqual(self.calls, 0)
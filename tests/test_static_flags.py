@@ -0,0 +1,96 @@
+from __future__ import with_statement
+
+import unittest
+
+from flask import Flask, render_template, render_template_string
+from jinja2 import DictLoader
+import flask_featureflags as feature_flags
+from flask_featureflags.templating import CHECK_FILTER, FeatureFlagsExtension, static_flags
+
+from .fixtures import FEATURE_NAME, FLAG_CONFIG
+
+
+class CountingHandler(object):
+
+  def __init__(self):
+    self.checked = []
+
+  def __call__(self, feature):
+    self.checked.append(feature)
+    raise feature_flags.NoFeatureFlagFound()
+
+
+class TestStaticFeatureFlags(unittest.TestCase):
+
+  def setUp(self):
+    self.app = Flask(__name__)
+    self.app.config[FLAG_CONFIG] = {FEATURE_NAME: True, u'off': False, u'dynamic': True}
+    self.app.config[feature_flags.STATIC_FEATURE_FLAGS] = [FEATURE_NAME, u'off']
+    self.feature_flagger = feature_flags.FeatureFlag(self.app)
+    self.handler = CountingHandler()
+    self.feature_flagger.add_handler(self.handler)
+
+  def render(self, source):
+    with self.app.test_request_context('/'):
+      return render_template_string(source)
+
+  def compiled(self, source):
+    return self.app.jinja_env.compile(source, raw=True)
+
+  def test_extension_is_added(self):
+    self.assertTrue(any(isinstance(extension, FeatureFlagsExtension)
+                        for extension in self.app.jinja_env.extensions.values()))
+
+  def test_static_flags_are_folded(self):
+    source = u"{% if '" + FEATURE_NAME + u"' is active_feature %}on{% else %}off{% endif %}"
+    self.assertEqual(self.render(source), u'on')
+    self.assertFalse(u'active_feature' in self.compiled(source))
+
+  def test_negated_and_off_flags(self):
+    self.assertEqual(self.render(u"{% if 'off' is active_feature %}on{% else %}off{% endif %}"), u'off')
+    self.assertEqual(self.render(u"{% if 'off' is not active_feature %}yes{% endif %}"), u'yes')
+    self.assertEqual(self.render(u"{{ 'off' is not active_feature and '" + FEATURE_NAME + u"' is active_feature }}"), u'True')
+
+  def test_static_flags_skip_the_handlers_inside_loops(self):
+    source = u"{% for i in range(5) %}{% if '" + FEATURE_NAME + u"' is active_feature %}x{% endif %}{% endfor %}"
+    self.assertEqual(self.render(source), u'xxxxx')
+    self.assertEqual(self.handler.checked, [])
+
+  def test_other_flags_are_checked_when_rendering(self):
+    self.assertEqual(self.render(u"{% if 'dynamic' is active_feature %}on{% endif %}"), u'on')
+    self.assertFalse(self.render(u"{% if 'missing' is active_feature %}on{% endif %}"))
+    self.assertEqual(self.handler.checked, [u'missing'])
+    self.assertTrue(CHECK_FILTER in self.compiled(u"{{ 'dynamic' is active_feature }}"))
+
+  def test_other_flags_are_not_baked_into_compiled_templates(self):
+    self.app.jinja_env.loader = DictLoader({u'page.html': u"{% if 'dynamic' is not active_feature %}off{% else %}on{% endif %}"})
+
+    with self.app.test_request_context('/'):
+      self.assertEqual(render_template(u'page.html'), u'on')
+
+    self.app.config[FLAG_CONFIG][u'dynamic'] = False
+    with self.app.test_request_context('/'):
+      self.assertEqual(render_template(u'page.html'), u'off')
+
+  def test_only_whole_feature_names_are_folded(self):
+    self.assertEqual(self.render(u"{{ 'x' '" + FEATURE_NAME + u"' is active_feature }}"), u'False')
+    self.assertEqual(self.render(u"{% set name = '" + FEATURE_NAME + u"' %}{{ name is active_feature }}"), u'True')
+
+  def test_reload_config_recompiles_templates(self):
+    self.app.jinja_env.loader = DictLoader({u'page.html': u"{% if 'off' is active_feature %}on{% else %}off{% endif %}"})
+
+    with self.app.test_request_context('/'):
+      self.assertEqual(render_template(u'page.html'), u'off')
+
+      # Compiled templates are cached, so they keep the old value...
+      self.app.config[FLAG_CONFIG][u'off'] = True
+      self.assertEqual(render_template(u'page.html'), u'off')
+
+      # ...until the config is reloaded
+      self.feature_flagger.reload_config(self.app)
+      self.assertEqual(render_template(u'page.html'), u'on')
+
+  def test_every_flag_can_be_static(self):
+    config = {FLAG_CONFIG: {u'a': 1, u'b': 0}, feature_flags.STATIC_FEATURE_FLAGS: True}
+    self.assertEqual(static_flags(config), {u'a': True, u'b': False})
+    self.assertEqual(static_flags({FLAG_CONFIG: {u'a': True}}), {})
@@ -0,0 +1,136 @@
+from __future__ import with_statement
+
+import gc
+import threading
+import unittest
+
+from flask import Flask
+import flask_featureflags as feature_flags
+from flask_featureflags.usage import UsageTracker
+
+from .fixtures import FEATURE_NAME, FLAG_CONFIG
+
+
+class TestUsageTracking(unittest.TestCase):
+
+  def setUp(self):
+    self.app = Flask(__name__)
+    self.app.config[FLAG_CONFIG] = {FEATURE_NAME: True, u'off': False, u'never': True}
+    self.app.config[feature_flags.TRACK_FEATURE_USAGE] = True
+    self.feature_flagger = feature_flags.FeatureFlag(self.app)
+
+  def test_off_by_default(self):
+    app = Flask(__name__)
+    feature_flagger = feature_flags.FeatureFlag(app)
+    self.assertEqual(feature_flagger.usage, None)
+
+  def test_checks_are_counted_even_when_cached(self):
+    with self.app.test_request_context('/'):
+      feature_flags.is_active(FEATURE_NAME)
+      feature_flags.is_active(FEATURE_NAME)
+      feature_flags.is_active(u'off')
+
+    counts = self.feature_flagger.usage.counts()
+    self.assertEqual(counts[FEATURE_NAME], {'checks': 2, 'true': 2, 'false': 0})
+    self.assertEqual(counts[u'off'], {'checks': 1, 'true': 0, 'false': 1})
+
+  def test_batches_are_counted(self):
+    with self.app.test_request_context('/'):
+      feature_flags.is_active_many([FEATURE_NAME, u'off', u'missing'])
+
+    counts = self.feature_flagger.usage.counts()
+    self.assertEqual(counts[FEATURE_NAME]['true'], 1)
+    self.assertEqual(counts[u'missing']['false'], 1)
+
+  def test_unused_features(self):
+    with self.app.test_request_context('/'):
+      feature_flags.is_active(FEATURE_NAME)
+      feature_flags.is_active(u'off')
+
+    self.feature_flagger.usage.flush()
+    self.assertEqual(self.feature_flagger.usage.unused(self.app.config[FLAG_CONFIG]), [u'never'])
+
+  def test_disable_returns_the_tracker(self):
+    usage = self.feature_flagger.disable_usage_tracking()
+    self.assertTrue(isinstance(usage, UsageTracker))
+
+    with self.app.test_request_context('/'):
+      feature_flags.is_active(FEATURE_NAME)
+
+    self.assertEqual(usage.counts(), {})
+    self.assertEqual(self.feature_flagger.usage, None)
+
+
+class TestUsageTracker(unittest.TestCase):
+
+  def test_threads_are_merged(self):
+    tracker = UsageTracker()
+
+    def work():
+      for i in range(100):
+        tracker.record(FEATURE_NAME, i % 2)
+
+    threads = [threading.Thread(target=work) for i in range(4)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+    self.assertEqual(tracker.counts()[FEATURE_NAME], {'checks': 400, 'true': 200, 'false': 200})
+
+  def test_finished_threads_are_folded_together(self):
+    tracker = UsageTracker()
+
+    for i in range(50):
+      thread = threading.Thread(target=tracker.record, args=(FEATURE_NAME, True))
+      thread.start()
+      thread.join()
+    # PyPy doesn't clean up thread locals until the garbage collector runs
+    gc.collect()
+
+    self.assertEqual(len(tracker._shards), 1)
+    self.assertEqual(tracker.counts()[FEATURE_NAME], {'checks': 50, 'true': 50, 'false': 0})
+    tracker.flush()
+    self.assertEqual(tracker.counts(), {})
+    self.assertEqual(tracker.totals()[FEATURE_NAME]['checks'], 50)
+
+  def test_flush_starts_again_and_keeps_totals(self):
+    tracker = UsageTracker()
+    exported = []
+    tracker.add_exporter(exported.append)
+
+    tracker.record(FEATURE_NAME, True)
+    flushed = tracker.flush()
+    tracker.record(FEATURE_NAME, False)
+
+    self.assertEqual(exported, [flushed])
+    self.assertEqual(flushed[FEATURE_NAME]['checks'], 1)
+    self.assertEqual(tracker.counts()[FEATURE_NAME], {'checks': 1, 'true': 0, 'false': 1})
+    self.assertEqual(tracker.totals()[FEATURE_NAME], {'checks': 2, 'true': 1, 'false': 1})
+
+  def test_failing_exporter_does_not_stop_others(self):
+    tracker = UsageTracker()
+    exported = []
+
+    def broken(counts):
+      raise RuntimeError(u'oops')
+
+    tracker.add_exporter(broken)
+    tracker.add_exporter(exported.append)
+    tracker.record(FEATURE_NAME, True)
+    tracker.flush()
+
+    self.assertEqual(len(exported), 1)
+
+  def test_flusher_thread(self):
+    tracker = UsageTracker()
+    flushed = threading.Event()
+    tracker.add_exporter(lambda counts: flushed.set())
+
+    tracker.start_flusher(interval=0.01)
+    try:
+      flushed.wait(5)
+      self.assertTrue(flushed.is_set())
+    finally:
+      tracker.stop_flusher(flush=False)
+    self.assertEqual(tracker._flusher, None)
@@ -0,0 +1,133 @@
+from __future__ import with_statement
+
+import unittest
+
+from flask import Flask
+import flask_featureflags as feature_flags
+from flask_featureflags.bus import ChangeNotifier, InvalidationBus
+
+from .fixtures import FEATURE_NAME
+
+
+class ChangingHandler(object):
+  """ Notices changes by itself, like the file handler """
+
+  def __init__(self, flags):
+    self.flags = flags
+    self.changes = ChangeNotifier()
+
+  def __call__(self, feature):
+    return self.flags.get(feature, False)
+
+  def set(self, feature, active):
+    old = dict(self.flags)
+    self.flags[feature] = active
+    self.changes.notify_diff(old, self.flags)
+
+
+class TestVersion(unittest.TestCase):
+
+  def setUp(self):
+    self.app = Flask(__name__)
+    self.app.config[feature_flags.FEATURE_FLAGS_CONFIG] = {FEATURE_NAME: True}
+    self.feature_flagger = feature_flags.FeatureFlag(self.app)
+
+  def test_version_goes_up_when_handlers_change(self):
+    version = self.feature_flagger.version
+    handler = ChangingHandler({})
+    self.feature_flagger.add_handler(handler)
+    self.assertTrue(self.feature_flagger.version > version)
+
+    version = self.feature_flagger.version
+    self.feature_flagger.remove_handler(handler)
+    self.assertTrue(self.feature_flagger.version > version)
+
+  def test_version_is_stable_while_nothing_changes(self):
+    version = self.feature_flagger.version
+    with self.app.test_request_context('/'):
+      self.feature_flagger.check(FEATURE_NAME)
+      self.feature_flagger.check_many([FEATURE_NAME, 'other'])
+    self.assertEqual(self.feature_flagger.version, version)
+
+  def test_reload_config_bumps_the_version(self):
+    version = self.feature_flagger.version
+    self.feature_flagger.reload_config(self.app)
+    self.assertTrue(self.feature_flagger.version > version)
+
+  def test_notify_changed_bumps_the_version(self):
+    version = self.feature_flagger.version
+    self.feature_flagger.notify_changed(FEATURE_NAME)
+    self.assertTrue(self.feature_flagger.version > version)
+
+  def test_changes_from_other_processes_bump_the_version(self):
+    bus = InvalidationBus()
+    self.feature_flagger.connect_bus(bus)
+    version = self.feature_flagger.version
+    bus._receive(b'{"feature": null}')
+    self.assertTrue(self.feature_flagger.version > version)
+
+  def test_handlers_that_notice_changes_bump_the_version(self):
+    handler = ChangingHandler({'feature': False})
+    self.feature_flagger.add_handler(handler)
+    received = []
+
+    def receiver(sender, feature):
+      received.append(feature)
+    feature_flags.flag_changed.connect(receiver, sender=self.feature_flagger)
+    try:
+      version = self.feature_flagger.version
+      handler.set('feature', True)
+      self.assertEqual(self.feature_flagger.version, version + 1)
+      self.assertEqual(received, ['feature'])
+
+      # Nothing actually changed
+      handler.set('feature', True)
+      self.assertEqual(self.feature_flagger.version, version + 1)
+    finally:
+      feature_flags.flag_changed.disconnect(receiver, sender=self.feature_flagger)
+
+  def test_removed_handlers_are_not_listened_to(self):
+    handler = ChangingHandler({'feature': False})
+    self.feature_flagger.add_handler(handler)
+    self.feature_flagger.remove_handler(handler)
+
+    version = self.feature_flagger.version
+    handler.set('feature', True)
+    self.assertEqual(self.feature_flagger.version, version)
+    self.assertEqual(handler.changes._listeners, [])
+
+  def test_handler_changes_drop_cached_fragments(self):
+    handler = ChangingHandler({'feature': False})
+    self.feature_flagger.add_handler(handler)
+    self.feature_flagger.fragments.get_or_render('name', {'feature': False}, lambda: u'old')
+
+    handler.set('feature', True)
+    self.assertEqual(len(self.feature_flagger.fragments), 0)
+
+
+class TestChangeNotifier(unittest.TestCase):
+
+  def test_diff_notifies_each_changed_feature(self):
+    notifier = ChangeNotifier()
+    changed = []
+    notifier.add_listener(changed.append)
+    notifier.notify_diff({'a': True, 'b': False, 'c': True}, {'a': True, 'b': True, 'd': False})
+    self.assertEqual(sorted(changed), ['b', 'c', 'd'])
+
+  def test_diff_from_nothing_notifies_everything(self):
+    notifier = ChangeNotifier()
+    changed = []
+    notifier.add_listener(changed.append)
+    notifier.notify_diff({}, {'a': True})
+    self.assertEqual(changed, [None])
+
+  def test_broken_listeners_do_not_stop_the_others(self):
+    notifier = ChangeNotifier()
+    changed = []
+
+    def broken(feature):
+      raise RuntimeError(u'oops')
+    notifier.add_listener(broken)
+    notifier.add_listener(changed.append)
+    notifier.notify('a')
+    self.assertEqual(changed, ['a'])